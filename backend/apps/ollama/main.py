@@ -18,7 +18,6 @@ from pydantic import BaseModel, ConfigDict
 import os
 import re
 import copy
-import random
 import requests
 import json
 import uuid
@@ -34,6 +33,15 @@ from starlette.background import BackgroundTask
 from apps.webui.models.models import Models
 from apps.webui.models.users import Users
 from constants import ERROR_MESSAGES
+from apps.ollama.routing import NodeRouter, NodeRequest, get_weight
+from utils.upstream import (
+    upstream_clients,
+    upstream_health,
+    upstream_reads,
+    upstream_streams,
+)
+from utils.catalog import model_catalog
+from utils.admission import upstream_admission, get_priority, Priority
 from utils.utils import (
     decode_token,
     get_current_user,
@@ -46,6 +54,9 @@ from utils.task import prompt_template
 from config import (
     SRC_LOG_LEVELS,
     OLLAMA_BASE_URLS,
+    OLLAMA_BASE_URL_WEIGHTS,
+    OLLAMA_ROUTING_MODE,
+    OLLAMA_RESIDENCY_POLL_INTERVAL,
     ENABLE_OLLAMA_API,
     AIOHTTP_CLIENT_TIMEOUT,
     ENABLE_MODEL_FILTER,
@@ -74,12 +85,10 @@ app.state.config.MODEL_FILTER_LIST = MODEL_FILTER_LIST
 
 app.state.config.ENABLE_OLLAMA_API = ENABLE_OLLAMA_API
 app.state.config.OLLAMA_BASE_URLS = OLLAMA_BASE_URLS
+app.state.config.OLLAMA_BASE_URL_WEIGHTS = OLLAMA_BASE_URL_WEIGHTS
+app.state.config.OLLAMA_ROUTING_MODE = OLLAMA_ROUTING_MODE
 app.state.MODELS = {}
-
-
-# TODO: Implement a more intelligent load balancing mechanism for distributing requests among multiple backend instances.
-# Current implementation uses a simple round-robin approach (random.choice). Consider incorporating algorithms like weighted round-robin,
-# least connections, or least response time for better resource utilization and performance optimization.
+app.state.ROUTER = NodeRouter()
 
 
 @app.middleware("http")
@@ -101,79 +110,263 @@ async def get_status():
 
 @app.get("/config")
 async def get_config(user=Depends(get_admin_user)):
-    return {"ENABLE_OLLAMA_API": app.state.config.ENABLE_OLLAMA_API}
+    return {
+        "ENABLE_OLLAMA_API": app.state.config.ENABLE_OLLAMA_API,
+        "OLLAMA_ROUTING_MODE": app.state.config.OLLAMA_ROUTING_MODE,
+    }
 
 
 class OllamaConfigForm(BaseModel):
     enable_ollama_api: Optional[bool] = None
+    routing_mode: Optional[str] = None
 
 
 @app.post("/config/update")
 async def update_config(form_data: OllamaConfigForm, user=Depends(get_admin_user)):
     app.state.config.ENABLE_OLLAMA_API = form_data.enable_ollama_api
-    return {"ENABLE_OLLAMA_API": app.state.config.ENABLE_OLLAMA_API}
+    model_catalog.invalidate()
+    if form_data.routing_mode is not None:
+        app.state.config.OLLAMA_ROUTING_MODE = form_data.routing_mode
+    return {
+        "ENABLE_OLLAMA_API": app.state.config.ENABLE_OLLAMA_API,
+        "OLLAMA_ROUTING_MODE": app.state.config.OLLAMA_ROUTING_MODE,
+    }
 
 
 @app.get("/urls")
 async def get_ollama_api_urls(user=Depends(get_admin_user)):
-    return {"OLLAMA_BASE_URLS": app.state.config.OLLAMA_BASE_URLS}
+    return {
+        "OLLAMA_BASE_URLS": app.state.config.OLLAMA_BASE_URLS,
+        "OLLAMA_BASE_URL_WEIGHTS": app.state.config.OLLAMA_BASE_URL_WEIGHTS,
+    }
 
 
 class UrlUpdateForm(BaseModel):
     urls: List[str]
+    weights: Optional[List[float]] = None
 
 
 @app.post("/urls/update")
 async def update_ollama_api_url(form_data: UrlUpdateForm, user=Depends(get_admin_user)):
     app.state.config.OLLAMA_BASE_URLS = form_data.urls
+    model_catalog.invalidate()
+
+    weights = (
+        form_data.weights
+        if form_data.weights is not None
+        else app.state.config.OLLAMA_BASE_URL_WEIGHTS
+    )
+    app.state.config.OLLAMA_BASE_URL_WEIGHTS = [
+        get_weight(weights, idx) for idx in range(len(form_data.urls))
+    ]
 
     log.info(f"app.state.config.OLLAMA_BASE_URLS: {app.state.config.OLLAMA_BASE_URLS}")
-    return {"OLLAMA_BASE_URLS": app.state.config.OLLAMA_BASE_URLS}
+    return {
+        "OLLAMA_BASE_URLS": app.state.config.OLLAMA_BASE_URLS,
+        "OLLAMA_BASE_URL_WEIGHTS": app.state.config.OLLAMA_BASE_URL_WEIGHTS,
+    }
+
+
+@app.get("/urls/stats")
+async def get_ollama_api_url_stats(user=Depends(get_admin_user)):
+    urls = app.state.config.OLLAMA_BASE_URLS
+    stats = app.state.ROUTER.get_stats(urls, app.state.config.OLLAMA_BASE_URL_WEIGHTS)
+    health = upstream_health.get_stats(urls)
+    return {url: {**stats[url], "health": health[url]} for url in urls}
+
+
+def select_url_idx(
+    model: str,
+    chat_id: Optional[str] = None,
+    loads_model: bool = True,
+    exclude: Optional[List[int]] = None,
+) -> int:
+    """
+    Pick a healthy node serving `model`, skipping the url indexes in `exclude`.
+    `loads_model` is False for requests that don't make Ollama load the model.
+    """
+    urls = app.state.config.OLLAMA_BASE_URLS
+    url_idxs = [
+        idx for idx in app.state.MODELS[model]["urls"] if idx not in (exclude or [])
+    ]
+    available = upstream_health.filter_available([urls[idx] for idx in url_idxs])
+    return app.state.ROUTER.select(
+        [idx for idx in url_idxs if urls[idx] in available],
+        app.state.config.OLLAMA_BASE_URLS,
+        app.state.config.OLLAMA_BASE_URL_WEIGHTS,
+        model=model,
+        chat_id=chat_id,
+        prefer_resident=loads_model
+        and app.state.config.OLLAMA_ROUTING_MODE == "residency",
+    )
+
+
+async def post_model_url(
+    model: str,
+    path: str,
+    payload: str,
+    stream: bool = True,
+    url_idx: Optional[int] = None,
+    chat_id: Optional[str] = None,
+    priority: Priority = Priority.INTERACTIVE,
+):
+    """
+    Post to a node serving `model`, or to `url_idx` if one was requested.
+
+    The request waits for a slot on the node in its `priority` lane first. A
+    routed request that fails before the node responds, or with a 5xx, is
+    retried on the next node that has the model. Once a response has started
+    streaming it is not retried.
+    """
+    if url_idx is not None:
+        url = app.state.config.OLLAMA_BASE_URLS[url_idx]
+        log.info(f"url: {url}")
+        ticket = await upstream_admission.acquire(url, model, priority)
+        return await ticket.hold(
+            post_streaming_url(f"{url}{path}", payload, stream, base_url=url)
+        )
+
+    tried = []
+    while True:
+        url_idx = select_url_idx(model, chat_id, exclude=tried)
+        url = app.state.config.OLLAMA_BASE_URLS[url_idx]
+        log.info(f"url: {url}")
+        ticket = await upstream_admission.acquire(url, model, priority)
+        try:
+            return await ticket.hold(
+                post_streaming_url(f"{url}{path}", payload, stream, base_url=url)
+            )
+        except HTTPException as e:
+            tried.append(url_idx)
+            if e.status_code < 500 or len(tried) >= len(
+                app.state.MODELS[model]["urls"]
+            ):
+                raise
+            log.warning(
+                f"{url} failed with {e.detail}, retrying {model} on another node"
+            )
+
+
+async def check_health():
+    if app.state.config.ENABLE_OLLAMA_API:
+        await asyncio.gather(
+            *[
+                upstream_health.probe(url, f"{url}/api/version")
+                for url in app.state.config.OLLAMA_BASE_URLS
+            ]
+        )
+
+
+async def update_resident_models():
+    urls = app.state.config.OLLAMA_BASE_URLS
+    responses = await asyncio.gather(*[fetch_url(f"{url}/api/ps") for url in urls])
+    for url, response in zip(urls, responses):
+        app.state.ROUTER.set_resident(
+            url,
+            (
+                [model["name"] for model in response.get("models", [])]
+                if response is not None
+                else None
+            ),
+        )
+
+
+async def poll_resident_models():
+    """Keep the router's view of loaded models current, runs for the app lifetime."""
+    while True:
+        if (
+            app.state.config.ENABLE_OLLAMA_API
+            and app.state.config.OLLAMA_ROUTING_MODE == "residency"
+        ):
+            try:
+                await update_resident_models()
+            except Exception as e:
+                log.error(f"Failed to poll loaded models: {e}")
+        await asyncio.sleep(max(OLLAMA_RESIDENCY_POLL_INTERVAL, 1))
 
 
 async def fetch_url(url):
-    timeout = aiohttp.ClientTimeout(total=5)
-    try:
-        async with aiohttp.ClientSession(timeout=timeout, trust_env=True) as session:
-            async with session.get(url) as response:
+    async def fetch():
+        timeout = aiohttp.ClientTimeout(total=5)
+        try:
+            session = await upstream_clients.get_session(url)
+            async with session.get(url, timeout=timeout) as response:
                 return await response.json()
-    except Exception as e:
-        # Handle connection error here
-        log.error(f"Connection error: {e}")
+        except Exception as e:
+            # Handle connection error here
+            log.error(f"Connection error: {e}")
+            return None
+
+    return await upstream_reads.do(url, fetch, label=url)
+
+
+async def fetch_node_url(base_url: str, path: str):
+    """Like `fetch_url`, but skips unhealthy nodes instead of waiting for them to time out."""
+    if not upstream_health.is_available(base_url):
         return None
+    response = await fetch_url(f"{base_url}{path}")
+    if response is None:
+        upstream_health.record_failure(base_url, f"GET {path} failed")
+    else:
+        upstream_health.record_success(base_url)
+    return response
 
 
 async def cleanup_response(
     response: Optional[aiohttp.ClientResponse],
-    session: Optional[aiohttp.ClientSession],
+    node_request: Optional[NodeRequest] = None,
+    error: bool = False,
+    changes_models: bool = False,
 ):
+    # Returns the connection to the pool, or drops it if the body was not fully read
     if response:
-        response.close()
-    if session:
-        await session.close()
-
-
-async def post_streaming_url(url: str, payload: str, stream: bool = True):
+        response.release()
+    if node_request:
+        node_request.finish(error=error)
+    if changes_models:
+        model_catalog.invalidate()
+
+
+async def post_streaming_url(
+    url: str,
+    payload: str,
+    stream: bool = True,
+    base_url: Optional[str] = None,
+    changes_models: bool = False,
+):
+    """
+    `base_url` is the node the request was routed to, for the load stats.
+    `changes_models` invalidates the model list once the request is done.
+    """
     r = None
+    node_request = app.state.ROUTER.start(base_url) if base_url else None
     try:
-        session = aiohttp.ClientSession(
-            trust_env=True, timeout=aiohttp.ClientTimeout(total=AIOHTTP_CLIENT_TIMEOUT)
+        session = await upstream_clients.get_session(url)
+        r = await session.post(
+            url,
+            data=payload,
+            timeout=aiohttp.ClientTimeout(total=AIOHTTP_CLIENT_TIMEOUT),
         )
-        r = await session.post(url, data=payload)
         r.raise_for_status()
+        if node_request:
+            node_request.first_byte()
+            upstream_health.record_success(base_url)
 
         if stream:
             return StreamingResponse(
-                r.content,
+                upstream_streams.open(r, base_url or upstream_clients.get_origin(url)),
                 status_code=r.status,
                 headers=dict(r.headers),
                 background=BackgroundTask(
-                    cleanup_response, response=r, session=session
+                    cleanup_response,
+                    response=r,
+                    node_request=node_request,
+                    changes_models=changes_models,
                 ),
             )
         else:
             res = await r.json()
-            await cleanup_response(r, session)
+            await cleanup_response(r, node_request, changes_models=changes_models)
             return res
 
     except Exception as e:
@@ -186,6 +379,9 @@ async def post_streaming_url(url: str, payload: str, stream: bool = True):
             except:
                 error_detail = f"Ollama: {e}"
 
+        if base_url and (r is None or r.status >= 500):
+            upstream_health.record_failure(base_url, error_detail)
+        await cleanup_response(r, node_request, error=True)
         raise HTTPException(
             status_code=r.status if r else 500,
             detail=error_detail,
@@ -200,8 +396,8 @@ def merge_models_lists(model_lists):
             for model in model_list:
                 digest = model["digest"]
                 if digest not in merged_models:
-                    model["urls"] = [idx]
-                    merged_models[digest] = model
+                    # Copied, the model lists from fetch_url are shared
+                    merged_models[digest] = {**model, "urls": [idx]}
                 else:
                     merged_models[digest]["urls"].append(idx)
 
@@ -212,10 +408,12 @@ async def get_all_models():
     log.info("get_all_models()")
 
     if app.state.config.ENABLE_OLLAMA_API:
-        tasks = [
-            fetch_url(f"{url}/api/tags") for url in app.state.config.OLLAMA_BASE_URLS
-        ]
-        responses = await asyncio.gather(*tasks)
+        responses = await asyncio.gather(
+            *[
+                fetch_node_url(url, "/api/tags")
+                for url in app.state.config.OLLAMA_BASE_URLS
+            ]
+        )
 
         models = {
             "models": merge_models_lists(
@@ -351,7 +549,9 @@ async def pull_model(
     # Admin should be able to pull models from any source
     payload = {**form_data.model_dump(exclude_none=True), "insecure": True}
 
-    return await post_streaming_url(f"{url}/api/pull", json.dumps(payload))
+    return await post_streaming_url(
+        f"{url}/api/pull", json.dumps(payload), changes_models=True
+    )
 
 
 class PushModelForm(BaseModel):
@@ -401,7 +601,9 @@ async def create_model(
     log.info(f"url: {url}")
 
     return await post_streaming_url(
-        f"{url}/api/create", form_data.model_dump_json(exclude_none=True).encode()
+        f"{url}/api/create",
+        form_data.model_dump_json(exclude_none=True).encode(),
+        changes_models=True,
     )
 
 
@@ -436,6 +638,7 @@ async def copy_model(
             data=form_data.model_dump_json(exclude_none=True).encode(),
         )
         r.raise_for_status()
+        model_catalog.invalidate()
 
         log.debug(f"r.text: {r.text}")
 
@@ -483,6 +686,7 @@ async def delete_model(
             data=form_data.model_dump_json(exclude_none=True).encode(),
         )
         r.raise_for_status()
+        model_catalog.invalidate()
 
         log.debug(f"r.text: {r.text}")
 
@@ -512,7 +716,7 @@ async def show_model_info(form_data: ModelNameForm, user=Depends(get_verified_us
             detail=ERROR_MESSAGES.MODEL_NOT_FOUND(form_data.name),
         )
 
-    url_idx = random.choice(app.state.MODELS[form_data.name]["urls"])
+    url_idx = select_url_idx(form_data.name, loads_model=False)
     url = app.state.config.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
@@ -563,7 +767,7 @@ async def generate_embeddings(
             model = f"{model}:latest"
 
         if model in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[model]["urls"])
+            url_idx = select_url_idx(model)
         else:
             raise HTTPException(
                 status_code=400,
@@ -573,6 +777,7 @@ async def generate_embeddings(
     url = app.state.config.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
+    node_request = app.state.ROUTER.start(url)
     try:
         r = requests.request(
             method="POST",
@@ -580,10 +785,13 @@ async def generate_embeddings(
             data=form_data.model_dump_json(exclude_none=True).encode(),
         )
         r.raise_for_status()
+        node_request.first_byte()
+        node_request.finish()
 
         return r.json()
     except Exception as e:
         log.exception(e)
+        node_request.finish(error=True)
         error_detail = "Open WebUI: Server Connection Error"
         if r is not None:
             try:
@@ -613,7 +821,7 @@ def generate_ollama_embeddings(
             model = f"{model}:latest"
 
         if model in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[model]["urls"])
+            url_idx = select_url_idx(model)
         else:
             raise HTTPException(
                 status_code=400,
@@ -623,6 +831,7 @@ def generate_ollama_embeddings(
     url = app.state.config.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
+    node_request = app.state.ROUTER.start(url)
     try:
         r = requests.request(
             method="POST",
@@ -630,6 +839,8 @@ def generate_ollama_embeddings(
             data=form_data.model_dump_json(exclude_none=True).encode(),
         )
         r.raise_for_status()
+        node_request.first_byte()
+        node_request.finish()
 
         data = r.json()
 
@@ -641,6 +852,7 @@ def generate_ollama_embeddings(
             raise "Something went wrong :/"
     except Exception as e:
         log.exception(e)
+        node_request.finish(error=True)
         error_detail = "Open WebUI: Server Connection Error"
         if r is not None:
             try:
@@ -681,19 +893,19 @@ async def generate_completion(
         if ":" not in model:
             model = f"{model}:latest"
 
-        if model in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[model]["urls"])
-        else:
+        if model not in app.state.MODELS:
             raise HTTPException(
                 status_code=400,
                 detail=ERROR_MESSAGES.MODEL_NOT_FOUND(form_data.model),
             )
+    else:
+        model = form_data.model
 
-    url = app.state.config.OLLAMA_BASE_URLS[url_idx]
-    log.info(f"url: {url}")
-
-    return await post_streaming_url(
-        f"{url}/api/generate", form_data.model_dump_json(exclude_none=True).encode()
+    return await post_model_url(
+        model,
+        "/api/generate",
+        form_data.model_dump_json(exclude_none=True).encode(),
+        url_idx=url_idx,
     )
 
 
@@ -711,6 +923,7 @@ class GenerateChatCompletionForm(BaseModel):
     template: Optional[str] = None
     stream: Optional[bool] = None
     keep_alive: Optional[Union[int, str]] = None
+    metadata: Optional[dict] = None
 
 
 @app.post("/api/chat")
@@ -904,19 +1117,23 @@ async def generate_chat_completion(
         if ":" not in payload["model"]:
             payload["model"] = f"{payload['model']}:latest"
 
-        if payload["model"] in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[payload["model"]]["urls"])
-        else:
+        if payload["model"] not in app.state.MODELS:
             raise HTTPException(
                 status_code=400,
                 detail=ERROR_MESSAGES.MODEL_NOT_FOUND(form_data.model),
             )
 
-    url = app.state.config.OLLAMA_BASE_URLS[url_idx]
-    log.info(f"url: {url}")
     log.debug(payload)
 
-    return await post_streaming_url(f"{url}/api/chat", json.dumps(payload))
+    metadata = form_data.metadata or {}
+    return await post_model_url(
+        payload["model"],
+        "/api/chat",
+        json.dumps(payload),
+        url_idx=url_idx,
+        chat_id=metadata.get("chat_id"),
+        priority=get_priority(metadata),
+    )
 
 
 # TODO: we should update this part once Ollama supports other types
@@ -946,6 +1163,8 @@ async def generate_openai_chat_completion(
     url_idx: Optional[int] = None,
     user=Depends(get_verified_user),
 ):
+    metadata = form_data.get("metadata") or {}
+    chat_id = metadata.get("chat_id")
     form_data = OpenAIChatCompletionForm(**form_data)
     payload = {**form_data.model_dump(exclude_none=True, exclude=["metadata"])}
 
@@ -1014,21 +1233,20 @@ async def generate_openai_chat_completion(
         if ":" not in payload["model"]:
             payload["model"] = f"{payload['model']}:latest"
 
-        if payload["model"] in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[payload["model"]]["urls"])
-        else:
+        if payload["model"] not in app.state.MODELS:
             raise HTTPException(
                 status_code=400,
                 detail=ERROR_MESSAGES.MODEL_NOT_FOUND(form_data.model),
             )
 
-    url = app.state.config.OLLAMA_BASE_URLS[url_idx]
-    log.info(f"url: {url}")
-
-    return await post_streaming_url(
-        f"{url}/v1/chat/completions",
+    return await post_model_url(
+        payload["model"],
+        "/v1/chat/completions",
         json.dumps(payload),
         stream=payload.get("stream", False),
+        url_idx=url_idx,
+        chat_id=chat_id,
+        priority=get_priority(metadata),
     )
 
 
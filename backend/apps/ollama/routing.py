@@ -0,0 +1,199 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+# Weight of the newest sample in the latency moving averages
+LATENCY_EWMA_ALPHA = 0.2
+
+# In residency mode a warm or sticky node is preferred as long as its score is
+# within this factor of the best node, a model load costs more than a short queue
+WARM_MAX_LOAD_RATIO = 4.0
+
+# Number of chats remembered for sticky routing
+STICKY_CHATS_MAX = 10000
+
+
+class NodeStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        # Time until the response headers arrive, i.e. queueing and model load
+        self.ttfb: Optional[float] = None
+        # Time until the response body has been consumed
+        self.duration: Optional[float] = None
+
+    def observe(self, attr: str, seconds: float):
+        previous = getattr(self, attr)
+        setattr(
+            self,
+            attr,
+            (
+                seconds
+                if previous is None
+                else previous + LATENCY_EWMA_ALPHA * (seconds - previous)
+            ),
+        )
+
+
+class NodeRequest:
+    """Tracks one upstream request from `NodeRouter.start` until `finish`."""
+
+    def __init__(self, router: "NodeRouter", url: str):
+        self.router = router
+        self.url = url
+        self.started = time.perf_counter()
+        self.finished = False
+
+    def first_byte(self):
+        self.router.observe(self.url, "ttfb", time.perf_counter() - self.started)
+
+    def finish(self, error: bool = False):
+        if not self.finished:
+            self.finished = True
+            self.router.finish(self, error)
+
+
+class NodeRouter:
+    """
+    Picks the least loaded Ollama node serving a model.
+
+    Each node is scored by its in-flight requests times its recent time to first
+    byte, divided by its weight. Nodes without samples yet are assumed to be as
+    fast as the average node, so they get traffic without being flooded.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nodes: Dict[str, NodeStats] = {}
+        # Models loaded on each node, as last reported by /api/ps
+        self.resident: Dict[str, Set[str]] = {}
+        # chat_id -> url of the node that served the chat last
+        self.sticky: OrderedDict = OrderedDict()
+
+    def get_node(self, url: str) -> NodeStats:
+        if url not in self.nodes:
+            self.nodes[url] = NodeStats()
+        return self.nodes[url]
+
+    def score(self, url: str, weight: float, default_ttfb: float) -> float:
+        node = self.get_node(url)
+        ttfb = node.ttfb if node.ttfb is not None else default_ttfb
+        return (node.in_flight + 1) * ttfb / max(weight, 1e-6)
+
+    def default_ttfb(self) -> float:
+        samples = [node.ttfb for node in self.nodes.values() if node.ttfb is not None]
+        return sum(samples) / len(samples) if samples else 1.0
+
+    def select(
+        self,
+        url_idxs: List[int],
+        urls: List[str],
+        weights: List[float],
+        model: Optional[str] = None,
+        chat_id: Optional[str] = None,
+        prefer_resident: bool = False,
+    ) -> int:
+        """
+        Return the index in `urls` of the best node among `url_idxs`.
+
+        With `prefer_resident` the node that served `chat_id` last is kept, so
+        the chat can reuse its KV cache, then nodes that already have `model`
+        loaded are preferred. Both only while they are not much busier than the
+        least loaded node.
+        """
+        with self.lock:
+            default_ttfb = self.default_ttfb()
+            scores = {
+                idx: self.score(urls[idx], get_weight(weights, idx), default_ttfb)
+                for idx in url_idxs
+            }
+            best = min(scores.values())
+
+            if not prefer_resident:
+                return pick_lowest(scores)
+
+            sticky_url = self.sticky.get(chat_id) if chat_id else None
+            sticky = [idx for idx in scores if urls[idx] == sticky_url]
+            warm = {
+                idx: score
+                for idx, score in scores.items()
+                if model in self.resident.get(urls[idx], ())
+            }
+
+            if sticky and scores[sticky[0]] <= best * WARM_MAX_LOAD_RATIO:
+                idx = sticky[0]
+            elif warm and min(warm.values()) <= best * WARM_MAX_LOAD_RATIO:
+                idx = pick_lowest(warm)
+            else:
+                idx = pick_lowest(scores)
+
+            # Ollama loads the model on the chosen node, assume it is resident
+            # until the next poll says otherwise
+            self.resident.setdefault(urls[idx], set()).add(model)
+            if chat_id:
+                self.sticky[chat_id] = urls[idx]
+                self.sticky.move_to_end(chat_id)
+                while len(self.sticky) > STICKY_CHATS_MAX:
+                    self.sticky.popitem(last=False)
+            return idx
+
+    def set_resident(self, url: str, models: Optional[Iterable[str]]):
+        """Record the models loaded on a node, `None` if the node could not be polled."""
+        with self.lock:
+            if models is None:
+                self.resident.pop(url, None)
+            else:
+                self.resident[url] = set(models)
+
+    def start(self, url: str) -> NodeRequest:
+        with self.lock:
+            node = self.get_node(url)
+            node.in_flight += 1
+            node.requests += 1
+        return NodeRequest(self, url)
+
+    def observe(self, url: str, attr: str, seconds: float):
+        with self.lock:
+            self.get_node(url).observe(attr, seconds)
+
+    def finish(self, request: NodeRequest, error: bool):
+        with self.lock:
+            node = self.get_node(request.url)
+            node.in_flight -= 1
+            if error:
+                node.errors += 1
+            else:
+                node.observe("duration", time.perf_counter() - request.started)
+
+    def get_stats(self, urls: List[str], weights: List[float]) -> dict:
+        with self.lock:
+            default_ttfb = self.default_ttfb()
+            stats = {}
+            for idx, url in enumerate(urls):
+                node = self.get_node(url)
+                weight = get_weight(weights, idx)
+                stats[url] = {
+                    "weight": weight,
+                    "in_flight": node.in_flight,
+                    "requests": node.requests,
+                    "errors": node.errors,
+                    "ttfb": round(node.ttfb, 4) if node.ttfb is not None else None,
+                    "duration": (
+                        round(node.duration, 4) if node.duration is not None else None
+                    ),
+                    "score": round(self.score(url, weight, default_ttfb), 4),
+                    "resident": sorted(self.resident.get(url, [])),
+                }
+            return stats
+
+
+def get_weight(weights: List[float], idx: int) -> float:
+    return float(weights[idx]) if idx < len(weights) else 1.0
+
+
+def pick_lowest(scores: Dict[int, float]) -> int:
+    best = min(scores.values())
+    return random.choice([idx for idx, score in scores.items() if score == best])
@@ -14,6 +14,14 @@ from starlette.background import BackgroundTask
 from apps.webui.models.models import Models
 from apps.webui.models.users import Users
 from constants import ERROR_MESSAGES
+from utils.upstream import (
+    upstream_clients,
+    upstream_health,
+    upstream_reads,
+    upstream_streams,
+)
+from utils.catalog import model_catalog
+from utils.admission import upstream_admission, get_priority
 from utils.utils import (
     decode_token,
     get_verified_user,
@@ -63,6 +71,8 @@ app.state.config.OPENAI_API_BASE_URLS = OPENAI_API_BASE_URLS
 app.state.config.OPENAI_API_KEYS = OPENAI_API_KEYS
 
 app.state.MODELS = {}
+# Model id -> indexes of every url that lists it, for failover
+app.state.MODEL_URL_IDXS = {}
 
 
 @app.middleware("http")
@@ -88,6 +98,7 @@ class OpenAIConfigForm(BaseModel):
 @app.post("/config/update")
 async def update_config(form_data: OpenAIConfigForm, user=Depends(get_admin_user)):
     app.state.config.ENABLE_OPENAI_API = form_data.enable_openai_api
+    model_catalog.invalidate()
     return {"ENABLE_OPENAI_API": app.state.config.ENABLE_OPENAI_API}
 
 
@@ -108,9 +119,17 @@ async def get_openai_urls(user=Depends(get_admin_user)):
 async def update_openai_urls(form_data: UrlsUpdateForm, user=Depends(get_admin_user)):
     await get_all_models()
     app.state.config.OPENAI_API_BASE_URLS = form_data.urls
+    model_catalog.invalidate()
     return {"OPENAI_API_BASE_URLS": app.state.config.OPENAI_API_BASE_URLS}
 
 
+@app.get("/urls/stats")
+async def get_openai_url_stats(user=Depends(get_admin_user)):
+    urls = app.state.config.OPENAI_API_BASE_URLS
+    health = upstream_health.get_stats(urls)
+    return {url: {"health": health[url]} for url in urls}
+
+
 @app.get("/keys")
 async def get_openai_keys(user=Depends(get_admin_user)):
     return {"OPENAI_API_KEYS": app.state.config.OPENAI_API_KEYS}
@@ -119,6 +138,7 @@ async def get_openai_keys(user=Depends(get_admin_user)):
 @app.post("/keys/update")
 async def update_openai_key(form_data: KeysUpdateForm, user=Depends(get_admin_user)):
     app.state.config.OPENAI_API_KEYS = form_data.keys
+    model_catalog.invalidate()
     return {"OPENAI_API_KEYS": app.state.config.OPENAI_API_KEYS}
 
 
@@ -187,26 +207,57 @@ async def speech(request: Request, user=Depends(get_verified_user)):
 
 
 async def fetch_url(url, key):
-    timeout = aiohttp.ClientTimeout(total=5)
-    try:
-        headers = {"Authorization": f"Bearer {key}"}
-        async with aiohttp.ClientSession(timeout=timeout, trust_env=True) as session:
-            async with session.get(url, headers=headers) as response:
+    async def fetch():
+        timeout = aiohttp.ClientTimeout(total=5)
+        try:
+            headers = {"Authorization": f"Bearer {key}"}
+            session = await upstream_clients.get_session(url)
+            async with session.get(url, headers=headers, timeout=timeout) as response:
                 return await response.json()
-    except Exception as e:
-        # Handle connection error here
-        log.error(f"Connection error: {e}")
+        except Exception as e:
+            # Handle connection error here
+            log.error(f"Connection error: {e}")
+            return None
+
+    return await upstream_reads.do((url, key), fetch, label=url)
+
+
+async def fetch_node_url(idx: int, path: str):
+    """Like `fetch_url`, but skips unhealthy urls instead of waiting for them to time out."""
+    base_url = app.state.config.OPENAI_API_BASE_URLS[idx]
+    if not upstream_health.is_available(base_url):
         return None
+    response = await fetch_url(
+        f"{base_url}{path}", app.state.config.OPENAI_API_KEYS[idx]
+    )
+    if response is None:
+        upstream_health.record_failure(base_url, f"GET {path} failed")
+    else:
+        upstream_health.record_success(base_url)
+    return response
 
 
-async def cleanup_response(
-    response: Optional[aiohttp.ClientResponse],
-    session: Optional[aiohttp.ClientSession],
-):
+async def check_health():
+    if app.state.config.ENABLE_OPENAI_API:
+        await asyncio.gather(
+            *[
+                upstream_health.probe(
+                    url,
+                    f"{url}/models",
+                    {
+                        "Authorization": f"Bearer {app.state.config.OPENAI_API_KEYS[idx]}"
+                    },
+                )
+                for idx, url in enumerate(app.state.config.OPENAI_API_BASE_URLS)
+                if idx < len(app.state.config.OPENAI_API_KEYS)
+            ]
+        )
+
+
+async def cleanup_response(response: Optional[aiohttp.ClientResponse]):
+    # Returns the connection to the pool, or drops it if the body was not fully read
     if response:
-        response.close()
-    if session:
-        await session.close()
+        response.release()
 
 
 def merge_models_lists(model_lists):
@@ -265,8 +316,8 @@ async def get_all_models(raw: bool = False):
                 ]
 
         tasks = [
-            fetch_url(f"{url}/models", app.state.config.OPENAI_API_KEYS[idx])
-            for idx, url in enumerate(app.state.config.OPENAI_API_BASE_URLS)
+            fetch_node_url(idx, "/models")
+            for idx in range(len(app.state.config.OPENAI_API_BASE_URLS))
         ]
 
         responses = await asyncio.gather(*tasks)
@@ -292,6 +343,9 @@ async def get_all_models(raw: bool = False):
 
         log.debug(f"models: {models}")
         app.state.MODELS = {model["id"]: model for model in models["data"]}
+        app.state.MODEL_URL_IDXS = {}
+        for model in models["data"]:
+            app.state.MODEL_URL_IDXS.setdefault(model["id"], []).append(model["urlIdx"])
 
     return models
 
@@ -453,6 +507,36 @@ async def generate_chat_completion(
 
     log.debug(payload)
 
+    # Fail over to other urls serving the same model, healthy ones first
+    idxs = [idx] + [
+        other for other in app.state.MODEL_URL_IDXS.get(model["id"], []) if other != idx
+    ]
+    available = upstream_health.filter_available(
+        [app.state.config.OPENAI_API_BASE_URLS[idx] for idx in idxs]
+    )
+    idxs.sort(
+        key=lambda idx: app.state.config.OPENAI_API_BASE_URLS[idx] not in available
+    )
+
+    priority = get_priority(form_data.get("metadata"))
+    for attempt, idx in enumerate(idxs):
+        # Waiting for a slot is not retried, the other urls are likely as busy
+        ticket = await upstream_admission.acquire(
+            app.state.config.OPENAI_API_BASE_URLS[idx], model["id"], priority
+        )
+        try:
+            return await ticket.hold(post_chat_completion(idx, payload))
+        except HTTPException as e:
+            if e.status_code < 500 or attempt == len(idxs) - 1:
+                raise
+            log.warning(f"{e.detail}, retrying {model['id']} on another url")
+
+
+async def post_chat_completion(idx: int, payload: str):
+    """
+    Post a chat completion to url `idx`. Failures before the upstream responds,
+    or with a 5xx, are raised as HTTPException with status 500 or the 5xx.
+    """
     url = app.state.config.OPENAI_API_BASE_URLS[idx]
     key = app.state.config.OPENAI_API_KEYS[idx]
 
@@ -461,32 +545,29 @@ async def generate_chat_completion(
     headers["Content-Type"] = "application/json"
 
     r = None
-    session = None
     streaming = False
 
     try:
-        session = aiohttp.ClientSession(
-            trust_env=True, timeout=aiohttp.ClientTimeout(total=AIOHTTP_CLIENT_TIMEOUT)
-        )
+        session = await upstream_clients.get_session(url)
         r = await session.request(
             method="POST",
             url=f"{url}/chat/completions",
             data=payload,
             headers=headers,
+            timeout=aiohttp.ClientTimeout(total=AIOHTTP_CLIENT_TIMEOUT),
         )
 
         r.raise_for_status()
+        upstream_health.record_success(url)
 
         # Check if response is SSE
         if "text/event-stream" in r.headers.get("Content-Type", ""):
             streaming = True
             return StreamingResponse(
-                r.content,
+                upstream_streams.open(r, url),
                 status_code=r.status,
                 headers=dict(r.headers),
-                background=BackgroundTask(
-                    cleanup_response, response=r, session=session
-                ),
+                background=BackgroundTask(cleanup_response, response=r),
             )
         else:
             response_data = await r.json()
@@ -502,12 +583,12 @@ async def generate_chat_completion(
                     error_detail = f"External: {res['error']['message'] if 'message' in res['error'] else res['error']}"
             except:
                 error_detail = f"External: {e}"
+        if r is None or r.status >= 500:
+            upstream_health.record_failure(url, error_detail)
         raise HTTPException(status_code=r.status if r else 500, detail=error_detail)
     finally:
-        if not streaming and session:
-            if r:
-                r.close()
-            await session.close()
+        if not streaming:
+            await cleanup_response(r)
 
 
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
@@ -526,11 +607,10 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
     headers["Content-Type"] = "application/json"
 
     r = None
-    session = None
     streaming = False
 
     try:
-        session = aiohttp.ClientSession(trust_env=True)
+        session = await upstream_clients.get_session(target_url)
         r = await session.request(
             method=request.method,
             url=target_url,
@@ -544,12 +624,10 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
         if "text/event-stream" in r.headers.get("Content-Type", ""):
             streaming = True
             return StreamingResponse(
-                r.content,
+                upstream_streams.open(r, url),
                 status_code=r.status,
                 headers=dict(r.headers),
-                background=BackgroundTask(
-                    cleanup_response, response=r, session=session
-                ),
+                background=BackgroundTask(cleanup_response, response=r),
             )
         else:
             response_data = await r.json()
@@ -567,7 +645,5 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
                 error_detail = f"External: {e}"
         raise HTTPException(status_code=r.status if r else 500, detail=error_detail)
     finally:
-        if not streaming and session:
-            if r:
-                r.close()
-            await session.close()
+        if not streaming:
+            await cleanup_response(r)
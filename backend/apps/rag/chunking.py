@@ -0,0 +1,191 @@
+import logging
+import threading
+from functools import lru_cache
+from typing import Callable, Iterable, List, Optional
+
+from langchain_core.documents import Document
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+# Encoding used when the embedding model does not ship its own tokenizer
+DEFAULT_TIKTOKEN_ENCODING = "cl100k_base"
+
+# Context limit of the OpenAI embedding models
+OPENAI_EMBEDDING_MAX_TOKENS = 8191
+
+# Rank of the boundary in front of a token, higher is a better place to cut
+PARAGRAPH, LINE, WORD, NONE = 3, 2, 1, 0
+
+
+@lru_cache(maxsize=8)
+def get_tiktoken_encoding(model: Optional[str] = None):
+    import tiktoken
+
+    if model:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            pass
+    return tiktoken.get_encoding(DEFAULT_TIKTOKEN_ENCODING)
+
+
+def tiktoken_offsets(encoding) -> Callable[[str], List[int]]:
+    def offsets(text: str) -> List[int]:
+        _, starts = encoding.decode_with_offsets(encoding.encode_ordinary(text))
+        return starts
+
+    return offsets
+
+
+def hf_offsets(tokenizer) -> Callable[[str], List[int]]:
+    # Fast tokenizers raise "Already borrowed" when used from several threads
+    lock = threading.Lock()
+
+    def offsets(text: str) -> List[int]:
+        with lock:
+            encoded = tokenizer(
+                text,
+                add_special_tokens=False,
+                return_offsets_mapping=True,
+                return_attention_mask=False,
+                verbose=False,
+            )
+        return [start for start, _ in encoded["offset_mapping"]]
+
+    return offsets
+
+
+class TokenChunker:
+    """
+    Splits text into chunks of at most `chunk_size` tokens of the embedding model.
+
+    The text is tokenized once and chunk boundaries are picked from the token
+    start offsets, preferring paragraph, line and word breaks in the second half
+    of each window. Every chunk is a single slice of the source text, so the
+    `start_index` metadata is exact and no substring searches are needed.
+    """
+
+    def __init__(
+        self,
+        token_offsets: Callable[[str], List[int]],
+        chunk_size: int,
+        chunk_overlap: int = 0,
+    ):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        self.token_offsets = token_offsets
+        self.chunk_size = chunk_size
+        self.chunk_overlap = max(0, min(chunk_overlap, chunk_size // 2))
+
+    def split_text_with_offsets(self, text: str) -> List[tuple]:
+        starts = self.token_offsets(text)
+        n = len(starts)
+        if n == 0:
+            return []
+
+        # Tokenizers either attach whitespace to the following token or drop
+        # it, so look at the characters on both sides of each token start
+        length = len(text)
+        ranks = [NONE] * n
+        for i in range(1, n):
+            pos = starts[i]
+            prev = text[pos - 1] if pos > 0 else ""
+            char = text[pos]
+            if prev == "\n" or char == "\n":
+                if (
+                    prev == "\n"
+                    and (char == "\n" or (pos > 1 and text[pos - 2] == "\n"))
+                ) or (char == "\n" and pos + 1 < length and text[pos + 1] == "\n"):
+                    ranks[i] = PARAGRAPH
+                else:
+                    ranks[i] = LINE
+            elif prev.isspace() or char.isspace():
+                ranks[i] = WORD
+
+        chunks = []
+        first = 0
+        while first < n:
+            last = min(first + self.chunk_size, n)
+            if last < n:
+                # Cut in front of the best boundary in the second half of the window
+                best, best_rank = last, NONE
+                for i in range(last, first + self.chunk_size // 2, -1):
+                    if ranks[i] > best_rank:
+                        best, best_rank = i, ranks[i]
+                        if best_rank == PARAGRAPH:
+                            break
+                last = best
+
+            start = starts[first]
+            chunk = text[start : starts[last] if last < n else len(text)]
+            stripped = chunk.lstrip()
+            if stripped:
+                chunks.append((stripped.rstrip(), start + len(chunk) - len(stripped)))
+
+            if last == n:
+                break
+            first = max(first + 1, last - self.chunk_overlap)
+
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk for chunk, _ in self.split_text_with_offsets(text)]
+
+    def create_documents(
+        self, texts: Iterable[str], metadatas: Optional[List[dict]] = None
+    ) -> List[Document]:
+        docs = []
+        for i, text in enumerate(texts):
+            metadata = metadatas[i] if metadatas else {}
+            for chunk, start in self.split_text_with_offsets(text):
+                docs.append(
+                    Document(
+                        page_content=chunk,
+                        metadata={**metadata, "start_index": start},
+                    )
+                )
+        return docs
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        documents = list(documents)
+        return self.create_documents(
+            [doc.page_content for doc in documents],
+            [doc.metadata for doc in documents],
+        )
+
+
+def get_token_chunker(
+    engine: str,
+    model: str,
+    sentence_transformer_ef,
+    chunk_size: int,
+    chunk_overlap: int,
+) -> TokenChunker:
+    """
+    Build a TokenChunker for the embedding model, capping `chunk_size` at the
+    model's input limit so chunks are never truncated when embedded.
+    """
+    limit = None
+    if engine == "" and sentence_transformer_ef is not None:
+        tokenizer = sentence_transformer_ef.tokenizer
+        limit = sentence_transformer_ef.max_seq_length
+        if getattr(tokenizer, "is_fast", False):
+            offsets = hf_offsets(tokenizer)
+            limit -= tokenizer.num_special_tokens_to_add()
+        else:
+            # Slow tokenizers can't report offsets, approximate with tiktoken
+            offsets = tiktoken_offsets(get_tiktoken_encoding())
+    elif engine == "openai":
+        offsets = tiktoken_offsets(get_tiktoken_encoding(model))
+        limit = OPENAI_EMBEDDING_MAX_TOKENS
+    else:
+        offsets = tiktoken_offsets(get_tiktoken_encoding())
+
+    if limit is not None and chunk_size > limit:
+        log.info(f"chunk size {chunk_size} exceeds the {model} limit, using {limit}")
+        chunk_size = limit
+
+    return TokenChunker(offsets, chunk_size, chunk_overlap)
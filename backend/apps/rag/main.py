@@ -9,7 +9,8 @@ from fastapi import (
 )
 from fastapi.middleware.cors import CORSMiddleware
 import requests
-import os, shutil, logging, re
+import os, shutil, logging, re, time, threading, queue
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from pathlib import Path
@@ -69,6 +70,8 @@ from apps.rag.utils import (
 from apps.rag.search.brave import search_brave
 from apps.rag.search.google_pse import search_google_pse
 from apps.rag.search.main import SearchResult
+from apps.rag.chunking import get_token_chunker
+from apps.rag.search.hedged import search_hedged, SearchEngineLatencies
 from apps.rag.search.searxng import search_searxng
 from apps.rag.search.serper import search_serper
 from apps.rag.search.serpstack import search_serpstack
@@ -111,6 +114,7 @@ from config import (
     CHROMA_CLIENT,
     CHUNK_SIZE,
     CHUNK_OVERLAP,
+    RAG_TEXT_SPLITTER,
     RAG_TEMPLATE,
     ENABLE_RAG_LOCAL_WEB_FETCH,
     YOUTUBE_LOADER_LANGUAGE,
@@ -128,6 +132,10 @@ from config import (
     TAVILY_API_KEY,
     RAG_WEB_SEARCH_RESULT_COUNT,
     RAG_WEB_SEARCH_CONCURRENT_REQUESTS,
+    RAG_WEB_SEARCH_CACHE_TTL,
+    RAG_WEB_SEARCH_ENGINES,
+    RAG_WEB_SEARCH_HEDGE_DELAY,
+    RAG_WEB_SEARCH_MIN_INDEXED_PAGES,
     RAG_EMBEDDING_OPENAI_BATCH_SIZE,
 )
 
@@ -153,6 +161,7 @@ app.state.config.TIKA_SERVER_URL = TIKA_SERVER_URL
 
 app.state.config.CHUNK_SIZE = CHUNK_SIZE
 app.state.config.CHUNK_OVERLAP = CHUNK_OVERLAP
+app.state.config.RAG_TEXT_SPLITTER = RAG_TEXT_SPLITTER
 
 app.state.config.RAG_EMBEDDING_ENGINE = RAG_EMBEDDING_ENGINE
 app.state.config.RAG_EMBEDDING_MODEL = RAG_EMBEDDING_MODEL
@@ -186,6 +195,12 @@ app.state.config.SERPLY_API_KEY = SERPLY_API_KEY
 app.state.config.TAVILY_API_KEY = TAVILY_API_KEY
 app.state.config.RAG_WEB_SEARCH_RESULT_COUNT = RAG_WEB_SEARCH_RESULT_COUNT
 app.state.config.RAG_WEB_SEARCH_CONCURRENT_REQUESTS = RAG_WEB_SEARCH_CONCURRENT_REQUESTS
+app.state.config.RAG_WEB_SEARCH_CACHE_TTL = RAG_WEB_SEARCH_CACHE_TTL
+app.state.config.RAG_WEB_SEARCH_ENGINES = RAG_WEB_SEARCH_ENGINES
+app.state.config.RAG_WEB_SEARCH_HEDGE_DELAY = RAG_WEB_SEARCH_HEDGE_DELAY
+app.state.config.RAG_WEB_SEARCH_MIN_INDEXED_PAGES = RAG_WEB_SEARCH_MIN_INDEXED_PAGES
+
+app.state.WEB_SEARCH_LATENCIES = SearchEngineLatencies()
 
 
 def update_embedding_model(
@@ -270,6 +285,7 @@ async def get_status():
         "status": True,
         "chunk_size": app.state.config.CHUNK_SIZE,
         "chunk_overlap": app.state.config.CHUNK_OVERLAP,
+        "text_splitter": app.state.config.RAG_TEXT_SPLITTER,
         "template": app.state.config.RAG_TEMPLATE,
         "embedding_engine": app.state.config.RAG_EMBEDDING_ENGINE,
         "embedding_model": app.state.config.RAG_EMBEDDING_MODEL,
@@ -402,6 +418,7 @@ async def get_rag_config(user=Depends(get_admin_user)):
         "chunk": {
             "chunk_size": app.state.config.CHUNK_SIZE,
             "chunk_overlap": app.state.config.CHUNK_OVERLAP,
+            "text_splitter": app.state.config.RAG_TEXT_SPLITTER,
         },
         "youtube": {
             "language": app.state.config.YOUTUBE_LOADER_LANGUAGE,
@@ -423,6 +440,10 @@ async def get_rag_config(user=Depends(get_admin_user)):
                 "tavily_api_key": app.state.config.TAVILY_API_KEY,
                 "result_count": app.state.config.RAG_WEB_SEARCH_RESULT_COUNT,
                 "concurrent_requests": app.state.config.RAG_WEB_SEARCH_CONCURRENT_REQUESTS,
+                "cache_ttl": app.state.config.RAG_WEB_SEARCH_CACHE_TTL,
+                "engines": app.state.config.RAG_WEB_SEARCH_ENGINES,
+                "hedge_delay": app.state.config.RAG_WEB_SEARCH_HEDGE_DELAY,
+                "min_indexed_pages": app.state.config.RAG_WEB_SEARCH_MIN_INDEXED_PAGES,
             },
         },
     }
@@ -436,6 +457,7 @@ class ContentExtractionConfig(BaseModel):
 class ChunkParamUpdateForm(BaseModel):
     chunk_size: int
     chunk_overlap: int
+    text_splitter: Optional[str] = None
 
 
 class YoutubeLoaderConfig(BaseModel):
@@ -457,6 +479,10 @@ class WebSearchConfig(BaseModel):
     tavily_api_key: Optional[str] = None
     result_count: Optional[int] = None
     concurrent_requests: Optional[int] = None
+    cache_ttl: Optional[int] = None
+    engines: Optional[List[str]] = None
+    hedge_delay: Optional[float] = None
+    min_indexed_pages: Optional[int] = None
 
 
 class WebConfig(BaseModel):
@@ -488,6 +514,8 @@ async def update_rag_config(form_data: ConfigUpdateForm, user=Depends(get_admin_
     if form_data.chunk is not None:
         app.state.config.CHUNK_SIZE = form_data.chunk.chunk_size
         app.state.config.CHUNK_OVERLAP = form_data.chunk.chunk_overlap
+        if form_data.chunk.text_splitter is not None:
+            app.state.config.RAG_TEXT_SPLITTER = form_data.chunk.text_splitter
 
     if form_data.youtube is not None:
         app.state.config.YOUTUBE_LOADER_LANGUAGE = form_data.youtube.language
@@ -517,6 +545,18 @@ async def update_rag_config(form_data: ConfigUpdateForm, user=Depends(get_admin_
         app.state.config.RAG_WEB_SEARCH_CONCURRENT_REQUESTS = (
             form_data.web.search.concurrent_requests
         )
+        if form_data.web.search.cache_ttl is not None:
+            app.state.config.RAG_WEB_SEARCH_CACHE_TTL = form_data.web.search.cache_ttl
+        if form_data.web.search.engines is not None:
+            app.state.config.RAG_WEB_SEARCH_ENGINES = form_data.web.search.engines
+        if form_data.web.search.hedge_delay is not None:
+            app.state.config.RAG_WEB_SEARCH_HEDGE_DELAY = (
+                form_data.web.search.hedge_delay
+            )
+        if form_data.web.search.min_indexed_pages is not None:
+            app.state.config.RAG_WEB_SEARCH_MIN_INDEXED_PAGES = (
+                form_data.web.search.min_indexed_pages
+            )
 
     return {
         "status": True,
@@ -528,6 +568,7 @@ async def update_rag_config(form_data: ConfigUpdateForm, user=Depends(get_admin_
         "chunk": {
             "chunk_size": app.state.config.CHUNK_SIZE,
             "chunk_overlap": app.state.config.CHUNK_OVERLAP,
+            "text_splitter": app.state.config.RAG_TEXT_SPLITTER,
         },
         "youtube": {
             "language": app.state.config.YOUTUBE_LOADER_LANGUAGE,
@@ -549,6 +590,10 @@ async def update_rag_config(form_data: ConfigUpdateForm, user=Depends(get_admin_
                 "tavily_api_key": app.state.config.TAVILY_API_KEY,
                 "result_count": app.state.config.RAG_WEB_SEARCH_RESULT_COUNT,
                 "concurrent_requests": app.state.config.RAG_WEB_SEARCH_CONCURRENT_REQUESTS,
+                "cache_ttl": app.state.config.RAG_WEB_SEARCH_CACHE_TTL,
+                "engines": app.state.config.RAG_WEB_SEARCH_ENGINES,
+                "hedge_delay": app.state.config.RAG_WEB_SEARCH_HEDGE_DELAY,
+                "min_indexed_pages": app.state.config.RAG_WEB_SEARCH_MIN_INDEXED_PAGES,
             },
         },
     }
@@ -889,15 +934,60 @@ def search_web(engine: str, query: str) -> list[SearchResult]:
         raise Exception("No search engine API key found in environment variables")
 
 
+def search_web_hedged(engines: List[str], query: str) -> list[SearchResult]:
+    """Search the web with several engines at once, see `search_hedged`.
+
+    Args:
+        engines (List[str]): The engines to query, in order of preference
+        query (str): The query to search for
+    """
+    return search_hedged(
+        {
+            engine: (lambda engine=engine: search_web(engine, query))
+            for engine in engines
+        },
+        count=app.state.config.RAG_WEB_SEARCH_RESULT_COUNT,
+        hedge_delay=app.state.config.RAG_WEB_SEARCH_HEDGE_DELAY,
+        latencies=app.state.WEB_SEARCH_LATENCIES,
+    )
+
+
+@app.get("/web/search/stats")
+async def get_web_search_stats(user=Depends(get_admin_user)):
+    return {
+        "status": True,
+        "engines": app.state.WEB_SEARCH_LATENCIES.get_stats(),
+    }
+
+
 @app.post("/web/search")
 def store_web_search(form_data: SearchForm, user=Depends(get_verified_user)):
+    collection_name = form_data.collection_name
+    if collection_name == "":
+        collection_name = calculate_sha256_string(form_data.query)[:63]
+
+    # The same query was searched recently, reuse the collection as is
+    sources = get_fresh_web_collection_sources(collection_name, form_data.query)
+    if sources is not None:
+        log.info(f"reusing fresh web search collection {collection_name}")
+        return {
+            "status": True,
+            "collection_name": collection_name,
+            "filenames": sources,
+        }
+
     try:
         logging.info(
             f"trying to web search with {app.state.config.RAG_WEB_SEARCH_ENGINE, form_data.query}"
         )
-        web_results = search_web(
-            app.state.config.RAG_WEB_SEARCH_ENGINE, form_data.query
-        )
+        if app.state.config.RAG_WEB_SEARCH_ENGINES:
+            web_results = search_web_hedged(
+                app.state.config.RAG_WEB_SEARCH_ENGINES, form_data.query
+            )
+        else:
+            web_results = search_web(
+                app.state.config.RAG_WEB_SEARCH_ENGINE, form_data.query
+            )
     except Exception as e:
         log.exception(e)
 
@@ -909,14 +999,7 @@ def store_web_search(form_data: SearchForm, user=Depends(get_verified_user)):
 
     try:
         urls = [result.link for result in web_results]
-        loader = get_web_loader(urls)
-        data = loader.load()
-
-        collection_name = form_data.collection_name
-        if collection_name == "":
-            collection_name = calculate_sha256_string(form_data.query)[:63]
-
-        store_data_in_vector_db(data, collection_name, overwrite=True)
+        store_web_urls_in_vector_db(urls, collection_name, query=form_data.query)
         return {
             "status": True,
             "collection_name": collection_name,
@@ -930,21 +1013,271 @@ def store_web_search(form_data: SearchForm, user=Depends(get_verified_user)):
         )
 
 
-def store_data_in_vector_db(
-    data, collection_name, metadata: Optional[dict] = None, overwrite: bool = False
+def get_web_url_collection_name(url: str) -> str:
+    return calculate_sha256_string(f"web:{url}")[:63]
+
+
+def get_fresh_web_collection(collection_name: str, query: Optional[str] = None):
+    """
+    Return the web collection if it was fetched within RAG_WEB_SEARCH_CACHE_TTL
+    and, when `query` is given, built for that search query.
+    """
+    try:
+        collection = CHROMA_CLIENT.get_collection(name=collection_name)
+    except Exception:
+        return None
+
+    metadata = collection.metadata or {}
+    if "fetched_at" not in metadata:
+        return None
+
+    # A client chosen collection name can be reused for another query
+    if query is not None and metadata.get("query") != query:
+        return None
+
+    # Chunks embedded with a different model can't be mixed with new queries
+    if metadata.get("embedding_model") != app.state.config.RAG_EMBEDDING_MODEL:
+        return None
+
+    age = int(time.time()) - int(metadata["fetched_at"])
+    if age >= app.state.config.RAG_WEB_SEARCH_CACHE_TTL:
+        return None
+
+    return collection
+
+
+def get_fresh_web_collection_sources(
+    collection_name: str, query: Optional[str] = None
+) -> Optional[List[str]]:
+    collection = get_fresh_web_collection(collection_name, query)
+    if collection is None:
+        return None
+    return json.loads(collection.metadata.get("sources", "[]"))
+
+
+def copy_collection(source, target):
+    result = source.get(include=["embeddings", "documents", "metadatas"])
+    for batch in create_batches(
+        api=CHROMA_CLIENT,
+        ids=[str(uuid.uuid4()) for _ in result["ids"]],
+        metadatas=result["metadatas"],
+        embeddings=result["embeddings"],
+        documents=result["documents"],
+    ):
+        target.add(*batch)
+
+
+def store_web_page_in_vector_db(url: str, data, collection) -> bool:
+    """Split and embed one fetched page into its per-URL collection, then copy it into `collection`."""
+    url_collection_name = get_web_url_collection_name(url)
+    result, _ = store_data_in_vector_db(
+        data,
+        url_collection_name,
+        overwrite=True,
+        collection_metadata={
+            "fetched_at": int(time.time()),
+            "sources": json.dumps([url]),
+            "embedding_model": app.state.config.RAG_EMBEDDING_MODEL,
+        },
+    )
+    if not result:
+        return False
+
+    copy_collection(CHROMA_CLIENT.get_collection(name=url_collection_name), collection)
+    return True
+
+
+def store_web_urls_in_vector_db(
+    urls: List[str], collection_name: str, query: Optional[str] = None
 ) -> bool:
+    """
+    Index the pages of a web search into `collection_name`.
+
+    Pages are downloaded concurrently and each one is split, embedded and
+    written as soon as it arrives, so embedding overlaps with the remaining
+    downloads. Returns once every page is handled or, when
+    RAG_WEB_SEARCH_MIN_INDEXED_PAGES is set, once that many pages are indexed,
+    the other pages are finished in the background. Pages fetched within the
+    freshness window are copied from their per-URL collection instead.
+
+    The collection is marked fresh only when every page is handled, with the
+    pages that were indexed as its sources, so a page that failed isn't reused.
+    The search `query` is stored with it, a cached collection is only reused
+    for the same query.
+    """
+    url_collections = {}
+    stale_urls = []
+    for url in urls:
+        url_collection = get_fresh_web_collection(get_web_url_collection_name(url))
+        if url_collection is None:
+            stale_urls.append(url)
+        else:
+            url_collections[url] = url_collection
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=app.state.config.CHUNK_SIZE,
-        chunk_overlap=app.state.config.CHUNK_OVERLAP,
-        add_start_index=True,
+    log.info(f"reusing {len(url_collections)} cached web pages, fetching {stale_urls}")
+
+    for collection in CHROMA_CLIENT.list_collections():
+        if collection_name == collection.name:
+            log.info(f"deleting existing collection {collection_name}")
+            CHROMA_CLIENT.delete_collection(name=collection_name)
+
+    # The collection is only as fresh as the oldest page it was built from
+    fetched_at = min(
+        [int(time.time())]
+        + [int(c.metadata["fetched_at"]) for c in url_collections.values()]
+    )
+    # No fetched_at until every page is handled, see get_fresh_web_collection
+    collection = CHROMA_CLIENT.create_collection(
+        name=collection_name,
+        metadata={"embedding_model": app.state.config.RAG_EMBEDDING_MODEL},
+    )
+
+    progress = threading.Condition()
+    indexed = []
+    finished = []
+
+    def page_done(url: str, result: bool):
+        with progress:
+            finished.append(url)
+            if result:
+                indexed.append(url)
+            complete = len(finished) == len(urls) and len(indexed) > 0
+            progress.notify_all()
+
+        if complete:
+            try:
+                collection.modify(
+                    metadata={
+                        "fetched_at": fetched_at,
+                        "sources": json.dumps([u for u in urls if u in indexed]),
+                        "embedding_model": app.state.config.RAG_EMBEDDING_MODEL,
+                        **({"query": query} if query is not None else {}),
+                    }
+                )
+            except Exception as e:
+                log.exception(e)
+
+    for url, url_collection in url_collections.items():
+        try:
+            copy_collection(url_collection, collection)
+            page_done(url, True)
+        except Exception as e:
+            log.exception(e)
+            page_done(url, False)
+
+    if len(stale_urls) > 0:
+        pages = queue.Queue()
+
+        def fetch(url: str):
+            try:
+                loader = get_web_loader(
+                    url,
+                    verify_ssl=app.state.config.ENABLE_RAG_WEB_LOADER_SSL_VERIFICATION,
+                )
+                pages.put((url, loader.load()))
+            except Exception as e:
+                log.error(f"Error loading {url}: {e}")
+                pages.put((url, []))
+
+        def ingest():
+            # A single consumer embeds pages in arrival order while later
+            # pages are still downloading
+            for _ in stale_urls:
+                url, data = pages.get()
+                result = False
+                try:
+                    if len(data) > 0:
+                        result = store_web_page_in_vector_db(url, data, collection)
+                except Exception as e:
+                    log.exception(e)
+                page_done(url, result)
+
+        executor = ThreadPoolExecutor(
+            max_workers=max(
+                1,
+                min(
+                    len(stale_urls),
+                    app.state.config.RAG_WEB_SEARCH_CONCURRENT_REQUESTS,
+                ),
+            ),
+            thread_name_prefix="web-fetch",
+        )
+        for url in stale_urls:
+            executor.submit(fetch, url)
+        executor.shutdown(wait=False)
+
+        threading.Thread(target=ingest, name="web-ingest", daemon=True).start()
+
+    min_pages = app.state.config.RAG_WEB_SEARCH_MIN_INDEXED_PAGES
+    required = len(urls) if min_pages <= 0 else min(min_pages, len(urls))
+
+    with progress:
+        progress.wait_for(
+            lambda: len(indexed) >= required or len(finished) == len(urls)
+        )
+        log.info(f"web search indexed {indexed}, {len(urls) - len(finished)} pending")
+
+        if len(indexed) == 0:
+            # Don't leave an empty collection behind that looks fresh
+            CHROMA_CLIENT.delete_collection(name=collection_name)
+            raise ValueError(ERROR_MESSAGES.EMPTY_CONTENT)
+
+    return True
+
+
+def get_text_splitter():
+    """Return the configured text splitter, rebuilt only when its settings change."""
+    key = (
+        app.state.config.RAG_TEXT_SPLITTER,
+        app.state.config.CHUNK_SIZE,
+        app.state.config.CHUNK_OVERLAP,
+        app.state.config.RAG_EMBEDDING_ENGINE,
+        app.state.config.RAG_EMBEDDING_MODEL,
+        id(app.state.sentence_transformer_ef),
     )
+    cached = getattr(app.state, "TEXT_SPLITTER", None)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    if app.state.config.RAG_TEXT_SPLITTER == "token":
+        text_splitter = get_token_chunker(
+            app.state.config.RAG_EMBEDDING_ENGINE,
+            app.state.config.RAG_EMBEDDING_MODEL,
+            app.state.sentence_transformer_ef,
+            app.state.config.CHUNK_SIZE,
+            app.state.config.CHUNK_OVERLAP,
+        )
+    else:
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=app.state.config.CHUNK_SIZE,
+            chunk_overlap=app.state.config.CHUNK_OVERLAP,
+            add_start_index=True,
+        )
+
+    app.state.TEXT_SPLITTER = (key, text_splitter)
+    return text_splitter
+
+
+def store_data_in_vector_db(
+    data,
+    collection_name,
+    metadata: Optional[dict] = None,
+    overwrite: bool = False,
+    collection_metadata: Optional[dict] = None,
+) -> bool:
+
+    text_splitter = get_text_splitter()
 
     docs = text_splitter.split_documents(data)
 
     if len(docs) > 0:
         log.info(f"store_data_in_vector_db {docs}")
-        return store_docs_in_vector_db(docs, collection_name, metadata, overwrite), None
+        return (
+            store_docs_in_vector_db(
+                docs, collection_name, metadata, overwrite, collection_metadata
+            ),
+            None,
+        )
     else:
         raise ValueError(ERROR_MESSAGES.EMPTY_CONTENT)
 
@@ -952,17 +1285,17 @@ def store_data_in_vector_db(
 def store_text_in_vector_db(
     text, metadata, collection_name, overwrite: bool = False
 ) -> bool:
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=app.state.config.CHUNK_SIZE,
-        chunk_overlap=app.state.config.CHUNK_OVERLAP,
-        add_start_index=True,
-    )
+    text_splitter = get_text_splitter()
     docs = text_splitter.create_documents([text], metadatas=[metadata])
     return store_docs_in_vector_db(docs, collection_name, overwrite=overwrite)
 
 
 def store_docs_in_vector_db(
-    docs, collection_name, metadata: Optional[dict] = None, overwrite: bool = False
+    docs,
+    collection_name,
+    metadata: Optional[dict] = None,
+    overwrite: bool = False,
+    collection_metadata: Optional[dict] = None,
 ) -> bool:
     log.info(f"store_docs_in_vector_db {docs} {collection_name}")
 
@@ -983,7 +1316,9 @@ def store_docs_in_vector_db(
                     log.info(f"deleting existing collection {collection_name}")
                     CHROMA_CLIENT.delete_collection(name=collection_name)
 
-        collection = CHROMA_CLIENT.create_collection(name=collection_name)
+        collection = CHROMA_CLIENT.create_collection(
+            name=collection_name, metadata=collection_metadata
+        )
 
         embedding_func = get_embedding_function(
             app.state.config.RAG_EMBEDDING_ENGINE,
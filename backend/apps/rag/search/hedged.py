@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional
+
+from apps.rag.search.main import SearchResult
+from config import SRC_LOG_LEVELS
+from utils.misc import percentile
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+
+class SearchEngineLatencies:
+    """Rolling window of per-engine search latencies, used to tune the hedge delay."""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, deque] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, engine: str, seconds: float, error: bool = False):
+        with self.lock:
+            if engine not in self.latencies:
+                self.latencies[engine] = deque(maxlen=self.window)
+                self.errors[engine] = 0
+            if error:
+                self.errors[engine] += 1
+            else:
+                self.latencies[engine].append(seconds)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = {}
+            for engine, latencies in self.latencies.items():
+                values = sorted(latencies)
+                stats[engine] = {
+                    "count": len(values),
+                    "errors": self.errors[engine],
+                    "p50": percentile(values, 50),
+                    "p90": percentile(values, 90),
+                    "p99": percentile(values, 99),
+                }
+            return stats
+
+
+def search_hedged(
+    searches: Dict[str, Callable[[], List[SearchResult]]],
+    count: int,
+    hedge_delay: float = 0.0,
+    latencies: Optional[SearchEngineLatencies] = None,
+) -> List[SearchResult]:
+    """
+    Query several search engines and return the first `count` results unique by URL.
+
+    Args:
+        searches (Dict[str, Callable]): Engine name to a zero-argument search callable, in order of preference
+        count (int): The number of unique results to return
+        hedge_delay (float): Seconds to wait for outstanding engines before starting the next one.
+            With 0 every engine is queried in parallel right away.
+        latencies (SearchEngineLatencies): Optional collector for per-engine latencies
+
+    Returns:
+        List[SearchResult]: Up to `count` results, de-duplicated by link
+    """
+    queue = list(searches.items())
+    if not queue:
+        return []
+
+    def timed(engine, search):
+        start = time.perf_counter()
+        try:
+            results = search()
+        except Exception:
+            if latencies is not None:
+                latencies.record(engine, time.perf_counter() - start, error=True)
+            raise
+        if latencies is not None:
+            latencies.record(engine, time.perf_counter() - start)
+        return results
+
+    executor = ThreadPoolExecutor(
+        max_workers=len(queue), thread_name_prefix="web-search"
+    )
+    pending = {}
+
+    def launch():
+        engine, search = queue.pop(0)
+        log.debug(f"search_hedged: querying {engine}")
+        pending[executor.submit(timed, engine, search)] = engine
+
+    results = []
+    seen = set()
+    errors = []
+
+    try:
+        if hedge_delay > 0:
+            launch()
+        else:
+            while queue:
+                launch()
+
+        while pending or queue:
+            if not pending:
+                # Every engine started so far has failed, move on right away
+                launch()
+                continue
+
+            done, _ = wait(
+                pending,
+                timeout=hedge_delay if queue else None,
+                return_when=FIRST_COMPLETED,
+            )
+
+            if not done:
+                # Hedge: the engines in flight are slow, start the next one
+                launch()
+                continue
+
+            for future in done:
+                engine = pending.pop(future)
+                try:
+                    engine_results = future.result()
+                except Exception as e:
+                    log.error(f"search_hedged: {engine} failed: {e}")
+                    errors.append(e)
+                    continue
+
+                for result in engine_results:
+                    if result.link not in seen:
+                        seen.add(result.link)
+                        results.append(result)
+
+                if len(results) >= count:
+                    return results[:count]
+
+        if not results and errors:
+            raise errors[0]
+        return results
+    finally:
+        # Stragglers that have not started are dropped, running ones are left to
+        # finish in the background and only contribute to the latency stats.
+        executor.shutdown(wait=False, cancel_futures=True)
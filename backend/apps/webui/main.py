@@ -1,6 +1,7 @@
 from fastapi import FastAPI, Depends
 from fastapi.routing import APIRoute
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from sqlalchemy.orm import Session
@@ -20,9 +21,11 @@ from apps.webui.routers import (
 )
 from apps.webui.models.functions import Functions
 from apps.webui.models.models import Models
-from apps.webui.utils import load_function_module_by_id
 
 from utils.misc import stream_message_template
+from utils.registry import function_registry, pipe_models
+from utils.workers import function_workers, run_in_workers
+from utils.threads import iterate_in_thread
 from utils.task import prompt_template
 
 
@@ -45,18 +48,24 @@ from config import (
     AppConfig,
     OAUTH_USERNAME_CLAIM,
     OAUTH_PICTURE_CLAIM,
+    SRC_LOG_LEVELS,
 )
 
 from apps.socket.main import get_event_call, get_event_emitter
 
+import asyncio
 import inspect
+import logging
 import uuid
 import time
 import json
 
-from typing import Iterator, Generator, Optional
+from typing import AsyncGenerator, Iterator, Generator, List, Optional
 from pydantic import BaseModel
 
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MODELS"])
+
 app = FastAPI()
 
 origins = ["*"]
@@ -86,8 +95,8 @@ app.state.config.OAUTH_USERNAME_CLAIM = OAUTH_USERNAME_CLAIM
 app.state.config.OAUTH_PICTURE_CLAIM = OAUTH_PICTURE_CLAIM
 
 app.state.MODELS = {}
-app.state.TOOLS = {}
-app.state.FUNCTIONS = {}
+app.state.TOOLS = function_registry.tools
+app.state.FUNCTIONS = function_registry.functions
 
 app.add_middleware(
     CORSMiddleware,
@@ -125,77 +134,85 @@ async def get_status():
     }
 
 
-async def get_pipe_models():
-    pipes = Functions.get_functions_by_type("pipe", active_only=True)
-    pipe_models = []
+async def expand_pipe(function) -> List[dict]:
+    """The models a pipe function provides, one per manifold pipe or the pipe itself."""
+    pipe = function.model
+    function_module = function.module
+    models = []
 
-    for pipe in pipes:
-        # Check if function is already loaded
-        if pipe.id not in app.state.FUNCTIONS:
-            function_module, function_type, frontmatter = load_function_module_by_id(
-                pipe.id
-            )
-            app.state.FUNCTIONS[pipe.id] = function_module
-        else:
-            function_module = app.state.FUNCTIONS[pipe.id]
+    # Check if function is a manifold
+    if hasattr(function_module, "type"):
+        if function_module.type == "manifold":
+            manifold_pipes = []
 
-        if hasattr(function_module, "valves") and hasattr(function_module, "Valves"):
-            valves = Functions.get_function_valves_by_id(pipe.id)
-            function_module.valves = function_module.Valves(
-                **(valves if valves else {})
-            )
+            # Check if pipes is a function or a list, listing often calls a provider
+            if inspect.iscoroutinefunction(function_module.pipes):
+                manifold_pipes = await function_module.pipes()
+            elif callable(function_module.pipes):
+                manifold_pipes = await run_in_threadpool(function_module.pipes)
+            else:
+                manifold_pipes = function_module.pipes
 
-        # Check if function is a manifold
-        if hasattr(function_module, "type"):
-            if function_module.type == "manifold":
-                manifold_pipes = []
+            for p in manifold_pipes:
+                manifold_pipe_id = f'{pipe.id}.{p["id"]}'
+                manifold_pipe_name = p["name"]
 
-                # Check if pipes is a function or a list
-                if callable(function_module.pipes):
-                    manifold_pipes = function_module.pipes()
-                else:
-                    manifold_pipes = function_module.pipes
+                if hasattr(function_module, "name"):
+                    manifold_pipe_name = f"{function_module.name}{manifold_pipe_name}"
 
-                for p in manifold_pipes:
-                    manifold_pipe_id = f'{pipe.id}.{p["id"]}'
-                    manifold_pipe_name = p["name"]
+                pipe_flag = {"type": pipe.type}
+                if hasattr(function_module, "ChatValves"):
+                    pipe_flag["valves_spec"] = function_module.ChatValves.schema()
 
-                    if hasattr(function_module, "name"):
-                        manifold_pipe_name = (
-                            f"{function_module.name}{manifold_pipe_name}"
-                        )
+                models.append(
+                    {
+                        "id": manifold_pipe_id,
+                        "name": manifold_pipe_name,
+                        "object": "model",
+                        "created": pipe.created_at,
+                        "owned_by": "openai",
+                        "pipe": pipe_flag,
+                    }
+                )
+    else:
+        pipe_flag = {"type": "pipe"}
+        if hasattr(function_module, "ChatValves"):
+            pipe_flag["valves_spec"] = function_module.ChatValves.schema()
+
+        models.append(
+            {
+                "id": pipe.id,
+                "name": pipe.name,
+                "object": "model",
+                "created": pipe.created_at,
+                "owned_by": "openai",
+                "pipe": pipe_flag,
+            }
+        )
 
-                    pipe_flag = {"type": pipe.type}
-                    if hasattr(function_module, "ChatValves"):
-                        pipe_flag["valves_spec"] = function_module.ChatValves.schema()
+    return models
 
-                    pipe_models.append(
-                        {
-                            "id": manifold_pipe_id,
-                            "name": manifold_pipe_name,
-                            "object": "model",
-                            "created": pipe.created_at,
-                            "owned_by": "openai",
-                            "pipe": pipe_flag,
-                        }
-                    )
-        else:
-            pipe_flag = {"type": "pipe"}
-            if hasattr(function_module, "ChatValves"):
-                pipe_flag["valves_spec"] = function_module.ChatValves.schema()
-
-            pipe_models.append(
-                {
-                    "id": pipe.id,
-                    "name": pipe.name,
-                    "object": "model",
-                    "created": pipe.created_at,
-                    "owned_by": "openai",
-                    "pipe": pipe_flag,
-                }
-            )
 
-    return pipe_models
+async def get_pipe_models():
+    pipes = Functions.get_functions_by_type("pipe", active_only=True)
+    pipe_models.retain([pipe.id for pipe in pipes])
+
+    functions = []
+    for pipe in pipes:
+        try:
+            # Loaded with its valves applied, see FunctionRegistry
+            function = function_registry.get_function(pipe.id)
+        except Exception as e:
+            log.error(f"Failed to load pipe {pipe.id}: {e}")
+            continue
+        if function is not None:
+            functions.append(function)
+
+    # Expanded concurrently, from cache unless the pipe changed or its TTL passed
+    expansions = await asyncio.gather(
+        *[pipe_models.get(function, expand_pipe) for function in functions]
+    )
+    return [model for models in expansions for model in models]
 
 
 async def generate_function_chat_completion(form_data, user):
@@ -297,26 +314,14 @@ async def generate_function_chat_completion(form_data, user):
             pipe_id, sub_pipe_id = pipe_id.split(".", 1)
         print(pipe_id)
 
-        # Check if function is already loaded
-        if pipe_id not in app.state.FUNCTIONS:
-            function_module, function_type, frontmatter = load_function_module_by_id(
-                pipe_id
-            )
-            app.state.FUNCTIONS[pipe_id] = function_module
-        else:
-            function_module = app.state.FUNCTIONS[pipe_id]
-
-        if hasattr(function_module, "valves") and hasattr(function_module, "Valves"):
-
-            valves = Functions.get_function_valves_by_id(pipe_id)
-            function_module.valves = function_module.Valves(
-                **(valves if valves else {})
-            )
+        # Loaded with its valves applied, see FunctionRegistry
+        function = function_registry.get_function(pipe_id)
+        function_module = function.module
 
         pipe = function_module.pipe
 
         # Get the signature of the function
-        sig = inspect.signature(pipe)
+        sig = function.get_signature("pipe")
         params = {"body": form_data}
 
         if "__user__" in sig.parameters:
@@ -346,11 +351,33 @@ async def generate_function_chat_completion(form_data, user):
         if "__task__" in sig.parameters:
             params = {**params, "__task__": __task__}
 
+        def format_line(line):
+            if isinstance(line, BaseModel):
+                line = line.model_dump_json()
+                line = f"data: {line}"
+            if isinstance(line, dict):
+                line = f"data: {json.dumps(line)}"
+
+            try:
+                line = line.decode("utf-8")
+            except:
+                pass
+
+            if line.startswith("data:"):
+                return f"{line}\n\n"
+            else:
+                line = stream_message_template(form_data["model"], line)
+                return f"data: {json.dumps(line)}\n\n"
+
         if form_data["stream"]:
 
             async def stream_content():
                 try:
-                    if inspect.iscoroutinefunction(pipe):
+                    if run_in_workers():
+                        res = await function_workers.call(
+                            function, "pipe", params, stream=True
+                        )
+                    elif inspect.iscoroutinefunction(pipe):
                         res = await pipe(**params)
                     else:
                         res = pipe(**params)
@@ -374,25 +401,16 @@ async def generate_function_chat_completion(form_data, user):
                     yield f"data: {json.dumps(message)}\n\n"
 
                 if isinstance(res, Iterator):
-                    for line in res:
-                        if isinstance(line, BaseModel):
-                            line = line.model_dump_json()
-                            line = f"data: {line}"
-                        if isinstance(line, dict):
-                            line = f"data: {json.dumps(line)}"
-
-                        try:
-                            line = line.decode("utf-8")
-                        except:
-                            pass
-
-                        if line.startswith("data:"):
-                            yield f"{line}\n\n"
-                        else:
-                            line = stream_message_template(form_data["model"], line)
-                            yield f"data: {json.dumps(line)}\n\n"
-
-                if isinstance(res, str) or isinstance(res, Generator):
+                    # next() may block, e.g. on a sync HTTP client
+                    async for line in iterate_in_thread(res):
+                        yield format_line(line)
+
+                # Generators run in a worker process come back as async generators
+                if isinstance(res, AsyncGenerator):
+                    async for line in res:
+                        yield format_line(line)
+
+                if isinstance(res, str) or isinstance(res, (Generator, AsyncGenerator)):
                     finish_message = {
                         "id": f"{form_data['model']}-{str(uuid.uuid4())}",
                         "object": "chat.completion.chunk",
@@ -415,7 +433,11 @@ async def generate_function_chat_completion(form_data, user):
         else:
 
             try:
-                if inspect.iscoroutinefunction(pipe):
+                if run_in_workers():
+                    res = await function_workers.call(
+                        function, "pipe", params, stream=True
+                    )
+                elif inspect.iscoroutinefunction(pipe):
                     res = await pipe(**params)
                 else:
                     res = pipe(**params)
@@ -435,7 +457,10 @@ async def generate_function_chat_completion(form_data, user):
                 if isinstance(res, str):
                     message = res
                 if isinstance(res, Generator):
-                    for stream in res:
+                    async for stream in iterate_in_thread(res):
+                        message = f"{message}{stream}"
+                if isinstance(res, AsyncGenerator):
+                    async for stream in res:
                         message = f"{message}{stream}"
 
                 return {
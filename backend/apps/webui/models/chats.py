@@ -1,11 +1,13 @@
 from pydantic import BaseModel, ConfigDict
-from typing import List, Union, Optional
+from typing import List, Union, Optional, Tuple
 
+import base64
 import json
 import uuid
 import time
 
-from sqlalchemy import Column, String, BigInteger, Boolean, Text
+from sqlalchemy import Column, String, BigInteger, Boolean, Text, Index, tuple_
+from sqlalchemy.orm import Query
 
 from apps.webui.internal.db import Base, get_db
 
@@ -29,6 +31,17 @@ class Chat(Base):
     share_id = Column(Text, unique=True, nullable=True)
     archived = Column(Boolean, default=False)
 
+    __table_args__ = (
+        # Chat lists of a user, newest first, see ChatTable.paginate
+        Index(
+            "ix_chat_user_id_archived_updated_at",
+            "user_id",
+            "archived",
+            "updated_at",
+            "id",
+        ),
+    )
+
 
 class ChatModel(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -76,8 +89,60 @@ class ChatTitleIdResponse(BaseModel):
     created_at: int
 
 
+def encode_chat_cursor(updated_at: int, id: str) -> str:
+    """Opaque cursor of the chat lists, pointing right after the chat `id`."""
+    return base64.urlsafe_b64encode(f"{updated_at}:{id}".encode()).decode()
+
+
+def decode_chat_cursor(cursor: str) -> Tuple[int, str]:
+    """
+    Raises:
+        ValueError: `cursor` wasn't made by encode_chat_cursor
+    """
+    try:
+        updated_at, id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        )
+        return int(updated_at), id
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
 class ChatTable:
 
+    def paginate(
+        self,
+        query: Query,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> Query:
+        """
+        Order `query` newest first and page it, after `cursor` or from `skip`.
+
+        A cursor seeks on (updated_at, id) through the user index, so a page
+        costs the same at any depth, and chats updated meanwhile don't shift
+        the next page as they do with offsets. Without `limit` every chat is
+        returned, as old clients expect.
+        """
+        query = query.order_by(Chat.updated_at.desc(), Chat.id.desc())
+        if cursor is not None:
+            query = query.filter(
+                tuple_(Chat.updated_at, Chat.id) < decode_chat_cursor(cursor)
+            )
+        elif skip:
+            query = query.offset(skip)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def get_chat_title_id_list(self, query: Query) -> List[ChatTitleIdResponse]:
+        # Plain rows without the chat JSON, by far the largest column
+        chats = query.with_entities(
+            Chat.id, Chat.title, Chat.updated_at, Chat.created_at
+        )
+        return [ChatTitleIdResponse(**chat._mapping) for chat in chats]
+
     def insert_new_chat(self, user_id: str, form_data: ChatForm) -> Optional[ChatModel]:
         with get_db() as db:
 
@@ -214,36 +279,33 @@ class ChatTable:
             return False
 
     def get_archived_chat_list_by_user_id(
-        self, user_id: str, skip: int = 0, limit: int = 50
-    ) -> List[ChatModel]:
+        self,
+        user_id: str,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> List[ChatTitleIdResponse]:
         with get_db() as db:
-
-            all_chats = (
-                db.query(Chat)
-                .filter_by(user_id=user_id, archived=True)
-                .order_by(Chat.updated_at.desc())
-                # .limit(limit).offset(skip)
-                .all()
+            query = db.query(Chat).filter_by(user_id=user_id, archived=True)
+            return self.get_chat_title_id_list(
+                self.paginate(query, skip, limit, cursor)
             )
-            return [ChatModel.model_validate(chat) for chat in all_chats]
 
     def get_chat_list_by_user_id(
         self,
         user_id: str,
         include_archived: bool = False,
         skip: int = 0,
-        limit: int = 50,
-    ) -> List[ChatModel]:
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> List[ChatTitleIdResponse]:
         with get_db() as db:
             query = db.query(Chat).filter_by(user_id=user_id)
             if not include_archived:
                 query = query.filter_by(archived=False)
-            all_chats = (
-                query.order_by(Chat.updated_at.desc())
-                # .limit(limit).offset(skip)
-                .all()
+            return self.get_chat_title_id_list(
+                self.paginate(query, skip, limit, cursor)
             )
-            return [ChatModel.model_validate(chat) for chat in all_chats]
 
     def get_chat_list_by_chat_ids(
         self, chat_ids: List[str], skip: int = 0, limit: int = 50
@@ -289,14 +351,15 @@ class ChatTable:
         except:
             return None
 
-    def get_chats(self, skip: int = 0, limit: int = 50) -> List[ChatModel]:
+    def get_chats(
+        self,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> List[ChatModel]:
         with get_db() as db:
 
-            all_chats = (
-                db.query(Chat)
-                # .limit(limit).offset(skip)
-                .order_by(Chat.updated_at.desc())
-            )
+            all_chats = self.paginate(db.query(Chat), skip, limit, cursor)
             return [ChatModel.model_validate(chat) for chat in all_chats]
 
     def get_chats_by_user_id(self, user_id: str) -> List[ChatModel]:
@@ -1,14 +1,21 @@
 from pydantic import BaseModel, ConfigDict, parse_obj_as
-from typing import List, Union, Optional
+from typing import Dict, List, Union, Optional, Tuple
+import logging
+import threading
 import time
 
-from sqlalchemy import String, Column, BigInteger, Text
+from sqlalchemy import String, Column, BigInteger, Text, bindparam, update
 
 from utils.misc import get_gravatar_url
 
 from apps.webui.internal.db import Base, JSONField, Session, get_db
 from apps.webui.models.chats import Chats
 
+from config import SRC_LOG_LEVELS, USER_CACHE_TTL
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MODELS"])
+
 ####################
 # User DB Schema
 ####################
@@ -79,6 +86,101 @@ class UserUpdateForm(BaseModel):
 
 class UsersTable:
 
+    def __init__(self, cache_ttl: float = USER_CACHE_TTL):
+        # Authenticated users by id, (cached at, user), see get_cached_user_by_id
+        self.cache_ttl = cache_ttl
+        self.cache: Dict[str, Tuple[float, UserModel]] = {}
+        self.api_key_ids: Dict[str, str] = {}
+        # Bumped by every write, a read that raced one isn't cached
+        self.generation = 0
+        # User id -> last_active_at not written yet, see flush_last_active
+        self.last_active: Dict[str, int] = {}
+        self.last_active_lock = threading.Lock()
+
+    def invalidate_user(self, id: str):
+        self.generation += 1
+        self.cache.pop(id, None)
+        for api_key, user_id in list(self.api_key_ids.items()):
+            if user_id == id:
+                self.api_key_ids.pop(api_key, None)
+
+    def cache_user(self, user: Optional[UserModel], generation: int):
+        if user is not None and generation == self.generation and self.cache_ttl > 0:
+            self.cache[user.id] = (time.monotonic(), user)
+            if user.api_key:
+                self.api_key_ids[user.api_key] = user.id
+
+    def get_cached_user(self, id: str) -> Optional[UserModel]:
+        cached_at, user = self.cache.get(id, (0.0, None))
+        if user is not None and time.monotonic() - cached_at < self.cache_ttl:
+            return user
+        return None
+
+    def get_cached_user_by_id(self, id: str) -> Optional[UserModel]:
+        """
+        Same as get_user_by_id, served from cache for `cache_ttl` seconds.
+
+        Meant for authenticating requests. Every write through this table drops
+        the user from the cache, other workers see it within `cache_ttl`.
+        """
+        user = self.get_cached_user(id)
+        if user is None:
+            generation = self.generation
+            user = self.get_user_by_id(id)
+            self.cache_user(user, generation)
+        return user
+
+    def get_cached_user_by_api_key(self, api_key: str) -> Optional[UserModel]:
+        """Same as get_user_by_api_key, cached like get_cached_user_by_id."""
+        user = None
+        if api_key in self.api_key_ids:
+            user = self.get_cached_user(self.api_key_ids[api_key])
+        if user is None or user.api_key != api_key:
+            generation = self.generation
+            user = self.get_user_by_api_key(api_key)
+            self.cache_user(user, generation)
+        return user
+
+    def mark_user_active(self, id: str):
+        """Record that a user was active now, written by the next flush_last_active."""
+        now = int(time.time())
+        with self.last_active_lock:
+            self.last_active[id] = now
+
+        cached_at, user = self.cache.get(id, (0.0, None))
+        if user is not None:
+            user.last_active_at = now
+
+    def flush_last_active(self) -> int:
+        """Write the last_active_at recorded since the last flush in one batch."""
+        with self.last_active_lock:
+            last_active, self.last_active = self.last_active, {}
+        if not last_active:
+            return 0
+
+        try:
+            with get_db() as db:
+                # A core executemany, unlike the ORM bulk update it doesn't fail
+                # the batch when a user was deleted meanwhile
+                db.execute(
+                    update(User.__table__)
+                    .where(User.__table__.c.id == bindparam("user_id"))
+                    .values(last_active_at=bindparam("user_last_active_at")),
+                    [
+                        {"user_id": id, "user_last_active_at": last_active_at}
+                        for id, last_active_at in last_active.items()
+                    ],
+                )
+                db.commit()
+            return len(last_active)
+        except Exception as e:
+            log.error(f"Failed to write the last activity of users: {e}")
+            # Retried with the next flush, unless the user was active since
+            with self.last_active_lock:
+                for id, last_active_at in last_active.items():
+                    self.last_active.setdefault(id, last_active_at)
+            return 0
+
     def insert_new_user(
         self,
         id: str,
@@ -172,6 +274,7 @@ class UsersTable:
             with get_db() as db:
                 db.query(User).filter_by(id=id).update({"role": role})
                 db.commit()
+                self.invalidate_user(id)
                 user = db.query(User).filter_by(id=id).first()
                 return UserModel.model_validate(user)
         except:
@@ -186,6 +289,7 @@ class UsersTable:
                     {"profile_image_url": profile_image_url}
                 )
                 db.commit()
+                self.invalidate_user(id)
 
                 user = db.query(User).filter_by(id=id).first()
                 return UserModel.model_validate(user)
@@ -200,6 +304,7 @@ class UsersTable:
                     {"last_active_at": int(time.time())}
                 )
                 db.commit()
+                self.invalidate_user(id)
 
                 user = db.query(User).filter_by(id=id).first()
                 return UserModel.model_validate(user)
@@ -213,6 +318,7 @@ class UsersTable:
             with get_db() as db:
                 db.query(User).filter_by(id=id).update({"oauth_sub": oauth_sub})
                 db.commit()
+                self.invalidate_user(id)
 
                 user = db.query(User).filter_by(id=id).first()
                 return UserModel.model_validate(user)
@@ -224,6 +330,7 @@ class UsersTable:
             with get_db() as db:
                 db.query(User).filter_by(id=id).update(updated)
                 db.commit()
+                self.invalidate_user(id)
 
                 user = db.query(User).filter_by(id=id).first()
                 return UserModel.model_validate(user)
@@ -232,6 +339,8 @@ class UsersTable:
             return None
 
     def delete_user_by_id(self, id: str) -> bool:
+        with self.last_active_lock:
+            self.last_active.pop(id, None)
         try:
             # Delete User Chats
             result = Chats.delete_chats_by_user_id(id)
@@ -241,6 +350,7 @@ class UsersTable:
                     # Delete User
                     db.query(User).filter_by(id=id).delete()
                     db.commit()
+                    self.invalidate_user(id)
 
                 return True
             else:
@@ -253,6 +363,7 @@ class UsersTable:
             with get_db() as db:
                 result = db.query(User).filter_by(id=id).update({"api_key": api_key})
                 db.commit()
+                self.invalidate_user(id)
                 return True if result == 1 else False
         except:
             return False
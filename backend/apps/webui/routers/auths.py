@@ -5,8 +5,10 @@ from fastapi import Depends, HTTPException, status
 from fastapi.responses import Response
 
 from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import re
+import threading
 import uuid
 import csv
 
@@ -31,6 +33,7 @@ from utils.utils import (
     create_api_key,
 )
 from utils.misc import parse_duration, validate_email_format
+from utils.passwords import password_executor
 from utils.webhook import post_webhook
 from constants import ERROR_MESSAGES, WEBHOOK_MESSAGES
 from config import (
@@ -77,7 +80,7 @@ async def get_session_user(
 
 
 @router.post("/update/profile", response_model=UserResponse)
-async def update_profile(
+def update_profile(
     form_data: UpdateProfileForm, session_user=Depends(get_current_user)
 ):
     if session_user:
@@ -105,11 +108,17 @@ async def update_password(
     if WEBUI_AUTH_TRUSTED_EMAIL_HEADER:
         raise HTTPException(400, detail=ERROR_MESSAGES.ACTION_PROHIBITED)
     if session_user:
-        user = Auths.authenticate_user(session_user.email, form_data.password)
+        user = await password_executor.run(
+            Auths.authenticate_user, session_user.email, form_data.password
+        )
 
         if user:
-            hashed = get_password_hash(form_data.new_password)
-            return Auths.update_user_password_by_id(user.id, hashed)
+            hashed = await password_executor.run(
+                get_password_hash, form_data.new_password
+            )
+            return await run_in_threadpool(
+                Auths.update_user_password_by_id, user.id, hashed
+            )
         else:
             raise HTTPException(400, detail=ERROR_MESSAGES.INVALID_PASSWORD)
     else:
@@ -133,7 +142,7 @@ async def signin(request: Request, response: Response, form_data: SigninForm):
             trusted_name = request.headers.get(
                 WEBUI_AUTH_TRUSTED_NAME_HEADER, trusted_email
             )
-        if not Users.get_user_by_email(trusted_email.lower()):
+        if not await run_in_threadpool(Users.get_user_by_email, trusted_email.lower()):
             await signup(
                 request,
                 response,
@@ -141,15 +150,19 @@ async def signin(request: Request, response: Response, form_data: SigninForm):
                     email=trusted_email, password=str(uuid.uuid4()), name=trusted_name
                 ),
             )
-        user = Auths.authenticate_user_by_trusted_header(trusted_email)
+        user = await run_in_threadpool(
+            Auths.authenticate_user_by_trusted_header, trusted_email
+        )
     elif WEBUI_AUTH == False:
         admin_email = "admin@localhost"
         admin_password = "admin"
 
-        if Users.get_user_by_email(admin_email.lower()):
-            user = Auths.authenticate_user(admin_email.lower(), admin_password)
+        if await run_in_threadpool(Users.get_user_by_email, admin_email.lower()):
+            user = await password_executor.run(
+                Auths.authenticate_user, admin_email.lower(), admin_password
+            )
         else:
-            if Users.get_num_users() != 0:
+            if await run_in_threadpool(Users.get_num_users) != 0:
                 raise HTTPException(400, detail=ERROR_MESSAGES.EXISTING_USERS)
 
             await signup(
@@ -158,9 +171,13 @@ async def signin(request: Request, response: Response, form_data: SigninForm):
                 SignupForm(email=admin_email, password=admin_password, name="User"),
             )
 
-            user = Auths.authenticate_user(admin_email.lower(), admin_password)
+            user = await password_executor.run(
+                Auths.authenticate_user, admin_email.lower(), admin_password
+            )
     else:
-        user = Auths.authenticate_user(form_data.email.lower(), form_data.password)
+        user = await password_executor.run(
+            Auths.authenticate_user, form_data.email.lower(), form_data.password
+        )
 
     if user:
         token = create_token(
@@ -193,6 +210,22 @@ async def signin(request: Request, response: Response, form_data: SigninForm):
 ############################
 
 
+# Sign-ups run on threads, the first one alone must become admin
+signup_lock = threading.Lock()
+
+
+def insert_signup_user(form_data: SignupForm, hashed: str, default_role: str):
+    with signup_lock:
+        role = "admin" if Users.get_num_users() == 0 else default_role
+        return Auths.insert_new_auth(
+            form_data.email.lower(),
+            hashed,
+            form_data.name,
+            form_data.profile_image_url,
+            role,
+        )
+
+
 @router.post("/signup", response_model=SigninResponse)
 async def signup(request: Request, response: Response, form_data: SignupForm):
     if not request.app.state.config.ENABLE_SIGNUP and WEBUI_AUTH:
@@ -205,22 +238,16 @@ async def signup(request: Request, response: Response, form_data: SignupForm):
             status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.INVALID_EMAIL_FORMAT
         )
 
-    if Users.get_user_by_email(form_data.email.lower()):
+    if await run_in_threadpool(Users.get_user_by_email, form_data.email.lower()):
         raise HTTPException(400, detail=ERROR_MESSAGES.EMAIL_TAKEN)
 
+    hashed = await password_executor.run(get_password_hash, form_data.password)
     try:
-        role = (
-            "admin"
-            if Users.get_num_users() == 0
-            else request.app.state.config.DEFAULT_USER_ROLE
-        )
-        hashed = get_password_hash(form_data.password)
-        user = Auths.insert_new_auth(
-            form_data.email.lower(),
+        user = await run_in_threadpool(
+            insert_signup_user,
+            form_data,
             hashed,
-            form_data.name,
-            form_data.profile_image_url,
-            role,
+            request.app.state.config.DEFAULT_USER_ROLE,
         )
 
         if user:
@@ -238,7 +265,8 @@ async def signup(request: Request, response: Response, form_data: SignupForm):
             )
 
             if request.app.state.config.WEBHOOK_URL:
-                post_webhook(
+                await run_in_threadpool(
+                    post_webhook,
                     request.app.state.config.WEBHOOK_URL,
                     WEBHOOK_MESSAGES.USER_SIGNUP(user.name),
                     {
@@ -276,14 +304,15 @@ async def add_user(form_data: AddUserForm, user=Depends(get_admin_user)):
             status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.INVALID_EMAIL_FORMAT
         )
 
-    if Users.get_user_by_email(form_data.email.lower()):
+    if await run_in_threadpool(Users.get_user_by_email, form_data.email.lower()):
         raise HTTPException(400, detail=ERROR_MESSAGES.EMAIL_TAKEN)
 
+    hashed = await password_executor.run(get_password_hash, form_data.password)
     try:
 
         print(form_data)
-        hashed = get_password_hash(form_data.password)
-        user = Auths.insert_new_auth(
+        user = await run_in_threadpool(
+            Auths.insert_new_auth,
             form_data.email.lower(),
             hashed,
             form_data.name,
@@ -314,7 +343,7 @@ async def add_user(form_data: AddUserForm, user=Depends(get_admin_user)):
 
 
 @router.get("/admin/details")
-async def get_admin_details(request: Request, user=Depends(get_current_user)):
+def get_admin_details(request: Request, user=Depends(get_current_user)):
     if request.app.state.config.SHOW_ADMIN_DETAILS:
         admin_email = request.app.state.config.ADMIN_EMAIL
         admin_name = None
@@ -364,7 +393,7 @@ class AdminConfig(BaseModel):
 
 
 @router.post("/admin/config")
-async def update_admin_config(
+def update_admin_config(
     request: Request, form_data: AdminConfig, user=Depends(get_admin_user)
 ):
     request.app.state.config.SHOW_ADMIN_DETAILS = form_data.SHOW_ADMIN_DETAILS
@@ -399,7 +428,7 @@ async def update_admin_config(
 
 # create api key
 @router.post("/api_key", response_model=ApiKey)
-async def create_api_key_(user=Depends(get_current_user)):
+def create_api_key_(user=Depends(get_current_user)):
     api_key = create_api_key()
     success = Users.update_user_api_key_by_id(user.id, api_key)
     if success:
@@ -412,14 +441,14 @@ async def create_api_key_(user=Depends(get_current_user)):
 
 # delete api key
 @router.delete("/api_key", response_model=bool)
-async def delete_api_key(user=Depends(get_current_user)):
+def delete_api_key(user=Depends(get_current_user)):
     success = Users.update_user_api_key_by_id(user.id, None)
     return success
 
 
 # get api key
 @router.get("/api_key", response_model=ApiKey)
-async def get_api_key(user=Depends(get_current_user)):
+def get_api_key(user=Depends(get_current_user)):
     api_key = Users.get_user_api_key_by_id(user.id)
     if api_key:
         return {
@@ -1,4 +1,4 @@
-from fastapi import Depends, Request, HTTPException, status
+from fastapi import Depends, Request, Response, HTTPException, status
 from datetime import datetime, timedelta
 from typing import List, Union, Optional
 from utils.utils import get_verified_user, get_admin_user
@@ -15,6 +15,7 @@ from apps.webui.models.chats import (
     ChatForm,
     ChatTitleIdResponse,
     Chats,
+    encode_chat_cursor,
 )
 
 
@@ -35,6 +36,37 @@ log.setLevel(SRC_LOG_LEVELS["MODELS"])
 
 router = APIRouter()
 
+
+def get_chat_page(
+    response: Response,
+    get_chats,
+    skip: int,
+    limit: Optional[int],
+    cursor: Optional[str],
+) -> List[ChatTitleIdResponse]:
+    """
+    Page of a chat list, the whole list when neither `limit` nor `cursor` is
+    given, as old clients expect. A full page sets the X-Next-Cursor header,
+    pass it as `cursor` for the next one.
+    """
+    if cursor is not None and limit is None:
+        limit = 50
+
+    try:
+        chats = get_chats(skip=skip, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=ERROR_MESSAGES.INVALID_CURSOR,
+        )
+
+    if limit is not None and len(chats) == limit and chats:
+        response.headers["X-Next-Cursor"] = encode_chat_cursor(
+            chats[-1].updated_at, chats[-1].id
+        )
+    return chats
+
+
 ############################
 # GetChatList
 ############################
@@ -42,10 +74,20 @@ router = APIRouter()
 
 @router.get("/", response_model=List[ChatTitleIdResponse])
 @router.get("/list", response_model=List[ChatTitleIdResponse])
-async def get_session_user_chat_list(
-    user=Depends(get_verified_user), skip: int = 0, limit: int = 50
+def get_session_user_chat_list(
+    response: Response,
+    user=Depends(get_verified_user),
+    skip: int = 0,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
 ):
-    return Chats.get_chat_list_by_user_id(user.id, skip, limit)
+    return get_chat_page(
+        response,
+        lambda **page: Chats.get_chat_list_by_user_id(user.id, **page),
+        skip,
+        limit,
+        cursor,
+    )
 
 
 ############################
@@ -54,7 +96,7 @@ async def get_session_user_chat_list(
 
 
 @router.delete("/", response_model=bool)
-async def delete_all_user_chats(request: Request, user=Depends(get_verified_user)):
+def delete_all_user_chats(request: Request, user=Depends(get_verified_user)):
 
     if (
         user.role == "user"
@@ -75,14 +117,22 @@ async def delete_all_user_chats(request: Request, user=Depends(get_verified_user
 
 
 @router.get("/list/user/{user_id}", response_model=List[ChatTitleIdResponse])
-async def get_user_chat_list_by_user_id(
+def get_user_chat_list_by_user_id(
     user_id: str,
+    response: Response,
     user=Depends(get_admin_user),
     skip: int = 0,
-    limit: int = 50,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
 ):
-    return Chats.get_chat_list_by_user_id(
-        user_id, include_archived=True, skip=skip, limit=limit
+    return get_chat_page(
+        response,
+        lambda **page: Chats.get_chat_list_by_user_id(
+            user_id, include_archived=True, **page
+        ),
+        skip,
+        limit,
+        cursor,
     )
 
 
@@ -92,7 +142,7 @@ async def get_user_chat_list_by_user_id(
 
 
 @router.post("/new", response_model=Optional[ChatResponse])
-async def create_new_chat(form_data: ChatForm, user=Depends(get_verified_user)):
+def create_new_chat(form_data: ChatForm, user=Depends(get_verified_user)):
     try:
         chat = Chats.insert_new_chat(user.id, form_data)
         return ChatResponse(**{**chat.model_dump(), "chat": json.loads(chat.chat)})
@@ -109,7 +159,7 @@ async def create_new_chat(form_data: ChatForm, user=Depends(get_verified_user)):
 
 
 @router.get("/all", response_model=List[ChatResponse])
-async def get_user_chats(user=Depends(get_verified_user)):
+def get_user_chats(user=Depends(get_verified_user)):
     return [
         ChatResponse(**{**chat.model_dump(), "chat": json.loads(chat.chat)})
         for chat in Chats.get_chats_by_user_id(user.id)
@@ -122,7 +172,7 @@ async def get_user_chats(user=Depends(get_verified_user)):
 
 
 @router.get("/all/archived", response_model=List[ChatResponse])
-async def get_user_archived_chats(user=Depends(get_verified_user)):
+def get_user_archived_chats(user=Depends(get_verified_user)):
     return [
         ChatResponse(**{**chat.model_dump(), "chat": json.loads(chat.chat)})
         for chat in Chats.get_archived_chats_by_user_id(user.id)
@@ -135,7 +185,7 @@ async def get_user_archived_chats(user=Depends(get_verified_user)):
 
 
 @router.get("/all/db", response_model=List[ChatResponse])
-async def get_all_user_chats_in_db(user=Depends(get_admin_user)):
+def get_all_user_chats_in_db(user=Depends(get_admin_user)):
     if not ENABLE_ADMIN_EXPORT:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -153,10 +203,20 @@ async def get_all_user_chats_in_db(user=Depends(get_admin_user)):
 
 
 @router.get("/archived", response_model=List[ChatTitleIdResponse])
-async def get_archived_session_user_chat_list(
-    user=Depends(get_verified_user), skip: int = 0, limit: int = 50
+def get_archived_session_user_chat_list(
+    response: Response,
+    user=Depends(get_verified_user),
+    skip: int = 0,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
 ):
-    return Chats.get_archived_chat_list_by_user_id(user.id, skip, limit)
+    return get_chat_page(
+        response,
+        lambda **page: Chats.get_archived_chat_list_by_user_id(user.id, **page),
+        skip,
+        limit,
+        cursor,
+    )
 
 
 ############################
@@ -165,7 +225,7 @@ async def get_archived_session_user_chat_list(
 
 
 @router.post("/archive/all", response_model=bool)
-async def archive_all_chats(user=Depends(get_verified_user)):
+def archive_all_chats(user=Depends(get_verified_user)):
     return Chats.archive_all_chats_by_user_id(user.id)
 
 
@@ -175,7 +235,7 @@ async def archive_all_chats(user=Depends(get_verified_user)):
 
 
 @router.get("/share/{share_id}", response_model=Optional[ChatResponse])
-async def get_shared_chat_by_id(share_id: str, user=Depends(get_verified_user)):
+def get_shared_chat_by_id(share_id: str, user=Depends(get_verified_user)):
     if user.role == "pending":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail=ERROR_MESSAGES.NOT_FOUND
@@ -206,7 +266,7 @@ class TagNameForm(BaseModel):
 
 
 @router.post("/tags", response_model=List[ChatTitleIdResponse])
-async def get_user_chat_list_by_tag_name(
+def get_user_chat_list_by_tag_name(
     form_data: TagNameForm, user=Depends(get_verified_user)
 ):
 
@@ -231,7 +291,7 @@ async def get_user_chat_list_by_tag_name(
 
 
 @router.get("/tags/all", response_model=List[TagModel])
-async def get_all_tags(user=Depends(get_verified_user)):
+def get_all_tags(user=Depends(get_verified_user)):
     try:
         tags = Tags.get_tags_by_user_id(user.id)
         return tags
@@ -248,7 +308,7 @@ async def get_all_tags(user=Depends(get_verified_user)):
 
 
 @router.get("/{id}", response_model=Optional[ChatResponse])
-async def get_chat_by_id(id: str, user=Depends(get_verified_user)):
+def get_chat_by_id(id: str, user=Depends(get_verified_user)):
     chat = Chats.get_chat_by_id_and_user_id(id, user.id)
 
     if chat:
@@ -265,9 +325,7 @@ async def get_chat_by_id(id: str, user=Depends(get_verified_user)):
 
 
 @router.post("/{id}", response_model=Optional[ChatResponse])
-async def update_chat_by_id(
-    id: str, form_data: ChatForm, user=Depends(get_verified_user)
-):
+def update_chat_by_id(id: str, form_data: ChatForm, user=Depends(get_verified_user)):
     chat = Chats.get_chat_by_id_and_user_id(id, user.id)
     if chat:
         updated_chat = {**json.loads(chat.chat), **form_data.chat}
@@ -287,7 +345,7 @@ async def update_chat_by_id(
 
 
 @router.delete("/{id}", response_model=bool)
-async def delete_chat_by_id(request: Request, id: str, user=Depends(get_verified_user)):
+def delete_chat_by_id(request: Request, id: str, user=Depends(get_verified_user)):
 
     if user.role == "admin":
         result = Chats.delete_chat_by_id(id)
@@ -309,7 +367,7 @@ async def delete_chat_by_id(request: Request, id: str, user=Depends(get_verified
 
 
 @router.get("/{id}/clone", response_model=Optional[ChatResponse])
-async def clone_chat_by_id(id: str, user=Depends(get_verified_user)):
+def clone_chat_by_id(id: str, user=Depends(get_verified_user)):
     chat = Chats.get_chat_by_id_and_user_id(id, user.id)
     if chat:
 
@@ -335,7 +393,7 @@ async def clone_chat_by_id(id: str, user=Depends(get_verified_user)):
 
 
 @router.get("/{id}/archive", response_model=Optional[ChatResponse])
-async def archive_chat_by_id(id: str, user=Depends(get_verified_user)):
+def archive_chat_by_id(id: str, user=Depends(get_verified_user)):
     chat = Chats.get_chat_by_id_and_user_id(id, user.id)
     if chat:
         chat = Chats.toggle_chat_archive_by_id(id)
@@ -352,7 +410,7 @@ async def archive_chat_by_id(id: str, user=Depends(get_verified_user)):
 
 
 @router.post("/{id}/share", response_model=Optional[ChatResponse])
-async def share_chat_by_id(id: str, user=Depends(get_verified_user)):
+def share_chat_by_id(id: str, user=Depends(get_verified_user)):
     chat = Chats.get_chat_by_id_and_user_id(id, user.id)
     if chat:
         if chat.share_id:
@@ -384,7 +442,7 @@ async def share_chat_by_id(id: str, user=Depends(get_verified_user)):
 
 
 @router.delete("/{id}/share", response_model=Optional[bool])
-async def delete_shared_chat_by_id(id: str, user=Depends(get_verified_user)):
+def delete_shared_chat_by_id(id: str, user=Depends(get_verified_user)):
     chat = Chats.get_chat_by_id_and_user_id(id, user.id)
     if chat:
         if not chat.share_id:
@@ -407,7 +465,7 @@ async def delete_shared_chat_by_id(id: str, user=Depends(get_verified_user)):
 
 
 @router.get("/{id}/tags", response_model=List[TagModel])
-async def get_chat_tags_by_id(id: str, user=Depends(get_verified_user)):
+def get_chat_tags_by_id(id: str, user=Depends(get_verified_user)):
     tags = Tags.get_tags_by_chat_id_and_user_id(id, user.id)
 
     if tags != None:
@@ -424,7 +482,7 @@ async def get_chat_tags_by_id(id: str, user=Depends(get_verified_user)):
 
 
 @router.post("/{id}/tags", response_model=Optional[ChatIdTagModel])
-async def add_chat_tag_by_id(
+def add_chat_tag_by_id(
     id: str, form_data: ChatIdTagForm, user=Depends(get_verified_user)
 ):
     tags = Tags.get_tags_by_chat_id_and_user_id(id, user.id)
@@ -451,7 +509,7 @@ async def add_chat_tag_by_id(
 
 
 @router.delete("/{id}/tags", response_model=Optional[bool])
-async def delete_chat_tag_by_id(
+def delete_chat_tag_by_id(
     id: str, form_data: ChatIdTagForm, user=Depends(get_verified_user)
 ):
     result = Tags.delete_tag_by_tag_name_and_chat_id_and_user_id(
@@ -472,7 +530,7 @@ async def delete_chat_tag_by_id(
 
 
 @router.delete("/{id}/tags/all", response_model=Optional[bool])
-async def delete_all_chat_tags_by_id(id: str, user=Depends(get_verified_user)):
+def delete_all_chat_tags_by_id(id: str, user=Depends(get_verified_user)):
     result = Tags.delete_tags_by_chat_id_and_user_id(id, user.id)
 
     if result:
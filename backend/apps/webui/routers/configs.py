@@ -43,7 +43,7 @@ class SetDefaultSuggestionsForm(BaseModel):
 
 
 @router.post("/default/models", response_model=str)
-async def set_global_default_models(
+def set_global_default_models(
     request: Request, form_data: SetDefaultModelsForm, user=Depends(get_admin_user)
 ):
     request.app.state.config.DEFAULT_MODELS = form_data.models
@@ -51,7 +51,7 @@ async def set_global_default_models(
 
 
 @router.post("/default/suggestions", response_model=List[PromptSuggestion])
-async def set_global_default_suggestions(
+def set_global_default_suggestions(
     request: Request,
     form_data: SetDefaultSuggestionsForm,
     user=Depends(get_admin_user),
@@ -71,7 +71,7 @@ class SetBannersForm(BaseModel):
 
 
 @router.post("/banners", response_model=List[BannerModel])
-async def set_banners(
+def set_banners(
     request: Request,
     form_data: SetBannersForm,
     user=Depends(get_admin_user),
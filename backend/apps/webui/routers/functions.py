@@ -14,6 +14,8 @@ from apps.webui.models.functions import (
 )
 from apps.webui.utils import load_function_module_by_id
 from utils.utils import get_verified_user, get_admin_user
+from utils.catalog import model_catalog
+from utils.registry import function_registry
 from constants import ERROR_MESSAGES
 
 from importlib import util
@@ -31,7 +33,7 @@ router = APIRouter()
 
 
 @router.get("/", response_model=List[FunctionResponse])
-async def get_functions(user=Depends(get_verified_user)):
+def get_functions(user=Depends(get_verified_user)):
     return Functions.get_functions()
 
 
@@ -41,7 +43,7 @@ async def get_functions(user=Depends(get_verified_user)):
 
 
 @router.get("/export", response_model=List[FunctionModel])
-async def get_functions(user=Depends(get_admin_user)):
+def get_functions(user=Depends(get_admin_user)):
     return Functions.get_functions()
 
 
@@ -51,7 +53,7 @@ async def get_functions(user=Depends(get_admin_user)):
 
 
 @router.post("/create", response_model=Optional[FunctionResponse])
-async def create_new_function(
+def create_new_function(
     request: Request, form_data: FunctionForm, user=Depends(get_admin_user)
 ):
     if not form_data.id.isidentifier():
@@ -83,6 +85,8 @@ async def create_new_function(
             function_cache_dir.mkdir(parents=True, exist_ok=True)
 
             if function:
+                model_catalog.invalidate()
+                function_registry.invalidate_function(form_data.id)
                 return function
             else:
                 raise HTTPException(
@@ -108,7 +112,7 @@ async def create_new_function(
 
 
 @router.get("/id/{id}", response_model=Optional[FunctionModel])
-async def get_function_by_id(id: str, user=Depends(get_admin_user)):
+def get_function_by_id(id: str, user=Depends(get_admin_user)):
     function = Functions.get_function_by_id(id)
 
     if function:
@@ -126,7 +130,7 @@ async def get_function_by_id(id: str, user=Depends(get_admin_user)):
 
 
 @router.post("/id/{id}/toggle", response_model=Optional[FunctionModel])
-async def toggle_function_by_id(id: str, user=Depends(get_admin_user)):
+def toggle_function_by_id(id: str, user=Depends(get_admin_user)):
     function = Functions.get_function_by_id(id)
     if function:
         function = Functions.update_function_by_id(
@@ -134,6 +138,8 @@ async def toggle_function_by_id(id: str, user=Depends(get_admin_user)):
         )
 
         if function:
+            model_catalog.invalidate()
+            function_registry.invalidate_function(id)
             return function
         else:
             raise HTTPException(
@@ -153,7 +159,7 @@ async def toggle_function_by_id(id: str, user=Depends(get_admin_user)):
 
 
 @router.post("/id/{id}/toggle/global", response_model=Optional[FunctionModel])
-async def toggle_global_by_id(id: str, user=Depends(get_admin_user)):
+def toggle_global_by_id(id: str, user=Depends(get_admin_user)):
     function = Functions.get_function_by_id(id)
     if function:
         function = Functions.update_function_by_id(
@@ -161,6 +167,8 @@ async def toggle_global_by_id(id: str, user=Depends(get_admin_user)):
         )
 
         if function:
+            model_catalog.invalidate()
+            function_registry.invalidate_function(id)
             return function
         else:
             raise HTTPException(
@@ -180,7 +188,7 @@ async def toggle_global_by_id(id: str, user=Depends(get_admin_user)):
 
 
 @router.post("/id/{id}/update", response_model=Optional[FunctionModel])
-async def update_function_by_id(
+def update_function_by_id(
     request: Request, id: str, form_data: FunctionForm, user=Depends(get_admin_user)
 ):
     function_path = os.path.join(FUNCTIONS_DIR, f"{id}.py")
@@ -201,6 +209,8 @@ async def update_function_by_id(
         function = Functions.update_function_by_id(id, updated)
 
         if function:
+            model_catalog.invalidate()
+            function_registry.invalidate_function(id)
             return function
         else:
             raise HTTPException(
@@ -221,12 +231,12 @@ async def update_function_by_id(
 
 
 @router.delete("/id/{id}/delete", response_model=bool)
-async def delete_function_by_id(
-    request: Request, id: str, user=Depends(get_admin_user)
-):
+def delete_function_by_id(request: Request, id: str, user=Depends(get_admin_user)):
     result = Functions.delete_function_by_id(id)
 
     if result:
+        model_catalog.invalidate()
+        function_registry.invalidate_function(id)
         FUNCTIONS = request.app.state.FUNCTIONS
         if id in FUNCTIONS:
             del FUNCTIONS[id]
@@ -247,7 +257,7 @@ async def delete_function_by_id(
 
 
 @router.get("/id/{id}/valves", response_model=Optional[dict])
-async def get_function_valves_by_id(id: str, user=Depends(get_admin_user)):
+def get_function_valves_by_id(id: str, user=Depends(get_admin_user)):
     function = Functions.get_function_by_id(id)
     if function:
         try:
@@ -271,7 +281,7 @@ async def get_function_valves_by_id(id: str, user=Depends(get_admin_user)):
 
 
 @router.get("/id/{id}/valves/spec", response_model=Optional[dict])
-async def get_function_valves_spec_by_id(
+def get_function_valves_spec_by_id(
     request: Request, id: str, user=Depends(get_admin_user)
 ):
     function = Functions.get_function_by_id(id)
@@ -299,7 +309,7 @@ async def get_function_valves_spec_by_id(
 
 
 @router.post("/id/{id}/valves/update", response_model=Optional[dict])
-async def update_function_valves_by_id(
+def update_function_valves_by_id(
     request: Request, id: str, form_data: dict, user=Depends(get_admin_user)
 ):
     function = Functions.get_function_by_id(id)
@@ -318,6 +328,8 @@ async def update_function_valves_by_id(
                 form_data = {k: v for k, v in form_data.items() if v is not None}
                 valves = Valves(**form_data)
                 Functions.update_function_valves_by_id(id, valves.model_dump())
+                model_catalog.invalidate()
+                function_registry.invalidate_function(id)
                 return valves.model_dump()
             except Exception as e:
                 print(e)
@@ -344,7 +356,7 @@ async def update_function_valves_by_id(
 
 
 @router.get("/id/{id}/valves/user", response_model=Optional[dict])
-async def get_function_user_valves_by_id(id: str, user=Depends(get_verified_user)):
+def get_function_user_valves_by_id(id: str, user=Depends(get_verified_user)):
     function = Functions.get_function_by_id(id)
     if function:
         try:
@@ -363,7 +375,7 @@ async def get_function_user_valves_by_id(id: str, user=Depends(get_verified_user
 
 
 @router.get("/id/{id}/valves/user/spec", response_model=Optional[dict])
-async def get_function_user_valves_spec_by_id(
+def get_function_user_valves_spec_by_id(
     request: Request, id: str, user=Depends(get_verified_user)
 ):
     function = Functions.get_function_by_id(id)
@@ -386,7 +398,7 @@ async def get_function_user_valves_spec_by_id(
 
 
 @router.post("/id/{id}/valves/user/update", response_model=Optional[dict])
-async def update_function_user_valves_by_id(
+def update_function_user_valves_by_id(
     request: Request, id: str, form_data: dict, user=Depends(get_verified_user)
 ):
     function = Functions.get_function_by_id(id)
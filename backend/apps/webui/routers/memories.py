@@ -21,7 +21,7 @@ router = APIRouter()
 
 
 @router.get("/ef")
-async def get_embeddings(request: Request):
+def get_embeddings(request: Request):
     return {"result": request.app.state.EMBEDDING_FUNCTION("hello world")}
 
 
@@ -31,7 +31,7 @@ async def get_embeddings(request: Request):
 
 
 @router.get("/", response_model=List[MemoryModel])
-async def get_memories(user=Depends(get_verified_user)):
+def get_memories(user=Depends(get_verified_user)):
     return Memories.get_memories_by_user_id(user.id)
 
 
@@ -49,7 +49,7 @@ class MemoryUpdateModel(BaseModel):
 
 
 @router.post("/add", response_model=Optional[MemoryModel])
-async def add_memory(
+def add_memory(
     request: Request,
     form_data: AddMemoryForm,
     user=Depends(get_verified_user),
@@ -69,7 +69,7 @@ async def add_memory(
 
 
 @router.post("/{memory_id}/update", response_model=Optional[MemoryModel])
-async def update_memory_by_id(
+def update_memory_by_id(
     memory_id: str,
     request: Request,
     form_data: MemoryUpdateModel,
@@ -107,7 +107,7 @@ class QueryMemoryForm(BaseModel):
 
 
 @router.post("/query")
-async def query_memory(
+def query_memory(
     request: Request, form_data: QueryMemoryForm, user=Depends(get_verified_user)
 ):
     query_embedding = request.app.state.EMBEDDING_FUNCTION(form_data.content)
@@ -125,9 +125,7 @@ async def query_memory(
 # ResetMemoryFromVectorDB
 ############################
 @router.get("/reset", response_model=bool)
-async def reset_memory_from_vector_db(
-    request: Request, user=Depends(get_verified_user)
-):
+def reset_memory_from_vector_db(request: Request, user=Depends(get_verified_user)):
     CHROMA_CLIENT.delete_collection(f"user-memory-{user.id}")
     collection = CHROMA_CLIENT.get_or_create_collection(name=f"user-memory-{user.id}")
 
@@ -148,7 +146,7 @@ async def reset_memory_from_vector_db(
 
 
 @router.delete("/user", response_model=bool)
-async def delete_memory_by_user_id(user=Depends(get_verified_user)):
+def delete_memory_by_user_id(user=Depends(get_verified_user)):
     result = Memories.delete_memories_by_user_id(user.id)
 
     if result:
@@ -167,7 +165,7 @@ async def delete_memory_by_user_id(user=Depends(get_verified_user)):
 
 
 @router.delete("/{memory_id}", response_model=bool)
-async def delete_memory_by_id(memory_id: str, user=Depends(get_verified_user)):
+def delete_memory_by_id(memory_id: str, user=Depends(get_verified_user)):
     result = Memories.delete_memory_by_id_and_user_id(memory_id, user.id)
 
     if result:
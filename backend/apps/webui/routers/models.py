@@ -9,6 +9,7 @@ import json
 from apps.webui.models.models import Models, ModelModel, ModelForm, ModelResponse
 
 from utils.utils import get_verified_user, get_admin_user
+from utils.catalog import model_catalog
 from constants import ERROR_MESSAGES
 
 router = APIRouter()
@@ -19,7 +20,7 @@ router = APIRouter()
 
 
 @router.get("/", response_model=List[ModelResponse])
-async def get_models(user=Depends(get_verified_user)):
+def get_models(user=Depends(get_verified_user)):
     return Models.get_all_models()
 
 
@@ -29,7 +30,7 @@ async def get_models(user=Depends(get_verified_user)):
 
 
 @router.post("/add", response_model=Optional[ModelModel])
-async def add_new_model(
+def add_new_model(
     request: Request,
     form_data: ModelForm,
     user=Depends(get_admin_user),
@@ -43,6 +44,7 @@ async def add_new_model(
         model = Models.insert_new_model(form_data, user.id)
 
         if model:
+            model_catalog.invalidate()
             return model
         else:
             raise HTTPException(
@@ -57,7 +59,7 @@ async def add_new_model(
 
 
 @router.get("/", response_model=Optional[ModelModel])
-async def get_model_by_id(id: str, user=Depends(get_verified_user)):
+def get_model_by_id(id: str, user=Depends(get_verified_user)):
     model = Models.get_model_by_id(id)
 
     if model:
@@ -75,7 +77,7 @@ async def get_model_by_id(id: str, user=Depends(get_verified_user)):
 
 
 @router.post("/update", response_model=Optional[ModelModel])
-async def update_model_by_id(
+def update_model_by_id(
     request: Request,
     id: str,
     form_data: ModelForm,
@@ -84,11 +86,13 @@ async def update_model_by_id(
     model = Models.get_model_by_id(id)
     if model:
         model = Models.update_model_by_id(id, form_data)
+        model_catalog.invalidate()
         return model
     else:
         if form_data.id in request.app.state.MODELS:
             model = Models.insert_new_model(form_data, user.id)
             if model:
+                model_catalog.invalidate()
                 return model
             else:
                 raise HTTPException(
@@ -108,6 +112,7 @@ async def update_model_by_id(
 
 
 @router.delete("/delete", response_model=bool)
-async def delete_model_by_id(id: str, user=Depends(get_admin_user)):
+def delete_model_by_id(id: str, user=Depends(get_admin_user)):
     result = Models.delete_model_by_id(id)
+    model_catalog.invalidate()
     return result
@@ -12,6 +12,7 @@ from apps.webui.utils import load_toolkit_module_by_id
 
 from utils.utils import get_admin_user, get_verified_user
 from utils.tools import get_tools_specs
+from utils.registry import function_registry
 from constants import ERROR_MESSAGES
 
 from importlib import util
@@ -33,7 +34,7 @@ router = APIRouter()
 
 
 @router.get("/", response_model=List[ToolResponse])
-async def get_toolkits(user=Depends(get_verified_user)):
+def get_toolkits(user=Depends(get_verified_user)):
     toolkits = [toolkit for toolkit in Tools.get_tools()]
     return toolkits
 
@@ -44,7 +45,7 @@ async def get_toolkits(user=Depends(get_verified_user)):
 
 
 @router.get("/export", response_model=List[ToolModel])
-async def get_toolkits(user=Depends(get_admin_user)):
+def get_toolkits(user=Depends(get_admin_user)):
     toolkits = [toolkit for toolkit in Tools.get_tools()]
     return toolkits
 
@@ -55,7 +56,7 @@ async def get_toolkits(user=Depends(get_admin_user)):
 
 
 @router.post("/create", response_model=Optional[ToolResponse])
-async def create_new_toolkit(
+def create_new_toolkit(
     request: Request,
     form_data: ToolForm,
     user=Depends(get_admin_user),
@@ -88,6 +89,7 @@ async def create_new_toolkit(
             tool_cache_dir.mkdir(parents=True, exist_ok=True)
 
             if toolkit:
+                function_registry.invalidate_tool(form_data.id)
                 return toolkit
             else:
                 raise HTTPException(
@@ -113,7 +115,7 @@ async def create_new_toolkit(
 
 
 @router.get("/id/{id}", response_model=Optional[ToolModel])
-async def get_toolkit_by_id(id: str, user=Depends(get_admin_user)):
+def get_toolkit_by_id(id: str, user=Depends(get_admin_user)):
     toolkit = Tools.get_tool_by_id(id)
 
     if toolkit:
@@ -131,7 +133,7 @@ async def get_toolkit_by_id(id: str, user=Depends(get_admin_user)):
 
 
 @router.post("/id/{id}/update", response_model=Optional[ToolModel])
-async def update_toolkit_by_id(
+def update_toolkit_by_id(
     request: Request,
     id: str,
     form_data: ToolForm,
@@ -160,6 +162,7 @@ async def update_toolkit_by_id(
         toolkit = Tools.update_tool_by_id(id, updated)
 
         if toolkit:
+            function_registry.invalidate_tool(id)
             return toolkit
         else:
             raise HTTPException(
@@ -180,10 +183,11 @@ async def update_toolkit_by_id(
 
 
 @router.delete("/id/{id}/delete", response_model=bool)
-async def delete_toolkit_by_id(request: Request, id: str, user=Depends(get_admin_user)):
+def delete_toolkit_by_id(request: Request, id: str, user=Depends(get_admin_user)):
     result = Tools.delete_tool_by_id(id)
 
     if result:
+        function_registry.invalidate_tool(id)
         TOOLS = request.app.state.TOOLS
         if id in TOOLS:
             del TOOLS[id]
@@ -201,7 +205,7 @@ async def delete_toolkit_by_id(request: Request, id: str, user=Depends(get_admin
 
 
 @router.get("/id/{id}/valves", response_model=Optional[dict])
-async def get_toolkit_valves_by_id(id: str, user=Depends(get_admin_user)):
+def get_toolkit_valves_by_id(id: str, user=Depends(get_admin_user)):
     toolkit = Tools.get_tool_by_id(id)
     if toolkit:
         try:
@@ -225,7 +229,7 @@ async def get_toolkit_valves_by_id(id: str, user=Depends(get_admin_user)):
 
 
 @router.get("/id/{id}/valves/spec", response_model=Optional[dict])
-async def get_toolkit_valves_spec_by_id(
+def get_toolkit_valves_spec_by_id(
     request: Request, id: str, user=Depends(get_admin_user)
 ):
     toolkit = Tools.get_tool_by_id(id)
@@ -253,7 +257,7 @@ async def get_toolkit_valves_spec_by_id(
 
 
 @router.post("/id/{id}/valves/update", response_model=Optional[dict])
-async def update_toolkit_valves_by_id(
+def update_toolkit_valves_by_id(
     request: Request, id: str, form_data: dict, user=Depends(get_admin_user)
 ):
     toolkit = Tools.get_tool_by_id(id)
@@ -271,6 +275,7 @@ async def update_toolkit_valves_by_id(
                 form_data = {k: v for k, v in form_data.items() if v is not None}
                 valves = Valves(**form_data)
                 Tools.update_tool_valves_by_id(id, valves.model_dump())
+                function_registry.invalidate_tool(id)
                 return valves.model_dump()
             except Exception as e:
                 print(e)
@@ -297,7 +302,7 @@ async def update_toolkit_valves_by_id(
 
 
 @router.get("/id/{id}/valves/user", response_model=Optional[dict])
-async def get_toolkit_user_valves_by_id(id: str, user=Depends(get_verified_user)):
+def get_toolkit_user_valves_by_id(id: str, user=Depends(get_verified_user)):
     toolkit = Tools.get_tool_by_id(id)
     if toolkit:
         try:
@@ -316,7 +321,7 @@ async def get_toolkit_user_valves_by_id(id: str, user=Depends(get_verified_user)
 
 
 @router.get("/id/{id}/valves/user/spec", response_model=Optional[dict])
-async def get_toolkit_user_valves_spec_by_id(
+def get_toolkit_user_valves_spec_by_id(
     request: Request, id: str, user=Depends(get_verified_user)
 ):
     toolkit = Tools.get_tool_by_id(id)
@@ -339,7 +344,7 @@ async def get_toolkit_user_valves_spec_by_id(
 
 
 @router.post("/id/{id}/valves/user/update", response_model=Optional[dict])
-async def update_toolkit_user_valves_by_id(
+def update_toolkit_user_valves_by_id(
     request: Request, id: str, form_data: dict, user=Depends(get_verified_user)
 ):
     toolkit = Tools.get_tool_by_id(id)
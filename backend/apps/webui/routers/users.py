@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from typing import List, Union, Optional
 
 from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import time
 import uuid
@@ -25,6 +26,7 @@ from utils.utils import (
     get_current_user,
     get_admin_user,
 )
+from utils.passwords import password_executor
 from constants import ERROR_MESSAGES
 
 from config import SRC_LOG_LEVELS
@@ -40,7 +42,7 @@ router = APIRouter()
 
 
 @router.get("/", response_model=List[UserModel])
-async def get_users(skip: int = 0, limit: int = 50, user=Depends(get_admin_user)):
+def get_users(skip: int = 0, limit: int = 50, user=Depends(get_admin_user)):
     return Users.get_users(skip, limit)
 
 
@@ -55,7 +57,7 @@ async def get_user_permissions(request: Request, user=Depends(get_admin_user)):
 
 
 @router.post("/permissions/user")
-async def update_user_permissions(
+def update_user_permissions(
     request: Request, form_data: dict, user=Depends(get_admin_user)
 ):
     request.app.state.config.USER_PERMISSIONS = form_data
@@ -68,7 +70,7 @@ async def update_user_permissions(
 
 
 @router.post("/update/role", response_model=Optional[UserModel])
-async def update_user_role(form_data: UserRoleUpdateForm, user=Depends(get_admin_user)):
+def update_user_role(form_data: UserRoleUpdateForm, user=Depends(get_admin_user)):
 
     if user.id != form_data.id and form_data.id != Users.get_first_user().id:
         return Users.update_user_role_by_id(form_data.id, form_data.role)
@@ -85,7 +87,7 @@ async def update_user_role(form_data: UserRoleUpdateForm, user=Depends(get_admin
 
 
 @router.get("/user/settings", response_model=Optional[UserSettings])
-async def get_user_settings_by_session_user(user=Depends(get_verified_user)):
+def get_user_settings_by_session_user(user=Depends(get_verified_user)):
     user = Users.get_user_by_id(user.id)
     if user:
         return user.settings
@@ -102,7 +104,7 @@ async def get_user_settings_by_session_user(user=Depends(get_verified_user)):
 
 
 @router.post("/user/settings/update", response_model=UserSettings)
-async def update_user_settings_by_session_user(
+def update_user_settings_by_session_user(
     form_data: UserSettings, user=Depends(get_verified_user)
 ):
     user = Users.update_user_by_id(user.id, {"settings": form_data.model_dump()})
@@ -121,7 +123,7 @@ async def update_user_settings_by_session_user(
 
 
 @router.get("/user/info", response_model=Optional[dict])
-async def get_user_info_by_session_user(user=Depends(get_verified_user)):
+def get_user_info_by_session_user(user=Depends(get_verified_user)):
     user = Users.get_user_by_id(user.id)
     if user:
         return user.info
@@ -138,9 +140,7 @@ async def get_user_info_by_session_user(user=Depends(get_verified_user)):
 
 
 @router.post("/user/info/update", response_model=Optional[dict])
-async def update_user_info_by_session_user(
-    form_data: dict, user=Depends(get_verified_user)
-):
+def update_user_info_by_session_user(form_data: dict, user=Depends(get_verified_user)):
     user = Users.get_user_by_id(user.id)
     if user:
         if user.info is None:
@@ -172,7 +172,7 @@ class UserResponse(BaseModel):
 
 
 @router.get("/{user_id}", response_model=UserResponse)
-async def get_user_by_id(user_id: str, user=Depends(get_verified_user)):
+def get_user_by_id(user_id: str, user=Depends(get_verified_user)):
 
     # Check if user_id is a shared chat
     # If it is, get the user_id from the chat
@@ -209,11 +209,13 @@ async def update_user_by_id(
     form_data: UserUpdateForm,
     session_user=Depends(get_admin_user),
 ):
-    user = Users.get_user_by_id(user_id)
+    user = await run_in_threadpool(Users.get_user_by_id, user_id)
 
     if user:
         if form_data.email.lower() != user.email:
-            email_user = Users.get_user_by_email(form_data.email.lower())
+            email_user = await run_in_threadpool(
+                Users.get_user_by_email, form_data.email.lower()
+            )
             if email_user:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -221,12 +223,15 @@ async def update_user_by_id(
                 )
 
         if form_data.password:
-            hashed = get_password_hash(form_data.password)
+            hashed = await password_executor.run(get_password_hash, form_data.password)
             log.debug(f"hashed: {hashed}")
-            Auths.update_user_password_by_id(user_id, hashed)
+            await run_in_threadpool(Auths.update_user_password_by_id, user_id, hashed)
 
-        Auths.update_email_by_id(user_id, form_data.email.lower())
-        updated_user = Users.update_user_by_id(
+        await run_in_threadpool(
+            Auths.update_email_by_id, user_id, form_data.email.lower()
+        )
+        updated_user = await run_in_threadpool(
+            Users.update_user_by_id,
             user_id,
             {
                 "name": form_data.name,
@@ -255,7 +260,7 @@ async def update_user_by_id(
 
 
 @router.delete("/{user_id}", response_model=bool)
-async def delete_user_by_id(user_id: str, user=Depends(get_admin_user)):
+def delete_user_by_id(user_id: str, user=Depends(get_admin_user)):
     if user.id != user_id:
         result = Auths.delete_auth_by_id(user_id)
 
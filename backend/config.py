@@ -553,6 +553,20 @@ Path(TOOLS_DIR).mkdir(parents=True, exist_ok=True)
 FUNCTIONS_DIR = os.getenv("FUNCTIONS_DIR", f"{DATA_DIR}/functions")
 Path(FUNCTIONS_DIR).mkdir(parents=True, exist_ok=True)
 
+# "inline" runs tools and functions in the server process, "process" runs them
+# in a pool of FUNCTIONS_WORKERS worker processes, each call given
+# FUNCTIONS_WORKER_TIMEOUT seconds and each worker FUNCTIONS_WORKER_MEMORY_LIMIT
+# MB of address space (0 for no limit)
+FUNCTIONS_EXECUTION_MODE = os.environ.get("FUNCTIONS_EXECUTION_MODE", "inline")
+FUNCTIONS_WORKERS = int(os.environ.get("FUNCTIONS_WORKERS", "2"))
+FUNCTIONS_WORKER_TIMEOUT = float(os.environ.get("FUNCTIONS_WORKER_TIMEOUT", "60"))
+FUNCTIONS_WORKER_MEMORY_LIMIT = int(
+    os.environ.get("FUNCTIONS_WORKER_MEMORY_LIMIT", "1024")
+)
+
+# Threads that drive the sync generators of pipes, one per streaming response
+FUNCTIONS_STREAM_THREADS = int(os.environ.get("FUNCTIONS_STREAM_THREADS", "64"))
+
 
 ####################################
 # LITELLM_CONFIG
@@ -613,6 +627,83 @@ else:
     except:
         AIOHTTP_CLIENT_TIMEOUT = 300
 
+# Pooled upstream connections, see utils/upstream.py
+AIOHTTP_CLIENT_LIMIT_PER_HOST = int(
+    os.environ.get("AIOHTTP_CLIENT_LIMIT_PER_HOST", "100")
+)
+AIOHTTP_CLIENT_KEEPALIVE_TIMEOUT = float(
+    os.environ.get("AIOHTTP_CLIENT_KEEPALIVE_TIMEOUT", "60")
+)
+AIOHTTP_CLIENT_DNS_CACHE_TTL = int(
+    os.environ.get("AIOHTTP_CLIENT_DNS_CACHE_TTL", "300")
+)
+
+# Upstream health checks and circuit breakers, see utils/upstream.py
+UPSTREAM_HEALTH_CHECK_INTERVAL = int(
+    os.environ.get("UPSTREAM_HEALTH_CHECK_INTERVAL", "10")
+)
+UPSTREAM_HEALTH_CHECK_TIMEOUT = float(
+    os.environ.get("UPSTREAM_HEALTH_CHECK_TIMEOUT", "3")
+)
+UPSTREAM_FAILURE_THRESHOLD = int(os.environ.get("UPSTREAM_FAILURE_THRESHOLD", "3"))
+UPSTREAM_RECOVERY_TIMEOUT = float(os.environ.get("UPSTREAM_RECOVERY_TIMEOUT", "30"))
+
+# Seconds a successful upstream read (model lists, versions) is shared with
+# identical requests, concurrent identical reads are always coalesced
+UPSTREAM_COALESCE_TTL = float(os.environ.get("UPSTREAM_COALESCE_TTL", "1"))
+
+# Seconds a Pipelines filter may take for its inlet or outlet before it is skipped
+PIPELINES_FILTER_TIMEOUT = float(os.environ.get("PIPELINES_FILTER_TIMEOUT", "30"))
+
+# Seconds the model list is served from cache before it is rebuilt in the background
+MODELS_CACHE_TTL = int(os.environ.get("MODELS_CACHE_TTL", "60"))
+
+# Seconds the models of a manifold pipe are cached, and how long the model list
+# waits for a manifold that has no cached models yet
+PIPE_MODELS_CACHE_TTL = int(os.environ.get("PIPE_MODELS_CACHE_TTL", "300"))
+PIPE_MODELS_TIMEOUT = float(os.environ.get("PIPE_MODELS_TIMEOUT", "10"))
+
+# Seconds an authenticated user is served from cache, and how often the
+# last_active_at of users seen since the last flush is written in one batch
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "10"))
+USER_LAST_ACTIVE_FLUSH_INTERVAL = float(
+    os.environ.get("USER_LAST_ACTIVE_FLUSH_INTERVAL", "30")
+)
+
+# Threads that hash and verify passwords off the event loop, and how many more
+# requests may wait for one before sign-ins are rejected with a 429
+PASSWORD_HASHING_THREADS = int(
+    os.environ.get("PASSWORD_HASHING_THREADS", str(min(4, os.cpu_count() or 1)))
+)
+PASSWORD_HASHING_QUEUE_SIZE = int(os.environ.get("PASSWORD_HASHING_QUEUE_SIZE", "128"))
+
+# Threads that run sync endpoints, such as the webui routers doing database I/O,
+# and run_in_threadpool calls. 0 keeps the anyio default of 40
+THREAD_POOL_SIZE = int(os.environ.get("THREAD_POOL_SIZE", "0"))
+
+# Admission control for chat completions, see utils/admission.py. Limits of 0
+# mean unlimited, UPSTREAM_CONCURRENCY_LIMITS overrides them for single backend
+# urls or model ids, e.g. {"http://gpu-1:11434": 2, "llama3:70b": 1}
+UPSTREAM_MAX_CONCURRENCY_PER_BACKEND = int(
+    os.environ.get("UPSTREAM_MAX_CONCURRENCY_PER_BACKEND", "0")
+)
+UPSTREAM_MAX_CONCURRENCY_PER_MODEL = int(
+    os.environ.get("UPSTREAM_MAX_CONCURRENCY_PER_MODEL", "0")
+)
+
+try:
+    UPSTREAM_CONCURRENCY_LIMITS = json.loads(
+        os.environ.get("UPSTREAM_CONCURRENCY_LIMITS", "{}")
+    )
+except Exception as e:
+    log.exception(f"Error loading UPSTREAM_CONCURRENCY_LIMITS: {e}")
+    UPSTREAM_CONCURRENCY_LIMITS = {}
+
+# Requests waiting per priority lane before new ones are rejected with a 429,
+# and seconds a request may wait for a slot before it fails with a 503
+UPSTREAM_QUEUE_SIZE = int(os.environ.get("UPSTREAM_QUEUE_SIZE", "100"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", "30"))
+
 
 K8S_FLAG = os.environ.get("K8S_FLAG", "")
 USE_OLLAMA_DOCKER = os.environ.get("USE_OLLAMA_DOCKER", "false")
@@ -644,6 +735,30 @@ OLLAMA_BASE_URLS = PersistentConfig(
     "OLLAMA_BASE_URLS", "ollama.base_urls", OLLAMA_BASE_URLS
 )
 
+# Relative capacity of each of OLLAMA_BASE_URLS for load balancing, defaults to 1
+OLLAMA_BASE_URL_WEIGHTS = os.environ.get("OLLAMA_BASE_URL_WEIGHTS", "")
+OLLAMA_BASE_URL_WEIGHTS = [
+    float(weight.strip() or "1")
+    for weight in OLLAMA_BASE_URL_WEIGHTS.split(";")
+    if OLLAMA_BASE_URL_WEIGHTS != ""
+]
+OLLAMA_BASE_URL_WEIGHTS = PersistentConfig(
+    "OLLAMA_BASE_URL_WEIGHTS", "ollama.base_url_weights", OLLAMA_BASE_URL_WEIGHTS
+)
+
+# "load" picks the least loaded node, "residency" also prefers nodes that have
+# the model loaded and keeps a chat on the same node
+OLLAMA_ROUTING_MODE = PersistentConfig(
+    "OLLAMA_ROUTING_MODE",
+    "ollama.routing_mode",
+    os.environ.get("OLLAMA_ROUTING_MODE", "load"),
+)
+
+# Seconds between polls of each node's loaded models (/api/ps) in residency mode
+OLLAMA_RESIDENCY_POLL_INTERVAL = int(
+    os.environ.get("OLLAMA_RESIDENCY_POLL_INTERVAL", "10")
+)
+
 ####################################
 # OPENAI_API
 ####################################
@@ -897,6 +1012,23 @@ If a function tool doesn't match the query, return an empty string. Else, pick a
     ),
 )
 
+# How the task model picks the functions of the tools enabled for a chat:
+# "per_tool" asks once per tool, "combined" once with the specs of all tools
+TOOLS_FUNCTION_CALLING_MODE = PersistentConfig(
+    "TOOLS_FUNCTION_CALLING_MODE",
+    "task.tools.mode",
+    os.environ.get("TOOLS_FUNCTION_CALLING_MODE", "per_tool"),
+)
+
+# Tools of a chat turn are selected and run concurrently, at most this many at
+# once, each given TOOLS_FUNCTION_CALLING_TIMEOUT seconds
+TOOLS_FUNCTION_CALLING_CONCURRENCY = int(
+    os.environ.get("TOOLS_FUNCTION_CALLING_CONCURRENCY", "4")
+)
+TOOLS_FUNCTION_CALLING_TIMEOUT = float(
+    os.environ.get("TOOLS_FUNCTION_CALLING_TIMEOUT", "60")
+)
+
 
 ####################################
 # WEBUI_SECRET_KEY
@@ -1065,6 +1197,13 @@ CHUNK_OVERLAP = PersistentConfig(
     int(os.environ.get("CHUNK_OVERLAP", "100")),
 )
 
+# "character" sizes chunks in characters, "token" in tokens of the embedding model
+RAG_TEXT_SPLITTER = PersistentConfig(
+    "RAG_TEXT_SPLITTER",
+    "rag.text_splitter",
+    os.environ.get("RAG_TEXT_SPLITTER", "character"),
+)
+
 DEFAULT_RAG_TEMPLATE = """Use the following context as your learned knowledge, inside <context></context> XML tags.
 <context>
     [context]
@@ -1197,6 +1336,43 @@ RAG_WEB_SEARCH_CONCURRENT_REQUESTS = PersistentConfig(
     int(os.getenv("RAG_WEB_SEARCH_CONCURRENT_REQUESTS", "10")),
 )
 
+# Query several engines (e.g. "searxng;duckduckgo") and keep the first unique results.
+# When empty, only RAG_WEB_SEARCH_ENGINE is used.
+RAG_WEB_SEARCH_ENGINES = PersistentConfig(
+    "RAG_WEB_SEARCH_ENGINES",
+    "rag.web.search.engines",
+    [
+        engine.strip()
+        for engine in os.getenv("RAG_WEB_SEARCH_ENGINES", "").split(";")
+        if engine.strip()
+    ],
+)
+
+# Seconds to wait on the engines in flight before querying the next one.
+# 0 queries every engine in RAG_WEB_SEARCH_ENGINES in parallel.
+RAG_WEB_SEARCH_HEDGE_DELAY = PersistentConfig(
+    "RAG_WEB_SEARCH_HEDGE_DELAY",
+    "rag.web.search.hedge_delay",
+    float(os.getenv("RAG_WEB_SEARCH_HEDGE_DELAY", "0")),
+)
+
+# 0 makes /web/search wait for every page. Otherwise it returns once this many
+# pages are indexed and the remaining pages are indexed in the background, while
+# the chat may already be retrieving from the collection.
+RAG_WEB_SEARCH_MIN_INDEXED_PAGES = PersistentConfig(
+    "RAG_WEB_SEARCH_MIN_INDEXED_PAGES",
+    "rag.web.search.min_indexed_pages",
+    int(os.getenv("RAG_WEB_SEARCH_MIN_INDEXED_PAGES", "0")),
+)
+
+# Web search collections (and the per-URL chunks they are built from) younger than
+# this many seconds are reused instead of being fetched and embedded again.
+RAG_WEB_SEARCH_CACHE_TTL = PersistentConfig(
+    "RAG_WEB_SEARCH_CACHE_TTL",
+    "rag.web.search.cache_ttl",
+    int(os.getenv("RAG_WEB_SEARCH_CACHE_TTL", "3600")),
+)
+
 
 ####################################
 # Transcribe
@@ -68,6 +68,16 @@ class ERROR_MESSAGES(str, Enum):
         lambda err="": f"Invalid format. Please use the correct format{err}"
     )
     RATE_LIMIT_EXCEEDED = "API rate limit exceeded"
+    INVALID_CURSOR = "The page cursor is invalid. Please reload the list."
+    UPSTREAM_QUEUE_FULL = (
+        lambda name="": f"Too many requests are waiting for '{name}'. Please try again shortly."
+    )
+    UPSTREAM_QUEUE_TIMEOUT = (
+        lambda name="": f"'{name}' is busy and did not accept the request in time. Please try again shortly."
+    )
+    PASSWORD_HASHING_BUSY = (
+        "Too many sign-ins are being processed. Please try again shortly."
+    )
 
     MODEL_NOT_FOUND = lambda name="": f"Model '{name}' was not found"
     OPENAI_NOT_FOUND = lambda name="": "OpenAI API was not found"
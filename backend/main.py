@@ -10,23 +10,26 @@ import os
 import sys
 import logging
 import aiohttp
+import asyncio
+import anyio
 import requests
 import mimetypes
 import shutil
 import os
 import uuid
 import inspect
+from functools import partial
 
 from fastapi import FastAPI, Request, Depends, status, UploadFile, File, Form
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import text
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.middleware.sessions import SessionMiddleware
-from starlette.responses import StreamingResponse, Response, RedirectResponse
+from starlette.responses import Response, RedirectResponse
 
 
 from apps.socket.main import sio, app as socket_app, get_event_emitter, get_event_call
@@ -34,11 +37,14 @@ from apps.ollama.main import (
     app as ollama_app,
     get_all_models as get_ollama_models,
     generate_openai_chat_completion as generate_ollama_chat_completion,
+    poll_resident_models as poll_ollama_resident_models,
+    check_health as check_ollama_health,
 )
 from apps.openai.main import (
     app as openai_app,
     get_all_models as get_openai_models,
     generate_chat_completion as generate_openai_chat_completion,
+    check_health as check_openai_health,
 )
 
 from apps.audio.main import app as audio_app
@@ -61,7 +67,6 @@ from apps.webui.models.tools import Tools
 from apps.webui.models.functions import Functions
 from apps.webui.models.users import Users
 
-from apps.webui.utils import load_toolkit_module_by_id, load_function_module_by_id
 
 from utils.utils import (
     get_admin_user,
@@ -75,6 +80,8 @@ from utils.task import (
     title_generation_template,
     search_query_generation_template,
     tools_function_calling_generation_template,
+    tools_function_calling_multi_generation_template,
+    parse_tool_calls,
 )
 from utils.misc import (
     get_last_user_message,
@@ -110,6 +117,9 @@ from config import (
     SEARCH_QUERY_GENERATION_PROMPT_TEMPLATE,
     SEARCH_QUERY_PROMPT_LENGTH_THRESHOLD,
     TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE,
+    TOOLS_FUNCTION_CALLING_MODE,
+    TOOLS_FUNCTION_CALLING_CONCURRENCY,
+    TOOLS_FUNCTION_CALLING_TIMEOUT,
     SAFE_MODE,
     OAUTH_PROVIDERS,
     ENABLE_OAUTH_SIGNUP,
@@ -118,10 +128,22 @@ from config import (
     WEBUI_SESSION_COOKIE_SAME_SITE,
     WEBUI_SESSION_COOKIE_SECURE,
     AppConfig,
+    UPSTREAM_HEALTH_CHECK_INTERVAL,
+    USER_LAST_ACTIVE_FLUSH_INTERVAL,
+    THREAD_POOL_SIZE,
 )
 
 from constants import ERROR_MESSAGES, WEBHOOK_MESSAGES, TASKS
 from utils.webhook import post_webhook
+from utils.asgi import ChatCompletionMiddleware
+from utils.pipelines import pipeline_filters, PipelineFilterError
+from utils.stages import StageRunner
+from utils.upstream import upstream_clients, upstream_reads, upstream_streams
+from utils.admission import upstream_admission
+from utils.catalog import model_catalog, merge_custom_models
+from utils.registry import function_registry
+from utils.workers import function_workers, run_in_workers
+from utils.passwords import password_executor
 
 if SAFE_MODE:
     print("SAFE MODE ENABLED")
@@ -172,10 +194,44 @@ def run_migrations():
         print(f"Error: {e}")
 
 
+async def check_upstream_health():
+    """Probe every upstream url periodically so dead nodes are skipped before requests hit them."""
+    while True:
+        try:
+            await asyncio.gather(check_ollama_health(), check_openai_health())
+        except Exception as e:
+            log.error(f"Upstream health check failed: {e}")
+        await asyncio.sleep(max(UPSTREAM_HEALTH_CHECK_INTERVAL, 1))
+
+
+async def flush_user_activity():
+    """Write the last_active_at of authenticated users in batches, see Users.mark_user_active."""
+    while True:
+        await asyncio.sleep(max(USER_LAST_ACTIVE_FLUSH_INTERVAL, 1))
+        await run_in_threadpool(Users.flush_last_active)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     run_migrations()
+    if THREAD_POOL_SIZE > 0:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = THREAD_POOL_SIZE
+    await upstream_clients.start(
+        [*ollama_app.state.config.OLLAMA_BASE_URLS]
+        + [*openai_app.state.config.OPENAI_API_BASE_URLS]
+    )
+    poll_task = asyncio.create_task(poll_ollama_resident_models())
+    health_task = asyncio.create_task(check_upstream_health())
+    catalog_task = asyncio.create_task(model_catalog.run())
+    activity_task = asyncio.create_task(flush_user_activity())
     yield
+    poll_task.cancel()
+    health_task.cancel()
+    catalog_task.cancel()
+    activity_task.cancel()
+    await run_in_threadpool(Users.flush_last_active)
+    await upstream_clients.close()
+    function_workers.shutdown()
 
 
 app = FastAPI(
@@ -205,6 +261,7 @@ app.state.config.SEARCH_QUERY_PROMPT_LENGTH_THRESHOLD = (
 app.state.config.TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE = (
     TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE
 )
+app.state.config.TOOLS_FUNCTION_CALLING_MODE = TOOLS_FUNCTION_CALLING_MODE
 
 app.state.MODELS = {}
 
@@ -218,25 +275,6 @@ origins = ["*"]
 ##################################
 
 
-async def get_body_and_model_and_user(request):
-    # Read the original request body
-    body = await request.body()
-    body_str = body.decode("utf-8")
-    body = json.loads(body_str) if body_str else {}
-
-    model_id = body["model"]
-    if model_id not in app.state.MODELS:
-        raise Exception("Model not found")
-    model = app.state.MODELS[model_id]
-
-    user = get_current_user(
-        request,
-        get_http_authorization_cred(request.headers.get("Authorization")),
-    )
-
-    return body, model, user
-
-
 def get_task_model_id(default_model_id):
     # Set the task model
     task_model_id = default_model_id
@@ -257,29 +295,121 @@ def get_task_model_id(default_model_id):
     return task_model_id
 
 
-def get_filter_function_ids(model):
-    def get_priority(function_id):
-        function = Functions.get_function_by_id(function_id)
-        if function is not None and hasattr(function, "valves"):
-            return (function.valves if function.valves else {}).get("priority", 0)
-        return 0
+def get_tools_prompt(messages):
+    user_message = get_last_user_message(messages)
+    return (
+        "History:\n"
+        + "\n".join(
+            [
+                f"{message['role'].upper()}: \"\"\"{message['content']}\"\"\""
+                for message in messages[::-1][:4]
+            ]
+        )
+        + f"\nQuery: {user_message}"
+    )
+
+
+async def get_completion_message(response) -> Optional[dict]:
+    """The message of a non-streamed chat completion, from a dict or a pipe response."""
+    message = None
+    if hasattr(response, "body_iterator"):
+        async for chunk in response.body_iterator:
+            data = json.loads(chunk.decode("utf-8"))
+            message = data["choices"][0]["message"]
 
-    filter_ids = [function.id for function in Functions.get_global_filter_functions()]
-    if "info" in model and "meta" in model["info"]:
-        filter_ids.extend(model["info"]["meta"].get("filterIds", []))
-        filter_ids = list(set(filter_ids))
+        # Cleanup any remaining background tasks if necessary
+        if response.background is not None:
+            await response.background()
+    else:
+        message = response["choices"][0]["message"]
+    return message
 
-    enabled_filter_ids = [
-        function.id
-        for function in Functions.get_functions_by_type("filter", active_only=True)
-    ]
 
-    filter_ids = [
-        filter_id for filter_id in filter_ids if filter_id in enabled_filter_ids
-    ]
+async def call_tool_function(
+    tool,
+    name,
+    params,
+    messages,
+    files,
+    model,
+    user,
+    __event_emitter__=None,
+    __event_call__=None,
+):
+    """
+    Call the function `name` of a toolkit with `params`.
+    Returns the function result, its citation and whether the toolkit handles files.
+    """
+    tool_id = tool.id
+    citation = None
+
+    # Call the function, the toolkit is loaded with its valves applied
+    entry = function_registry.get_tool(tool_id)
+    toolkit_module = entry.module
+
+    file_handler = False
+    # check if toolkit_module has file_handler self variable
+    if hasattr(toolkit_module, "file_handler"):
+        file_handler = True
+        print("file_handler: ", file_handler)
 
-    filter_ids.sort(key=get_priority)
-    return filter_ids
+    function = getattr(toolkit_module, name)
+    function_result = None
+    try:
+        # Get the signature of the function
+        sig = entry.get_signature(name)
+
+        # Extra parameters to be passed to the function
+        extra_params = {
+            "__model__": model,
+            "__id__": tool_id,
+            "__messages__": messages,
+            "__files__": files,
+            "__event_emitter__": __event_emitter__,
+            "__event_call__": __event_call__,
+        }
+
+        # Add extra params in contained in function signature
+        for key, value in extra_params.items():
+            if key in sig.parameters:
+                params[key] = value
+
+        if "__user__" in sig.parameters:
+            # Call the function with the '__user__' parameter included
+            __user__ = {
+                "id": user.id,
+                "email": user.email,
+                "name": user.name,
+                "role": user.role,
+            }
+
+            try:
+                if hasattr(toolkit_module, "UserValves"):
+                    __user__["valves"] = toolkit_module.UserValves(
+                        **Tools.get_user_valves_by_id_and_user_id(tool_id, user.id)
+                    )
+            except Exception as e:
+                print(e)
+
+            params = {**params, "__user__": __user__}
+
+        if run_in_workers():
+            function_result = await function_workers.call(entry, name, params)
+        elif inspect.iscoroutinefunction(function):
+            function_result = await function(**params)
+        else:
+            function_result = function(**params)
+
+        if hasattr(toolkit_module, "citation") and toolkit_module.citation:
+            citation = {
+                "source": {"name": f"TOOL:{tool.name}/{name}"},
+                "document": [function_result],
+                "metadata": [{"source": name}],
+            }
+    except Exception as e:
+        print(e)
+
+    return function_result, citation, file_handler
 
 
 async def get_function_call_response(
@@ -292,21 +422,11 @@ async def get_function_call_response(
     __event_emitter__=None,
     __event_call__=None,
 ):
-    tool = Tools.get_tool_by_id(tool_id)
+    tool = function_registry.get_tool(tool_id).model
     tools_specs = json.dumps(tool.specs, indent=2)
     content = tools_function_calling_generation_template(template, tools_specs)
 
-    user_message = get_last_user_message(messages)
-    prompt = (
-        "History:\n"
-        + "\n".join(
-            [
-                f"{message['role'].upper()}: \"\"\"{message['content']}\"\"\""
-                for message in messages[::-1][:4]
-            ]
-        )
-        + f"\nQuery: {user_message}"
-    )
+    prompt = get_tools_prompt(messages)
 
     print(prompt)
 
@@ -321,7 +441,7 @@ async def get_function_call_response(
     }
 
     try:
-        payload = filter_pipeline(payload, user)
+        payload = await filter_pipeline(payload, user)
     except Exception as e:
         raise e
 
@@ -330,18 +450,8 @@ async def get_function_call_response(
     response = None
     try:
         response = await generate_chat_completions(form_data=payload, user=user)
-        content = None
-
-        if hasattr(response, "body_iterator"):
-            async for chunk in response.body_iterator:
-                data = json.loads(chunk.decode("utf-8"))
-                content = data["choices"][0]["message"]["content"]
-
-            # Cleanup any remaining background tasks if necessary
-            if response.background is not None:
-                await response.background()
-        else:
-            content = response["choices"][0]["message"]["content"]
+        message = await get_completion_message(response)
+        content = message["content"] if message else None
 
         if content is None:
             return None, None, False
@@ -351,90 +461,91 @@ async def get_function_call_response(
         result = json.loads(content)
         print(result)
 
-        citation = None
-
         if "name" not in result:
             return None, None, False
 
-        # Call the function
-        if tool_id in webui_app.state.TOOLS:
-            toolkit_module = webui_app.state.TOOLS[tool_id]
-        else:
-            toolkit_module, _ = load_toolkit_module_by_id(tool_id)
-            webui_app.state.TOOLS[tool_id] = toolkit_module
-
-        file_handler = False
-        # check if toolkit_module has file_handler self variable
-        if hasattr(toolkit_module, "file_handler"):
-            file_handler = True
-            print("file_handler: ", file_handler)
-
-        if hasattr(toolkit_module, "valves") and hasattr(toolkit_module, "Valves"):
-            valves = Tools.get_tool_valves_by_id(tool_id)
-            toolkit_module.valves = toolkit_module.Valves(**(valves if valves else {}))
-
-        function = getattr(toolkit_module, result["name"])
-        function_result = None
-        try:
-            # Get the signature of the function
-            sig = inspect.signature(function)
-            params = result["parameters"]
+        function_result, citation, file_handler = await call_tool_function(
+            tool,
+            result["name"],
+            result["parameters"],
+            messages,
+            files,
+            model,
+            user,
+            __event_emitter__,
+            __event_call__,
+        )
 
-            # Extra parameters to be passed to the function
-            extra_params = {
-                "__model__": model,
-                "__id__": tool_id,
-                "__messages__": messages,
-                "__files__": files,
-                "__event_emitter__": __event_emitter__,
-                "__event_call__": __event_call__,
-            }
+        # Add the function result to the system prompt
+        if function_result is not None:
+            return function_result, citation, file_handler
+    except Exception as e:
+        print(f"Error: {e}")
 
-            # Add extra params in contained in function signature
-            for key, value in extra_params.items():
-                if key in sig.parameters:
-                    params[key] = value
+    return None, None, False
 
-            if "__user__" in sig.parameters:
-                # Call the function with the '__user__' parameter included
-                __user__ = {
-                    "id": user.id,
-                    "email": user.email,
-                    "name": user.name,
-                    "role": user.role,
-                }
 
-                try:
-                    if hasattr(toolkit_module, "UserValves"):
-                        __user__["valves"] = toolkit_module.UserValves(
-                            **Tools.get_user_valves_by_id_and_user_id(tool_id, user.id)
-                        )
-                except Exception as e:
-                    print(e)
+async def get_tool_calls(messages, tool_ids, template, task_model_id, user):
+    """
+    Ask the task model which functions of all `tool_ids` to call, in one request.
 
-                params = {**params, "__user__": __user__}
+    Returns the calls as {"tool", "name", "parameters"} in `tool_ids` order.
+    """
+    tools = [
+        entry.model
+        for entry in [function_registry.get_tool(tool_id) for tool_id in tool_ids]
+        if entry
+    ]
 
-            if inspect.iscoroutinefunction(function):
-                function_result = await function(**params)
-            else:
-                function_result = function(**params)
+    # Function names are only qualified by their tool where they clash
+    names = [spec["name"] for tool in tools for spec in tool.specs]
+    functions = {}
+    specs = []
+    for tool in tools:
+        for spec in tool.specs:
+            name = spec["name"]
+            if names.count(name) > 1:
+                name = f"{tool.id}__{name}"
+            functions[name] = (tool, spec["name"])
+            specs.append({**spec, "name": name})
+
+    if not specs:
+        return []
+
+    content = tools_function_calling_multi_generation_template(
+        template, json.dumps(specs, indent=2)
+    )
+    prompt = get_tools_prompt(messages)
+    payload = {
+        "model": task_model_id,
+        "messages": [
+            {"role": "system", "content": content},
+            {"role": "user", "content": f"Query: {prompt}"},
+        ],
+        "stream": False,
+        "task": str(TASKS.FUNCTION_CALLING),
+    }
 
-            if hasattr(toolkit_module, "citation") and toolkit_module.citation:
-                citation = {
-                    "source": {"name": f"TOOL:{tool.name}/{result['name']}"},
-                    "document": [function_result],
-                    "metadata": [{"source": result["name"]}],
-                }
-        except Exception as e:
-            print(e)
+    payload = await filter_pipeline(payload, user)
+    response = await generate_chat_completions(form_data=payload, user=user)
+    message = await get_completion_message(response)
+    if not message:
+        return []
 
-        # Add the function result to the system prompt
-        if function_result is not None:
-            return function_result, citation, file_handler
-    except Exception as e:
-        print(f"Error: {e}")
+    calls = parse_tool_calls(message.get("content"))
+    print(f"tool_calls: {calls}")
 
-    return None, None, False
+    tool_calls = [
+        {
+            "tool": functions[call["name"]][0],
+            "name": functions[call["name"]][1],
+            "parameters": call.get("parameters") or {},
+        }
+        for call in calls
+        if call["name"] in functions
+    ]
+    tool_calls.sort(key=lambda call: tools.index(call["tool"]))
+    return tool_calls
 
 
 async def chat_completion_functions_handler(
@@ -442,28 +553,15 @@ async def chat_completion_functions_handler(
 ):
     skip_files = None
 
-    filter_ids = get_filter_function_ids(model)
-    for filter_id in filter_ids:
-        filter = Functions.get_function_by_id(filter_id)
-        if not filter:
-            continue
-
-        if filter_id in webui_app.state.FUNCTIONS:
-            function_module = webui_app.state.FUNCTIONS[filter_id]
-        else:
-            function_module, _, _ = load_function_module_by_id(filter_id)
-            webui_app.state.FUNCTIONS[filter_id] = function_module
+    # Loaded with their valves applied, in priority order
+    for filter in function_registry.get_filters(model):
+        filter_id = filter.id
+        function_module = filter.module
 
         # Check if the function has a file_handler variable
         if hasattr(function_module, "file_handler"):
             skip_files = function_module.file_handler
 
-        if hasattr(function_module, "valves") and hasattr(function_module, "Valves"):
-            valves = Functions.get_function_valves_by_id(filter_id)
-            function_module.valves = function_module.Valves(
-                **(valves if valves else {})
-            )
-
         if not hasattr(function_module, "inlet"):
             continue
 
@@ -471,7 +569,7 @@ async def chat_completion_functions_handler(
             inlet = function_module.inlet
 
             # Get the signature of the function
-            sig = inspect.signature(inlet)
+            sig = filter.get_signature("inlet")
             params = {"body": body}
 
             # Extra parameters to be passed to the function
@@ -507,7 +605,9 @@ async def chat_completion_functions_handler(
 
                 params = {**params, "__user__": __user__}
 
-            if inspect.iscoroutinefunction(inlet):
+            if run_in_workers():
+                body = await function_workers.call(filter, "inlet", params)
+            elif inspect.iscoroutinefunction(inlet):
                 body = await inlet(**params)
             else:
                 body = inlet(**params)
@@ -534,19 +634,80 @@ async def chat_completion_tools_handler(body, user, __event_emitter__, __event_c
     # If tool_ids field is present, call the functions
     if "tool_ids" in body:
         print(body["tool_ids"])
-        for tool_id in body["tool_ids"]:
-            print(tool_id)
+        template = app.state.config.TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE
+        mode = app.state.config.TOOLS_FUNCTION_CALLING_MODE
+
+        if mode == "combined":
+            # One task model request picks the functions of every tool
             try:
-                response, citation, file_handler = await get_function_call_response(
+                tool_calls = await get_tool_calls(
+                    body["messages"],
+                    body["tool_ids"],
+                    template,
+                    task_model_id,
+                    user,
+                )
+            except Exception as e:
+                print(f"Error: {e}")
+                tool_calls = []
+
+            names = [f"{call['tool'].id}/{call['name']}" for call in tool_calls]
+            calls = [
+                call_tool_function(
+                    call["tool"],
+                    call["name"],
+                    call["parameters"],
+                    body["messages"],
+                    body.get("files", []),
+                    app.state.MODELS[task_model_id],
+                    user,
+                    __event_emitter__,
+                    __event_call__,
+                )
+                for call in tool_calls
+            ]
+        else:
+            # Each tool needs its own task model round-trip
+            names = body["tool_ids"]
+            calls = [
+                get_function_call_response(
                     messages=body["messages"],
                     files=body.get("files", []),
                     tool_id=tool_id,
-                    template=app.state.config.TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE,
+                    template=template,
                     task_model_id=task_model_id,
                     user=user,
                     __event_emitter__=__event_emitter__,
                     __event_call__=__event_call__,
                 )
+                for tool_id in body["tool_ids"]
+            ]
+
+        semaphore = asyncio.Semaphore(max(TOOLS_FUNCTION_CALLING_CONCURRENCY, 1))
+
+        async def run(call):
+            async with semaphore:
+                return await asyncio.wait_for(
+                    call, timeout=TOOLS_FUNCTION_CALLING_TIMEOUT
+                )
+
+        # Run the calls concurrently and merge the results in tool_ids order
+        results = await asyncio.gather(
+            *[run(call) for call in calls], return_exceptions=True
+        )
+
+        for name, result in zip(names, results):
+            print(name)
+            try:
+                if isinstance(result, asyncio.TimeoutError):
+                    log.warning(
+                        f"Tool {name} timed out after {TOOLS_FUNCTION_CALLING_TIMEOUT}s"
+                    )
+                    continue
+                if isinstance(result, BaseException):
+                    raise result
+
+                response, citation, file_handler = result
 
                 print(file_handler)
                 if isinstance(response, str):
@@ -576,306 +737,216 @@ async def chat_completion_tools_handler(body, user, __event_emitter__, __event_c
     }
 
 
-async def chat_completion_files_handler(body):
-    contexts = []
-    citations = None
-
-    if "files" in body:
-        files = body["files"]
-        del body["files"]
-
-        contexts, citations = get_rag_context(
-            files=files,
-            messages=body["messages"],
-            embedding_function=rag_app.state.EMBEDDING_FUNCTION,
-            k=rag_app.state.config.TOP_K,
-            reranking_function=rag_app.state.sentence_transformer_rf,
-            r=rag_app.state.config.RELEVANCE_THRESHOLD,
-            hybrid_search=rag_app.state.config.ENABLE_RAG_HYBRID_SEARCH,
-        )
+async def chat_completion_files_handler(files, messages):
+    # get_rag_context blocks on embedding and reranking, keep it off the event loop
+    contexts, citations = await run_in_threadpool(
+        get_rag_context,
+        files=files,
+        messages=messages,
+        embedding_function=rag_app.state.EMBEDDING_FUNCTION,
+        k=rag_app.state.config.TOP_K,
+        reranking_function=rag_app.state.sentence_transformer_rf,
+        r=rag_app.state.config.RELEVANCE_THRESHOLD,
+        hybrid_search=rag_app.state.config.ENABLE_RAG_HYBRID_SEARCH,
+    )
 
-        log.debug(f"rag_contexts: {contexts}, citations: {citations}")
+    log.debug(f"rag_contexts: {contexts}, citations: {citations}")
 
-    return body, {
+    return {
         **({"contexts": contexts} if contexts is not None else {}),
         **({"citations": citations} if citations is not None else {}),
     }
 
 
-class ChatCompletionMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        if request.method == "POST" and any(
-            endpoint in request.url.path
-            for endpoint in ["/ollama/api/chat", "/chat/completions"]
-        ):
-            log.debug(f"request.url.path: {request.url.path}")
+async def process_chat_completion(request: Request, body: dict):
+    """
+    Run the pipeline filters and the function, tool and file stages on the
+    parsed body of a chat completion request, see ChatCompletionMiddleware.
 
-            try:
-                body, model, user = await get_body_and_model_and_user(request)
-            except Exception as e:
-                return JSONResponse(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    content={"detail": str(e)},
-                )
+    Returns the new body and the items to send ahead of a streamed response, or
+    an error response.
+    """
+    try:
+        user = get_current_user(
+            request,
+            get_http_authorization_cred(request.headers.get("Authorization")),
+        )
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
 
-            # Extract valves from the request body
-            valves = None
-            if "valves" in body:
-                valves = body["valves"]
-                del body["valves"]
-
-            # Extract session_id, chat_id and message_id from the request body
-            session_id = None
-            if "session_id" in body:
-                session_id = body["session_id"]
-                del body["session_id"]
-            chat_id = None
-            if "chat_id" in body:
-                chat_id = body["chat_id"]
-                del body["chat_id"]
-            message_id = None
-            if "id" in body:
-                message_id = body["id"]
-                del body["id"]
-
-            __event_emitter__ = await get_event_emitter(
-                {"chat_id": chat_id, "message_id": message_id, "session_id": session_id}
-            )
-            __event_call__ = await get_event_call(
-                {"chat_id": chat_id, "message_id": message_id, "session_id": session_id}
-            )
+    if body.get("model") in app.state.MODELS:
+        try:
+            body = await filter_pipeline(body, user)
+        except PipelineFilterError as e:
+            return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+
+    # Checked after the filters, they may switch the model
+    if body.get("model") not in app.state.MODELS:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"detail": "Model not found"},
+        )
+    model = app.state.MODELS[body["model"]]
+
+    # Extract valves from the request body
+    valves = None
+    if "valves" in body:
+        valves = body["valves"]
+        del body["valves"]
+
+    # Extract session_id, chat_id and message_id from the request body
+    session_id = None
+    if "session_id" in body:
+        session_id = body["session_id"]
+        del body["session_id"]
+    chat_id = None
+    if "chat_id" in body:
+        chat_id = body["chat_id"]
+        del body["chat_id"]
+    message_id = None
+    if "id" in body:
+        message_id = body["id"]
+        del body["id"]
+
+    __event_emitter__ = await get_event_emitter(
+        {"chat_id": chat_id, "message_id": message_id, "session_id": session_id}
+    )
+    __event_call__ = await get_event_call(
+        {"chat_id": chat_id, "message_id": message_id, "session_id": session_id}
+    )
 
-            # Initialize data_items to store additional data to be sent to the client
-            data_items = []
+    # Initialize data_items to store additional data to be sent to the client
+    data_items = []
 
-            # Initialize context, and citations
-            contexts = []
-            citations = []
+    # Initialize context, and citations
+    contexts = []
+    citations = []
 
-            try:
-                body, flags = await chat_completion_functions_handler(
-                    body, model, user, __event_emitter__, __event_call__
-                )
-            except Exception as e:
-                return JSONResponse(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    content={"detail": str(e)},
-                )
+    stages = StageRunner()
 
-            try:
-                body, flags = await chat_completion_tools_handler(
+    try:
+        body, flags = await stages.run(
+            "functions",
+            lambda: chat_completion_functions_handler(
+                body, model, user, __event_emitter__, __event_call__
+            ),
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"detail": str(e)},
+        )
+
+    try:
+        # Retrieval only needs the files and the messages, so it runs alongside
+        # tool selection and is dropped if a tool handles the files itself
+        if "files" in body:
+            stages.start(
+                "files",
+                partial(chat_completion_files_handler, body["files"], body["messages"]),
+            )
+
+        try:
+            body, flags = await stages.run(
+                "tools",
+                lambda: chat_completion_tools_handler(
                     body, user, __event_emitter__, __event_call__
-                )
+                ),
+            )
 
-                contexts.extend(flags.get("contexts", []))
-                citations.extend(flags.get("citations", []))
-            except Exception as e:
-                print(e)
-                pass
+            contexts.extend(flags.get("contexts", []))
+            citations.extend(flags.get("citations", []))
+        except Exception as e:
+            print(e)
+            pass
 
+        if "files" in body:
+            del body["files"]
             try:
-                body, flags = await chat_completion_files_handler(body)
+                flags = await stages.result("files")
 
                 contexts.extend(flags.get("contexts", []))
                 citations.extend(flags.get("citations", []))
             except Exception as e:
                 print(e)
                 pass
+        else:
+            stages.cancel("files")
+    finally:
+        stages.cancel_all()
+
+    log.debug(f"chat completion stages: {stages.get_header()}")
+    if log.isEnabledFor(logging.DEBUG):
+        request.state.response_headers = {"Server-Timing": stages.get_header()}
+
+    # If context is not empty, insert it into the messages
+    if len(contexts) > 0:
+        context_string = "/n".join(contexts).strip()
+        prompt = get_last_user_message(body["messages"])
+        body["messages"] = add_or_update_system_message(
+            rag_template(rag_app.state.config.RAG_TEMPLATE, context_string, prompt),
+            body["messages"],
+        )
 
-            # If context is not empty, insert it into the messages
-            if len(contexts) > 0:
-                context_string = "/n".join(contexts).strip()
-                prompt = get_last_user_message(body["messages"])
-                body["messages"] = add_or_update_system_message(
-                    rag_template(
-                        rag_app.state.config.RAG_TEMPLATE, context_string, prompt
-                    ),
-                    body["messages"],
-                )
-
-            # If there are citations, add them to the data_items
-            if len(citations) > 0:
-                data_items.append({"citations": citations})
-
-            body["metadata"] = {
-                "session_id": session_id,
-                "chat_id": chat_id,
-                "message_id": message_id,
-                "valves": valves,
-            }
-
-            modified_body_bytes = json.dumps(body).encode("utf-8")
-            # Replace the request body with the modified one
-            request._body = modified_body_bytes
-            # Set custom header to ensure content-length matches new body length
-            request.headers.__dict__["_list"] = [
-                (b"content-length", str(len(modified_body_bytes)).encode("utf-8")),
-                *[
-                    (k, v)
-                    for k, v in request.headers.raw
-                    if k.lower() != b"content-length"
-                ],
-            ]
-
-            response = await call_next(request)
-            if isinstance(response, StreamingResponse):
-                # If it's a streaming response, inject it as SSE event or NDJSON line
-                content_type = response.headers.get("Content-Type")
-                if "text/event-stream" in content_type:
-                    return StreamingResponse(
-                        self.openai_stream_wrapper(response.body_iterator, data_items),
-                    )
-                if "application/x-ndjson" in content_type:
-                    return StreamingResponse(
-                        self.ollama_stream_wrapper(response.body_iterator, data_items),
-                    )
-
-                return response
-            else:
-                return response
-
-        # If it's not a chat completion request, just pass it through
-        response = await call_next(request)
-        return response
-
-    async def _receive(self, body: bytes):
-        return {"type": "http.request", "body": body, "more_body": False}
-
-    async def openai_stream_wrapper(self, original_generator, data_items):
-        for item in data_items:
-            yield f"data: {json.dumps(item)}\n\n"
-
-        async for data in original_generator:
-            yield data
-
-    async def ollama_stream_wrapper(self, original_generator, data_items):
-        for item in data_items:
-            yield f"{json.dumps(item)}\n"
+    # If there are citations, add them to the data_items
+    if len(citations) > 0:
+        data_items.append({"citations": citations})
 
-        async for data in original_generator:
-            yield data
+    body["metadata"] = {
+        "session_id": session_id,
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "valves": valves,
+    }
 
+    return body, data_items
 
-app.add_middleware(ChatCompletionMiddleware)
 
 ##################################
 #
-# Pipeline Middleware
+# Pipeline Filters
 #
 ##################################
 
 
 def get_sorted_filters(model_id):
-    filters = [
-        model
-        for model in app.state.MODELS.values()
-        if "pipeline" in model
-        and "type" in model["pipeline"]
-        and model["pipeline"]["type"] == "filter"
-        and (
-            model["pipeline"]["pipelines"] == ["*"]
-            or any(
-                model_id == target_model_id
-                for target_model_id in model["pipeline"]["pipelines"]
-            )
-        )
-    ]
-    sorted_filters = sorted(filters, key=lambda x: x["pipeline"]["priority"])
-    return sorted_filters
+    return pipeline_filters.get_sorted(
+        app.state.MODELS, model_id, model_catalog.version
+    )
 
 
-def filter_pipeline(payload, user):
+async def call_pipeline_filters(filters: List[dict], stage: str, user, body: dict):
+    """Pass `body` through the `stage` ("inlet" or "outlet") of each filter in turn."""
     user = {"id": user.id, "email": user.email, "name": user.name, "role": user.role}
-    model_id = payload["model"]
-    sorted_filters = get_sorted_filters(model_id)
-
-    model = app.state.MODELS[model_id]
-
-    if "pipeline" in model:
-        sorted_filters.append(model)
-
-    for filter in sorted_filters:
-        r = None
+    for filter in filters:
         try:
-            urlIdx = filter["urlIdx"]
-
-            url = openai_app.state.config.OPENAI_API_BASE_URLS[urlIdx]
-            key = openai_app.state.config.OPENAI_API_KEYS[urlIdx]
-
-            if key != "":
-                headers = {"Authorization": f"Bearer {key}"}
-                r = requests.post(
-                    f"{url}/{filter['id']}/filter/inlet",
-                    headers=headers,
-                    json={
-                        "user": user,
-                        "body": payload,
-                    },
-                )
-
-                r.raise_for_status()
-                payload = r.json()
-        except Exception as e:
-            # Handle connection error here
-            print(f"Connection error: {e}")
-
-            if r is not None:
-                res = r.json()
-                if "detail" in res:
-                    raise Exception(r.status_code, res["detail"])
-
-    return payload
-
+            url = openai_app.state.config.OPENAI_API_BASE_URLS[filter["urlIdx"]]
+            key = openai_app.state.config.OPENAI_API_KEYS[filter["urlIdx"]]
+        except IndexError:
+            # The urls changed since the model list was built
+            continue
 
-class PipelineMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        if request.method == "POST" and (
-            "/ollama/api/chat" in request.url.path
-            or "/chat/completions" in request.url.path
-        ):
-            log.debug(f"request.url.path: {request.url.path}")
-
-            # Read the original request body
-            body = await request.body()
-            # Decode body to string
-            body_str = body.decode("utf-8")
-            # Parse string to JSON
-            data = json.loads(body_str) if body_str else {}
-
-            user = get_current_user(
-                request,
-                get_http_authorization_cred(request.headers.get("Authorization")),
+        if key != "":
+            body = await pipeline_filters.call(
+                filter["id"], stage, url, key, user, body
             )
+    return body
 
-            try:
-                data = filter_pipeline(data, user)
-            except Exception as e:
-                return JSONResponse(
-                    status_code=e.args[0],
-                    content={"detail": e.args[1]},
-                )
 
-            modified_body_bytes = json.dumps(data).encode("utf-8")
-            # Replace the request body with the modified one
-            request._body = modified_body_bytes
-            # Set custom header to ensure content-length matches new body length
-            request.headers.__dict__["_list"] = [
-                (b"content-length", str(len(modified_body_bytes)).encode("utf-8")),
-                *[
-                    (k, v)
-                    for k, v in request.headers.raw
-                    if k.lower() != b"content-length"
-                ],
-            ]
+async def filter_pipeline(payload, user):
+    model_id = payload["model"]
+    sorted_filters = get_sorted_filters(model_id)
 
-        response = await call_next(request)
-        return response
+    model = app.state.MODELS[model_id]
+
+    if "pipeline" in model:
+        sorted_filters = sorted_filters + [model]
 
-    async def _receive(self, body: bytes):
-        return {"type": "http.request", "body": body, "more_body": False}
+    return await call_pipeline_filters(sorted_filters, "inlet", user, payload)
 
 
-app.add_middleware(PipelineMiddleware)
+# Added before the middlewares below, so it runs after them
+app.add_middleware(ChatCompletionMiddleware, process=process_chat_completion)
 
 
 app.add_middleware(
@@ -918,6 +989,38 @@ async def update_embedding_function(request: Request, call_next):
     return response
 
 
+class UpstreamCancellationMiddleware:
+    """
+    Aborts the upstream streams of a request as soon as its client disconnects.
+
+    The streaming responses are wrapped by several middlewares, each only
+    stopping once it notices the disconnect itself, so the backend could keep
+    generating for a while. Added last, this middleware sees the disconnect
+    first. Streams still unread when the request is done are aborted as well.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with upstream_streams.track_request() as streams:
+
+            async def receive_or_abort():
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    upstream_streams.abort(streams)
+                return message
+
+            await self.app(scope, receive_or_abort, send)
+
+
+app.add_middleware(UpstreamCancellationMiddleware)
+
+
 app.mount("/ws", socket_app)
 
 app.mount("/ollama", ollama_app)
@@ -932,8 +1035,7 @@ app.mount("/api/v1", webui_app)
 webui_app.state.EMBEDDING_FUNCTION = rag_app.state.EMBEDDING_FUNCTION
 
 
-async def get_all_models():
-    # TODO: Optimize this function
+async def build_all_models():
     pipe_models = []
     openai_models = []
     ollama_models = []
@@ -963,93 +1065,14 @@ async def get_all_models():
     global_action_ids = [
         function.id for function in Functions.get_global_action_functions()
     ]
-    enabled_action_ids = [
-        function.id
+    action_functions = {
+        function.id: function
         for function in Functions.get_functions_by_type("action", active_only=True)
-    ]
-
-    custom_models = Models.get_all_models()
-    for custom_model in custom_models:
-        if custom_model.base_model_id == None:
-            for model in models:
-                if (
-                    custom_model.id == model["id"]
-                    or custom_model.id == model["id"].split(":")[0]
-                ):
-                    model["name"] = custom_model.name
-                    model["info"] = custom_model.model_dump()
-
-                    action_ids = [] + global_action_ids
-                    if "info" in model and "meta" in model["info"]:
-                        action_ids.extend(model["info"]["meta"].get("actionIds", []))
-                        action_ids = list(set(action_ids))
-                    action_ids = [
-                        action_id
-                        for action_id in action_ids
-                        if action_id in enabled_action_ids
-                    ]
-
-                    model["actions"] = []
-                    for action_id in action_ids:
-                        action = Functions.get_function_by_id(action_id)
-                        model["actions"].append(
-                            {
-                                "id": action_id,
-                                "name": action.name,
-                                "description": action.meta.description,
-                                "icon_url": action.meta.manifest.get("icon_url", None),
-                            }
-                        )
+    }
 
-        else:
-            owned_by = "openai"
-            pipe = None
-            actions = []
-
-            for model in models:
-                if (
-                    custom_model.base_model_id == model["id"]
-                    or custom_model.base_model_id == model["id"].split(":")[0]
-                ):
-                    owned_by = model["owned_by"]
-                    if "pipe" in model:
-                        pipe = model["pipe"]
-
-                    action_ids = [] + global_action_ids
-                    if "info" in model and "meta" in model["info"]:
-                        action_ids.extend(model["info"]["meta"].get("actionIds", []))
-                        action_ids = list(set(action_ids))
-                    action_ids = [
-                        action_id
-                        for action_id in action_ids
-                        if action_id in enabled_action_ids
-                    ]
-
-                    actions = [
-                        {
-                            "id": action_id,
-                            "name": Functions.get_function_by_id(action_id).name,
-                            "description": Functions.get_function_by_id(
-                                action_id
-                            ).meta.description,
-                        }
-                        for action_id in action_ids
-                    ]
-                    break
-
-            models.append(
-                {
-                    "id": custom_model.id,
-                    "name": custom_model.name,
-                    "object": "model",
-                    "created": custom_model.created_at,
-                    "owned_by": owned_by,
-                    "info": custom_model.model_dump(),
-                    "preset": True,
-                    **({"pipe": pipe} if pipe is not None else {}),
-                    "actions": actions,
-                }
-            )
+    models = merge_custom_models(
+        models, Models.get_all_models(), global_action_ids, action_functions
+    )
 
     app.state.MODELS = {model["id"]: model for model in models}
     webui_app.state.MODELS = app.state.MODELS
@@ -1057,6 +1080,14 @@ async def get_all_models():
     return models
 
 
+model_catalog.loader = build_all_models
+
+
+async def get_all_models(refresh: bool = False):
+    """The cached model list, see utils/catalog.py. `refresh` waits for a rebuild."""
+    return await model_catalog.get(refresh=refresh)
+
+
 @app.get("/api/models")
 async def get_models(user=Depends(get_verified_user)):
     models = await get_all_models()
@@ -1076,9 +1107,9 @@ async def get_models(user=Depends(get_verified_user)):
                     models,
                 )
             )
-            return {"data": models}
+            return {"data": models, "version": model_catalog.version}
 
-    return {"data": models}
+    return {"data": models, "version": model_catalog.version}
 
 
 @app.post("/api/chat/completions")
@@ -1127,49 +1158,10 @@ async def chat_completed(form_data: dict, user=Depends(get_verified_user)):
     if "pipeline" in model:
         sorted_filters = [model] + sorted_filters
 
-    for filter in sorted_filters:
-        r = None
-        try:
-            urlIdx = filter["urlIdx"]
-
-            url = openai_app.state.config.OPENAI_API_BASE_URLS[urlIdx]
-            key = openai_app.state.config.OPENAI_API_KEYS[urlIdx]
-
-            if key != "":
-                headers = {"Authorization": f"Bearer {key}"}
-                r = requests.post(
-                    f"{url}/{filter['id']}/filter/outlet",
-                    headers=headers,
-                    json={
-                        "user": {
-                            "id": user.id,
-                            "name": user.name,
-                            "email": user.email,
-                            "role": user.role,
-                        },
-                        "body": data,
-                    },
-                )
-
-                r.raise_for_status()
-                data = r.json()
-        except Exception as e:
-            # Handle connection error here
-            print(f"Connection error: {e}")
-
-            if r is not None:
-                try:
-                    res = r.json()
-                    if "detail" in res:
-                        return JSONResponse(
-                            status_code=r.status_code,
-                            content=res,
-                        )
-                except:
-                    pass
-
-            else:
-                pass
+    try:
+        data = await call_pipeline_filters(sorted_filters, "outlet", user, data)
+    except PipelineFilterError as e:
+        return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
 
     __event_emitter__ = await get_event_emitter(
         {
@@ -1187,44 +1179,10 @@ async def chat_completed(form_data: dict, user=Depends(get_verified_user)):
         }
     )
 
-    def get_priority(function_id):
-        function = Functions.get_function_by_id(function_id)
-        if function is not None and hasattr(function, "valves"):
-            return (function.valves if function.valves else {}).get("priority", 0)
-        return 0
-
-    filter_ids = [function.id for function in Functions.get_global_filter_functions()]
-    if "info" in model and "meta" in model["info"]:
-        filter_ids.extend(model["info"]["meta"].get("filterIds", []))
-        filter_ids = list(set(filter_ids))
-
-    enabled_filter_ids = [
-        function.id
-        for function in Functions.get_functions_by_type("filter", active_only=True)
-    ]
-    filter_ids = [
-        filter_id for filter_id in filter_ids if filter_id in enabled_filter_ids
-    ]
-
-    # Sort filter_ids by priority, using the get_priority function
-    filter_ids.sort(key=get_priority)
-
-    for filter_id in filter_ids:
-        filter = Functions.get_function_by_id(filter_id)
-        if not filter:
-            continue
-
-        if filter_id in webui_app.state.FUNCTIONS:
-            function_module = webui_app.state.FUNCTIONS[filter_id]
-        else:
-            function_module, _, _ = load_function_module_by_id(filter_id)
-            webui_app.state.FUNCTIONS[filter_id] = function_module
-
-        if hasattr(function_module, "valves") and hasattr(function_module, "Valves"):
-            valves = Functions.get_function_valves_by_id(filter_id)
-            function_module.valves = function_module.Valves(
-                **(valves if valves else {})
-            )
+    # Loaded with their valves applied, in priority order
+    for filter in function_registry.get_filters(model):
+        filter_id = filter.id
+        function_module = filter.module
 
         if not hasattr(function_module, "outlet"):
             continue
@@ -1232,7 +1190,7 @@ async def chat_completed(form_data: dict, user=Depends(get_verified_user)):
             outlet = function_module.outlet
 
             # Get the signature of the function
-            sig = inspect.signature(outlet)
+            sig = filter.get_signature("outlet")
             params = {"body": data}
 
             # Extra parameters to be passed to the function
@@ -1268,7 +1226,9 @@ async def chat_completed(form_data: dict, user=Depends(get_verified_user)):
 
                 params = {**params, "__user__": __user__}
 
-            if inspect.iscoroutinefunction(outlet):
+            if run_in_workers():
+                data = await function_workers.call(filter, "outlet", params)
+            elif inspect.iscoroutinefunction(outlet):
                 data = await outlet(**params)
             else:
                 data = outlet(**params)
@@ -1287,8 +1247,8 @@ async def chat_completed(form_data: dict, user=Depends(get_verified_user)):
 async def chat_completed(
     action_id: str, form_data: dict, user=Depends(get_verified_user)
 ):
-    action = Functions.get_function_by_id(action_id)
-    if not action:
+    function = function_registry.get_function(action_id)
+    if not function:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Action not found",
@@ -1318,22 +1278,14 @@ async def chat_completed(
         }
     )
 
-    if action_id in webui_app.state.FUNCTIONS:
-        function_module = webui_app.state.FUNCTIONS[action_id]
-    else:
-        function_module, _, _ = load_function_module_by_id(action_id)
-        webui_app.state.FUNCTIONS[action_id] = function_module
-
-    if hasattr(function_module, "valves") and hasattr(function_module, "Valves"):
-        valves = Functions.get_function_valves_by_id(action_id)
-        function_module.valves = function_module.Valves(**(valves if valves else {}))
+    function_module = function.module
 
     if hasattr(function_module, "action"):
         try:
             action = function_module.action
 
             # Get the signature of the function
-            sig = inspect.signature(action)
+            sig = function.get_signature("action")
             params = {"body": data}
 
             # Extra parameters to be passed to the function
@@ -1369,7 +1321,9 @@ async def chat_completed(
 
                 params = {**params, "__user__": __user__}
 
-            if inspect.iscoroutinefunction(action):
+            if run_in_workers():
+                data = await function_workers.call(function, "action", params)
+            elif inspect.iscoroutinefunction(action):
                 data = await action(**params)
             else:
                 data = action(**params)
@@ -1403,6 +1357,7 @@ async def get_task_config(user=Depends(get_verified_user)):
         "SEARCH_QUERY_GENERATION_PROMPT_TEMPLATE": app.state.config.SEARCH_QUERY_GENERATION_PROMPT_TEMPLATE,
         "SEARCH_QUERY_PROMPT_LENGTH_THRESHOLD": app.state.config.SEARCH_QUERY_PROMPT_LENGTH_THRESHOLD,
         "TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE": app.state.config.TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE,
+        "TOOLS_FUNCTION_CALLING_MODE": app.state.config.TOOLS_FUNCTION_CALLING_MODE,
     }
 
 
@@ -1413,6 +1368,7 @@ class TaskConfigForm(BaseModel):
     SEARCH_QUERY_GENERATION_PROMPT_TEMPLATE: str
     SEARCH_QUERY_PROMPT_LENGTH_THRESHOLD: int
     TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE: str
+    TOOLS_FUNCTION_CALLING_MODE: Optional[str] = None
 
 
 @app.post("/api/task/config/update")
@@ -1431,6 +1387,10 @@ async def update_task_config(form_data: TaskConfigForm, user=Depends(get_admin_u
     app.state.config.TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE = (
         form_data.TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE
     )
+    if form_data.TOOLS_FUNCTION_CALLING_MODE is not None:
+        app.state.config.TOOLS_FUNCTION_CALLING_MODE = (
+            form_data.TOOLS_FUNCTION_CALLING_MODE
+        )
 
     return {
         "TASK_MODEL": app.state.config.TASK_MODEL,
@@ -1439,6 +1399,7 @@ async def update_task_config(form_data: TaskConfigForm, user=Depends(get_admin_u
         "SEARCH_QUERY_GENERATION_PROMPT_TEMPLATE": app.state.config.SEARCH_QUERY_GENERATION_PROMPT_TEMPLATE,
         "SEARCH_QUERY_PROMPT_LENGTH_THRESHOLD": app.state.config.SEARCH_QUERY_PROMPT_LENGTH_THRESHOLD,
         "TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE": app.state.config.TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE,
+        "TOOLS_FUNCTION_CALLING_MODE": app.state.config.TOOLS_FUNCTION_CALLING_MODE,
     }
 
 
@@ -1482,7 +1443,7 @@ async def generate_title(form_data: dict, user=Depends(get_verified_user)):
     log.debug(payload)
 
     try:
-        payload = filter_pipeline(payload, user)
+        payload = await filter_pipeline(payload, user)
     except Exception as e:
         return JSONResponse(
             status_code=e.args[0],
@@ -1535,7 +1496,7 @@ async def generate_search_query(form_data: dict, user=Depends(get_verified_user)
     print(payload)
 
     try:
-        payload = filter_pipeline(payload, user)
+        payload = await filter_pipeline(payload, user)
     except Exception as e:
         return JSONResponse(
             status_code=e.args[0],
@@ -1592,7 +1553,7 @@ Message: """{{prompt}}"""
     log.debug(payload)
 
     try:
-        payload = filter_pipeline(payload, user)
+        payload = await filter_pipeline(payload, user)
     except Exception as e:
         return JSONResponse(
             status_code=e.args[0],
@@ -1706,6 +1667,7 @@ async def upload_pipeline(
         r.raise_for_status()
         data = r.json()
 
+        model_catalog.invalidate()
         return {**data}
     except Exception as e:
         # Handle connection error here
@@ -1755,6 +1717,7 @@ async def add_pipeline(form_data: AddPipelineForm, user=Depends(get_admin_user))
         r.raise_for_status()
         data = r.json()
 
+        model_catalog.invalidate()
         return {**data}
     except Exception as e:
         # Handle connection error here
@@ -1798,6 +1761,7 @@ async def delete_pipeline(form_data: DeletePipelineForm, user=Depends(get_admin_
         r.raise_for_status()
         data = r.json()
 
+        model_catalog.invalidate()
         return {**data}
     except Exception as e:
         # Handle connection error here
@@ -1954,6 +1918,7 @@ async def update_pipeline_valves(
         r.raise_for_status()
         data = r.json()
 
+        model_catalog.invalidate()
         return {**data}
     except Exception as e:
         # Handle connection error here
@@ -2065,6 +2030,17 @@ async def update_webhook_url(form_data: UrlForm, user=Depends(get_admin_user)):
     return {"url": app.state.config.WEBHOOK_URL}
 
 
+@app.get("/api/upstreams/stats")
+async def get_upstream_stats(user=Depends(get_admin_user)):
+    return {
+        "coalescing": upstream_reads.get_stats(),
+        "admission": upstream_admission.get_stats(),
+        "cancellation": upstream_streams.get_stats(),
+        "pipeline_filters": pipeline_filters.get_stats(),
+        "function_workers": function_workers.get_stats(),
+    }
+
+
 @app.get("/api/version")
 async def get_app_config():
     return {
@@ -2203,6 +2179,9 @@ async def oauth_callback(provider: str, request: Request, response: Response):
             if not picture_url:
                 picture_url = "/user.png"
             username_claim = webui_app.state.config.OAUTH_USERNAME_CLAIM
+            # Random password, not used
+            hashed = await password_executor.run(get_password_hash, str(uuid.uuid4()))
+            # No await between counting the users and the insert
             role = (
                 "admin"
                 if Users.get_num_users() == 0
@@ -2210,9 +2189,7 @@ async def oauth_callback(provider: str, request: Request, response: Response):
             )
             user = Auths.insert_new_auth(
                 email=email,
-                password=get_password_hash(
-                    str(uuid.uuid4())
-                ),  # Random password, not used
+                password=hashed,
                 name=user_data.get(username_claim, "User"),
                 profile_image_url=picture_url,
                 role=role,
@@ -7,3 +7,16 @@ def get_existing_tables():
     inspector = Inspector.from_engine(con)
     tables = set(inspector.get_table_names())
     return tables
+
+
+def get_indexed_columns(table: str):
+    """Column lists of the indexes and unique constraints of `table`."""
+    con = op.get_bind()
+    inspector = Inspector.from_engine(con)
+    return {
+        tuple(index["column_names"])
+        for index in [
+            *inspector.get_indexes(table),
+            *inspector.get_unique_constraints(table),
+        ]
+    }
@@ -0,0 +1,44 @@
+"""add chat list indexes
+
+Revision ID: c1d6a5e4f7b2
+Revises: 7e5b5dc7342b
+Create Date: 2024-07-08 10:12:41.517204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import apps.webui.internal.db
+from migrations.util import get_indexed_columns
+
+# revision identifiers, used by Alembic.
+revision: str = "c1d6a5e4f7b2"
+down_revision: Union[str, None] = "7e5b5dc7342b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    indexed_columns = get_indexed_columns("chat")
+
+    # Chat lists of a user, newest first, with the id for keyset pagination
+    if ("user_id", "archived", "updated_at", "id") not in indexed_columns:
+        op.create_index(
+            "ix_chat_user_id_archived_updated_at",
+            "chat",
+            ["user_id", "archived", "updated_at", "id"],
+        )
+
+    # Databases created by alembic or the peewee migrations already have one
+    # through the unique constraint
+    if ("share_id",) not in indexed_columns:
+        op.create_index("ix_chat_share_id", "chat", ["share_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chat_user_id_archived_updated_at", table_name="chat")
+    indexes = [index["name"] for index in sa.inspect(op.get_bind()).get_indexes("chat")]
+    if "ix_chat_share_id" in indexes:
+        op.drop_index("ix_chat_share_id", table_name="chat")
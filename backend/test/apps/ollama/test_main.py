@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from test.util.mock_user import mock_user
+
+URLS = ["http://node-0:11434", "http://node-1:11434"]
+
+
+class TestGenerateChatCompletion:
+    def setup_method(self):
+        import apps.ollama.main as ollama
+        from apps.ollama.routing import NodeRouter
+
+        self.ollama = ollama
+        self.state = {
+            name: getattr(ollama.app.state, name)
+            for name in ("config", "MODELS", "ROUTER")
+        }
+        ollama.app.state.config = SimpleNamespace(
+            OLLAMA_BASE_URLS=URLS,
+            OLLAMA_BASE_URL_WEIGHTS=[1.0, 1.0],
+            OLLAMA_ROUTING_MODE="residency",
+        )
+        ollama.app.state.MODELS = {"llama3:latest": {"urls": [0, 1]}}
+        ollama.app.state.ROUTER = NodeRouter()
+        self.fast_api_client = TestClient(ollama.app)
+
+    def teardown_method(self):
+        for name, value in self.state.items():
+            setattr(self.ollama.app.state, name, value)
+
+    def test_chat_sticks_to_its_node(self, monkeypatch):
+        async def post_streaming_url(url, payload, stream=True, base_url=None):
+            return JSONResponse({"url": base_url})
+
+        monkeypatch.setattr(self.ollama, "post_streaming_url", post_streaming_url)
+        monkeypatch.setattr(self.ollama.Models, "get_model_by_id", lambda id: None)
+
+        nodes = set()
+        with mock_user(self.ollama.app, id="2"):
+            for _ in range(10):
+                # Nothing resident, only the chat_id can keep the chat in place
+                for url in URLS:
+                    self.ollama.app.state.ROUTER.set_resident(url, [])
+                response = self.fast_api_client.post(
+                    "/api/chat",
+                    json={
+                        "model": "llama3",
+                        "messages": [{"role": "user", "content": "Hi"}],
+                        "metadata": {"chat_id": "chat-1"},
+                    },
+                )
+                assert response.status_code == 200
+                nodes.add(response.json()["url"])
+        assert len(nodes) == 1
@@ -41,6 +41,38 @@ class TestChats(AbstractPostgresTest):
         assert first_chat["created_at"] is not None
         assert first_chat["updated_at"] is not None
 
+    def test_get_session_user_chat_list_pages(self):
+        from apps.webui.models.chats import ChatForm
+
+        for i in range(4):
+            self.chats.insert_new_chat("2", ChatForm(chat={"title": f"chat{i}"}))
+
+        chat_ids = []
+        cursor = None
+        with mock_webui_user(id="2"):
+            while True:
+                params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+                response = self.fast_api_client.get(
+                    self.create_url("/list"), params=params
+                )
+                assert response.status_code == 200
+                assert len(response.json()) <= 2
+                chat_ids.extend(chat["id"] for chat in response.json())
+                cursor = response.headers.get("X-Next-Cursor")
+                if cursor is None:
+                    break
+
+            # Old clients get the whole list
+            response = self.fast_api_client.get(self.create_url("/list"))
+        assert chat_ids == [chat["id"] for chat in response.json()]
+        assert len(chat_ids) == 5
+
+        with mock_webui_user(id="2"):
+            response = self.fast_api_client.get(
+                self.create_url("/list"), params={"cursor": "invalid"}
+            )
+        assert response.status_code == 400
+
     def test_delete_all_user_chats(self):
         with mock_webui_user(id="2"):
             response = self.fast_api_client.delete(self.create_url("/"))
@@ -0,0 +1,115 @@
+"""
+Cost of the sidebar chat list of a user with 100k chats, on SQLite.
+
+    cd backend && python -m test.benchmarks.bench_chat_list [--chats 100000] [--chat-size 1024]
+
+Compares the old query, which loaded every chat of the user with its JSON and
+sorted them without an index, with the pages of ChatTable.paginate through
+the ix_chat_user_id_archived_updated_at index: the first page, a deep page by
+offset and the same page by cursor. The chat table lives in a temporary
+database next to 3 other users with as many chats.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from apps.webui.models.chats import Chat, ChatModel, Chats, encode_chat_cursor
+
+
+def old_chat_list(db, user_id: str):
+    all_chats = (
+        db.query(Chat)
+        .filter_by(user_id=user_id, archived=False)
+        .order_by(Chat.updated_at.desc())
+        .all()
+    )
+    return [ChatModel.model_validate(chat) for chat in all_chats]
+
+
+def bench(fn, runs: int) -> float:
+    fn()
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+def populate(engine, users: int, chats: int, chat_size: int):
+    chat = "x" * chat_size
+    with engine.begin() as connection:
+        for user in range(users):
+            rows = [
+                {
+                    "id": f"{user}-{i:08}",
+                    "user_id": f"user-{user}",
+                    "title": f"Chat {i}",
+                    "chat": chat,
+                    "created_at": i,
+                    # Imports and bulk edits leave many chats with the same time
+                    "updated_at": 1_700_000_000 + i // 4,
+                    "share_id": None,
+                    "archived": i % 20 == 0,
+                }
+                for i in range(chats)
+            ]
+            for start in range(0, chats, 10_000):
+                connection.execute(insert(Chat), rows[start : start + 10_000])
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'webui.db')}")
+        Chat.__table__.create(engine)
+        index = next(iter(Chat.__table__.indexes))
+        index.drop(engine)
+        populate(engine, 4, args.chats, args.chat_size)
+        db = sessionmaker(bind=engine)()
+
+        print(
+            f"{args.chats} chats per user of {args.chat_size} bytes, "
+            f"page of {args.limit}, median of {args.runs} runs"
+        )
+        stats = {"old, no index": bench(lambda: old_chat_list(db, "user-0"), 3)}
+
+        index.create(engine)
+        query = lambda: db.query(Chat).filter_by(user_id="user-0", archived=False)
+        page = lambda **kwargs: Chats.get_chat_title_id_list(
+            Chats.paginate(query(), **kwargs)
+        )
+
+        stats["full list, no chat JSON"] = bench(lambda: page(), 3)
+        stats["first page"] = bench(lambda: page(limit=args.limit), args.runs)
+
+        depth = args.chats // 2
+        chats = page(skip=depth - 1, limit=1)
+        cursor = encode_chat_cursor(chats[0].updated_at, chats[0].id)
+        stats[f"page at {depth}, offset"] = bench(
+            lambda: page(skip=depth, limit=args.limit), args.runs
+        )
+        stats[f"page at {depth}, cursor"] = bench(
+            lambda: page(cursor=cursor, limit=args.limit), args.runs
+        )
+        assert [chat.id for chat in page(cursor=cursor, limit=args.limit)] == [
+            chat.id for chat in page(skip=depth, limit=args.limit)
+        ]
+
+        for label, ms in stats.items():
+            print(f"  {label:<28} {ms:9.2f}ms")
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=100_000)
+    parser.add_argument("--chat-size", type=int, default=1024)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,197 @@
+"""
+Overhead of the chat completion middleware chain, per request and per streamed
+chunk: the previous PipelineMiddleware + ChatCompletionMiddleware pair of
+BaseHTTPMiddleware subclasses, each parsing and re-serializing the body, against
+the pure ASGI utils.asgi.ChatCompletionMiddleware. The stages themselves are
+no-ops, requests are sent straight to the ASGI app without a server.
+
+    cd backend && python -m test.benchmarks.bench_chat_middleware [--requests 2000] [--chunks 2000]
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from utils.asgi import ChatCompletionMiddleware
+
+CHUNK = b'data: {"choices": [{"delta": {"content": "token "}}]}\n\n'
+
+
+def make_body(messages: int) -> bytes:
+    return json.dumps(
+        {
+            "model": "mock",
+            "stream": True,
+            "chat_id": "chat",
+            "id": "message",
+            "messages": [
+                {"role": "user" if i % 2 == 0 else "assistant", "content": "hi " * 50}
+                for i in range(messages)
+            ],
+        }
+    ).encode()
+
+
+async def chat_completions(request: Request):
+    body = await request.json()
+    chunks = int(request.query_params.get("chunks", "0"))
+    if not chunks:
+        return JSONResponse({"model": body["model"]})
+
+    async def stream():
+        for _ in range(chunks):
+            yield CHUNK
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def set_body(request: Request, data: dict):
+    body = json.dumps(data).encode("utf-8")
+    request._body = body
+    request.headers.__dict__["_list"] = [
+        (b"content-length", str(len(body)).encode("utf-8")),
+        *[(k, v) for k, v in request.headers.raw if k.lower() != b"content-length"],
+    ]
+
+
+class OldPipelineMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        body = (await request.body()).decode("utf-8")
+        set_body(request, json.loads(body) if body else {})
+        return await call_next(request)
+
+
+class OldChatCompletionMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        body = (await request.body()).decode("utf-8")
+        data = json.loads(body) if body else {}
+        for key in ["chat_id", "id", "session_id"]:
+            data.pop(key, None)
+        data["metadata"] = {"chat_id": "chat", "message_id": "message"}
+        set_body(request, data)
+
+        response = await call_next(request)
+        if isinstance(response, StreamingResponse) and "text/event-stream" in (
+            response.headers.get("Content-Type", "")
+        ):
+            return StreamingResponse(self.stream_wrapper(response.body_iterator))
+        return response
+
+    async def stream_wrapper(self, original_generator):
+        yield f"data: {json.dumps({'citations': []})}\n\n"
+        async for data in original_generator:
+            yield data
+
+
+async def process(request: Request, body: dict):
+    for key in ["chat_id", "id", "session_id"]:
+        body.pop(key, None)
+    body["metadata"] = {"chat_id": "chat", "message_id": "message"}
+    return body, [{"citations": []}]
+
+
+def make_app(chain: str) -> Starlette:
+    app = Starlette(
+        routes=[Route("/chat/completions", chat_completions, methods=["POST"])]
+    )
+    if chain == "old":
+        app.add_middleware(OldChatCompletionMiddleware)
+        app.add_middleware(OldPipelineMiddleware)
+    elif chain == "new":
+        app.add_middleware(ChatCompletionMiddleware, process=process)
+    return app
+
+
+async def call(app, body: bytes, chunks: int) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/chat/completions",
+        "raw_path": b"/chat/completions",
+        "query_string": f"chunks={chunks}".encode(),
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 1),
+        "server": ("127.0.0.1", 80),
+    }
+    request_sent = False
+    disconnected = asyncio.Event()
+    received = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal received
+        if message["type"] == "http.response.body":
+            received += 1
+            if not message.get("more_body", False):
+                disconnected.set()
+
+    await app(scope, receive, send)
+    return received
+
+
+async def bench(chain: str, body: bytes, requests: int, chunks: int) -> dict:
+    app = make_app(chain)
+    for _ in range(20):
+        await call(app, body, 0)
+
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await call(app, body, 0)
+        latencies.append(time.perf_counter() - start)
+
+    streams = []
+    for _ in range(5):
+        start = time.perf_counter()
+        await call(app, body, chunks)
+        streams.append(time.perf_counter() - start)
+
+    return {
+        "request_p50_us": statistics.median(latencies) * 1e6,
+        "request_mean_us": statistics.mean(latencies) * 1e6,
+        "chunk_us": statistics.median(streams) / chunks * 1e6,
+    }
+
+
+async def main(args):
+    body = make_body(args.messages)
+    print(
+        f"{args.requests} requests, {len(body)} byte bodies, {args.chunks} chunk stream"
+    )
+    for chain in ["none", "old", "new"]:
+        stats = await bench(chain, body, args.requests, args.chunks)
+        print(
+            f"{chain:>5}: request p50 {stats['request_p50_us']:8.1f}us"
+            f"  mean {stats['request_mean_us']:8.1f}us"
+            f"  per chunk {stats['chunk_us']:6.2f}us"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
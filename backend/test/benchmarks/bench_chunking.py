@@ -0,0 +1,98 @@
+"""
+Compare the character splitter with the token-aware chunker on a large corpus.
+
+    cd backend && python -m test.benchmarks.bench_chunking [--mb 8] [--model all-MiniLM-L6-v2]
+
+Reports throughput and how many chunks exceed the embedding model's input limit
+(and would be silently truncated when embedded).
+"""
+
+import argparse
+import random
+import time
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from apps.rag.chunking import TokenChunker, hf_offsets, get_tiktoken_encoding
+from apps.rag.chunking import tiktoken_offsets
+
+
+def make_corpus(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = [
+        "".join(
+            rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 12))
+        )
+        for _ in range(5000)
+    ]
+    paragraphs = []
+    length = 0
+    while length < size:
+        sentences = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(5, 30))) + "."
+            for _ in range(rng.randint(1, 8))
+        ]
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def run(name, split, corpus, count_tokens, limit):
+    start = time.perf_counter()
+    chunks = split(corpus)
+    elapsed = time.perf_counter() - start
+    over = sum(1 for chunk in chunks if count_tokens(chunk) > limit)
+    print(
+        f"{name:<12} {elapsed:8.3f}s {len(corpus) / elapsed / 1e6:8.2f} MB/s "
+        f"{len(chunks):8d} chunks {over:8d} over limit"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, default=8)
+    parser.add_argument("--chunk-size", type=int, default=1500)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument(
+        "--model",
+        default=None,
+        help="sentence-transformers model to take the tokenizer from, tiktoken otherwise",
+    )
+    args = parser.parse_args()
+
+    corpus = make_corpus(int(args.mb * 1e6))
+
+    if args.model:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        offsets = hf_offsets(tokenizer)
+        limit = tokenizer.model_max_length - tokenizer.num_special_tokens_to_add()
+    else:
+        offsets = tiktoken_offsets(get_tiktoken_encoding())
+        limit = 512
+
+    def count_tokens(chunk):
+        return len(offsets(chunk))
+
+    character = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        add_start_index=True,
+    )
+    token = TokenChunker(offsets, min(args.chunk_size, limit), args.chunk_overlap)
+
+    print(f"corpus {len(corpus) / 1e6:.1f} MB, token limit {limit}")
+    run(
+        "character",
+        lambda text: [d.page_content for d in character.create_documents([text])],
+        corpus,
+        count_tokens,
+        limit,
+    )
+    run("token", token.split_text, corpus, count_tokens, limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Event loop lag of a worker serving chat streams next to chat list requests,
+with the list endpoint as an `async def` calling the sync table helper (the
+old behaviour) and as a `def` that FastAPI runs on its threadpool, like the
+webui routers now do.
+
+The table helper blocks for `--latency` ms per query, like a SQLAlchemy call
+against a busy database.
+
+    cd backend && python -m test.benchmarks.bench_db_event_loop [--streams 8] [--lists 8] [--latency 20]
+"""
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+
+class ChatsTable:
+    """Stands in for apps.webui.models.chats.Chats, each query blocks its thread."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.queries = 0
+
+    def get_chat_list_by_user_id(self, user_id: str, skip: int = 0, limit: int = 50):
+        time.sleep(self.latency)
+        self.queries += 1
+        return [
+            {"id": f"chat-{i}", "title": f"Chat {i}", "updated_at": i}
+            for i in range(skip, skip + limit)
+        ]
+
+
+def create_app(Chats: ChatsTable, threadpool: bool, lags: list) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        async def monitor():
+            # How late a 5ms sleep wakes up is how long the loop was blocked
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append((time.perf_counter() - start - 0.005) * 1000)
+
+        task = asyncio.create_task(monitor())
+        yield
+        task.cancel()
+
+    app = FastAPI(lifespan=lifespan)
+
+    if threadpool:
+
+        @app.get("/chats")
+        def get_session_user_chat_list(skip: int = 0, limit: int = 50):
+            return Chats.get_chat_list_by_user_id("user", skip, limit)
+
+    else:
+
+        @app.get("/chats")
+        async def get_session_user_chat_list(skip: int = 0, limit: int = 50):
+            return Chats.get_chat_list_by_user_id("user", skip, limit)
+
+    @app.get("/stream")
+    async def stream():
+        async def tokens():
+            for i in range(50):
+                await asyncio.sleep(0.01)
+                yield f"data: token{i}\n\n"
+
+        return StreamingResponse(tokens(), media_type="text/event-stream")
+
+    return app
+
+
+def serve(app: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+async def read_stream(session: aiohttp.ClientSession, url: str) -> list:
+    """Gaps between the chunks of one stream in ms."""
+    gaps = []
+    async with session.get(f"{url}/stream") as response:
+        last = time.perf_counter()
+        async for _ in response.content.iter_any():
+            now = time.perf_counter()
+            gaps.append((now - last) * 1000)
+            last = now
+    return gaps
+
+
+async def list_chats(session: aiohttp.ClientSession, url: str, until: float) -> int:
+    requests = 0
+    while time.perf_counter() < until:
+        async with session.get(f"{url}/chats") as response:
+            await response.read()
+        requests += 1
+    return requests
+
+
+async def traffic(url: str, streams: int, lists: int, rounds: int):
+    async with aiohttp.ClientSession() as session:
+        gaps = []
+        requests = 0
+        start = time.perf_counter()
+        for _ in range(rounds):
+            until = time.perf_counter() + 0.6
+            results = await asyncio.gather(
+                *[read_stream(session, url) for _ in range(streams)],
+                *[list_chats(session, url, until) for _ in range(lists)],
+            )
+            for gap in results[:streams]:
+                gaps.extend(gap)
+            requests += sum(results[streams:])
+        return gaps, requests, time.perf_counter() - start
+
+
+def p99(values: list) -> float:
+    values = sorted(values)
+    return values[max(int(len(values) * 0.99) - 1, 0)]
+
+
+def run(label: str, threadpool: bool, port: int, args):
+    Chats = ChatsTable(args.latency / 1000)
+    lags = []
+    server = serve(create_app(Chats, threadpool, lags), port)
+    try:
+        gaps, requests, elapsed = asyncio.run(
+            traffic(f"http://127.0.0.1:{port}", args.streams, args.lists, args.rounds)
+        )
+    finally:
+        server.should_exit = True
+
+    print(
+        f"{label:<10} loop lag p50 {statistics.median(lags):7.1f}ms  "
+        f"p99 {p99(lags):7.1f}ms  max {max(lags):7.1f}ms  |  "
+        f"chunk gap p50 {statistics.median(gaps):6.1f}ms  p99 {p99(gaps):7.1f}ms  |  "
+        f"{requests / elapsed:6.1f} chat lists/s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--lists", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=20, help="ms per query")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--port", type=int, default=18491)
+    args = parser.parse_args()
+
+    print(
+        f"{args.streams} streams, {args.lists} chat list clients, "
+        f"{args.latency}ms per query"
+    )
+    run("async def", False, args.port, args)
+    run("def", True, args.port + 1, args)
@@ -0,0 +1,203 @@
+"""
+Per-request cost of resolving and preparing the filters of a chat request, with
+10 active filters.
+
+    cd backend && python -m test.benchmarks.bench_function_registry [--db-latency-ms 0.2]
+
+Compares the old path, which listed the global and active filters, looked each
+filter up once per sort comparison and again to run it, re-read and rebuilt its
+valves and inspected its inlet signature on every request, with
+utils.registry.FunctionRegistry. The functions table is simulated in memory
+with a fixed latency per query, filter inlets are no-ops.
+"""
+
+import argparse
+import inspect
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+from pydantic import BaseModel
+
+import utils.registry
+from utils.registry import FunctionRegistry
+
+
+class Filter:
+    class Valves(BaseModel):
+        priority: int = 0
+        threshold: float = 0.5
+        label: Optional[str] = None
+
+    def __init__(self):
+        self.valves = self.Valves()
+
+    def inlet(self, body: dict, __user__: Optional[dict] = None) -> dict:
+        return body
+
+
+class FunctionsTable:
+    """The queries of apps.webui.models.functions.Functions used by chat requests."""
+
+    def __init__(self, filters: int, latency: float):
+        self.latency = latency
+        self.queries = 0
+        self.functions = {
+            f"filter_{i}": SimpleNamespace(
+                id=f"filter_{i}", type="filter", is_active=True, is_global=i % 2 == 0
+            )
+            for i in range(filters)
+        }
+        self.valves = {
+            id: {"priority": filters - i, "label": id}
+            for i, id in enumerate(self.functions)
+        }
+
+    def query(self):
+        self.queries += 1
+        deadline = time.perf_counter() + self.latency
+        while time.perf_counter() < deadline:
+            pass
+
+    def get_function_by_id(self, id):
+        self.query()
+        return self.functions.get(id)
+
+    def get_global_filter_functions(self):
+        self.query()
+        return [function for function in self.functions.values() if function.is_global]
+
+    def get_functions_by_type(self, type, active_only=False):
+        self.query()
+        return [
+            function
+            for function in self.functions.values()
+            if function.type == type and (function.is_active or not active_only)
+        ]
+
+    def get_function_valves_by_id(self, id):
+        self.query()
+        return self.valves.get(id, {})
+
+
+def old_get_filter_function_ids(Functions, model):
+    def get_priority(function_id):
+        function = Functions.get_function_by_id(function_id)
+        if function is not None and hasattr(function, "valves"):
+            return (function.valves if function.valves else {}).get("priority", 0)
+        return 0
+
+    filter_ids = [function.id for function in Functions.get_global_filter_functions()]
+    if "info" in model and "meta" in model["info"]:
+        filter_ids.extend(model["info"]["meta"].get("filterIds", []))
+        filter_ids = list(set(filter_ids))
+
+    enabled_filter_ids = [
+        function.id
+        for function in Functions.get_functions_by_type("filter", active_only=True)
+    ]
+
+    filter_ids = [
+        filter_id for filter_id in filter_ids if filter_id in enabled_filter_ids
+    ]
+
+    filter_ids.sort(key=get_priority)
+    return filter_ids
+
+
+def old_request(Functions, modules, model, body):
+    for filter_id in old_get_filter_function_ids(Functions, model):
+        filter = Functions.get_function_by_id(filter_id)
+        if not filter:
+            continue
+
+        function_module = modules[filter_id]
+        if hasattr(function_module, "valves") and hasattr(function_module, "Valves"):
+            valves = Functions.get_function_valves_by_id(filter_id)
+            function_module.valves = function_module.Valves(
+                **(valves if valves else {})
+            )
+
+        inlet = function_module.inlet
+        sig = inspect.signature(inlet)
+        params = {"body": body}
+        if "__user__" in sig.parameters:
+            params["__user__"] = {"id": "user"}
+        body = inlet(**params)
+    return body
+
+
+def new_request(registry, model, body):
+    for filter in registry.get_filters(model):
+        inlet = filter.module.inlet
+        sig = filter.get_signature("inlet")
+        params = {"body": body}
+        if "__user__" in sig.parameters:
+            params["__user__"] = {"id": "user"}
+        body = inlet(**params)
+    return body
+
+
+def bench(run, requests: int) -> dict:
+    for _ in range(20):
+        run()
+
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - start)
+    return {
+        "p50_us": statistics.median(latencies) * 1e6,
+        "mean_us": statistics.mean(latencies) * 1e6,
+    }
+
+
+def main(args):
+    latency = args.db_latency_ms / 1000
+    model = {
+        "id": "model",
+        "info": {
+            "meta": {"filterIds": [f"filter_{i}" for i in range(1, args.filters, 2)]}
+        },
+    }
+    body = {"model": "model", "messages": [{"role": "user", "content": "hi"}]}
+    print(
+        f"{args.filters} filters, {args.requests} requests, "
+        f"{args.db_latency_ms}ms per query"
+    )
+
+    Functions = FunctionsTable(args.filters, latency)
+    modules = {id: Filter() for id in Functions.functions}
+    stats = bench(lambda: old_request(Functions, modules, model, body), args.requests)
+    queries = Functions.queries / (args.requests + 20)
+    print(
+        f"  old: p50 {stats['p50_us']:9.1f}us  mean {stats['mean_us']:9.1f}us"
+        f"  {queries:5.1f} queries per request"
+    )
+
+    Functions = FunctionsTable(args.filters, latency)
+    utils.registry.Functions = Functions
+    registry = FunctionRegistry()
+    registry.functions.update({id: Filter() for id in Functions.functions})
+    stats = bench(lambda: new_request(registry, model, body), args.requests)
+    queries = Functions.queries / (args.requests + 20)
+    print(
+        f"  new: p50 {stats['p50_us']:9.1f}us  mean {stats['mean_us']:9.1f}us"
+        f"  {queries:5.1f} queries per request"
+    )
+
+    # First request after an update reloads the filters
+    start = time.perf_counter()
+    registry.invalidate_function("filter_0")
+    new_request(registry, model, body)
+    print(f"  new, after invalidation: {(time.perf_counter() - start) * 1e6:9.1f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filters", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--db-latency-ms", type=float, default=0.2)
+    main(parser.parse_args())
@@ -0,0 +1,252 @@
+"""
+Model catalog merge and lookup cost with 500 upstream and 200 custom models.
+
+    cd backend && python -m test.benchmarks.bench_model_catalog [--db-latency-ms 0.2]
+
+Compares the old nested merge, which scanned every model for every custom model
+and looked each action up in the database, with utils.catalog.merge_custom_models,
+and the cost of a /api/models lookup with and without the cached catalog.
+"""
+
+import argparse
+import asyncio
+import copy
+import statistics
+import time
+from types import SimpleNamespace
+
+from utils.catalog import ModelCatalog, merge_custom_models
+
+
+class CustomModel(SimpleNamespace):
+    def model_dump(self):
+        return {
+            "id": self.id,
+            "base_model_id": self.base_model_id,
+            "name": self.name,
+            "meta": self.meta,
+        }
+
+
+def make_data(upstream: int, custom: int, actions: int):
+    models = []
+    for i in range(upstream):
+        if i % 2:
+            models.append(
+                {"id": f"model{i}:latest", "name": f"model{i}", "owned_by": "ollama"}
+            )
+        else:
+            models.append({"id": f"gpt-{i}", "name": f"gpt-{i}", "owned_by": "openai"})
+
+    functions = {
+        f"action{i}": SimpleNamespace(
+            id=f"action{i}",
+            name=f"Action {i}",
+            meta=SimpleNamespace(description="", manifest={}),
+        )
+        for i in range(actions)
+    }
+
+    custom_models = []
+    for i in range(custom):
+        meta = {"actionIds": [f"action{i % actions}", f"action{(i + 1) % actions}"]}
+        if i % 4 == 0:
+            # Renames an upstream model
+            custom_models.append(
+                CustomModel(
+                    id=f"model{i * 2 % upstream + 1}",
+                    base_model_id=None,
+                    name=f"Custom {i}",
+                    meta=meta,
+                    created_at=0,
+                )
+            )
+        else:
+            custom_models.append(
+                CustomModel(
+                    id=f"custom{i}",
+                    base_model_id=models[i * 7 % upstream]["id"],
+                    name=f"Custom {i}",
+                    meta=meta,
+                    created_at=0,
+                )
+            )
+    return models, custom_models, functions
+
+
+def merge_nested(models, custom_models, global_action_ids, functions, get_function):
+    """The merge as it was done before, kept here for comparison."""
+    enabled_action_ids = list(functions.keys())
+    for custom_model in custom_models:
+        if custom_model.base_model_id == None:
+            for model in models:
+                if (
+                    custom_model.id == model["id"]
+                    or custom_model.id == model["id"].split(":")[0]
+                ):
+                    model["name"] = custom_model.name
+                    model["info"] = custom_model.model_dump()
+
+                    action_ids = [] + global_action_ids
+                    if "info" in model and "meta" in model["info"]:
+                        action_ids.extend(model["info"]["meta"].get("actionIds", []))
+                        action_ids = list(dict.fromkeys(action_ids))
+                    action_ids = [
+                        action_id
+                        for action_id in action_ids
+                        if action_id in enabled_action_ids
+                    ]
+
+                    model["actions"] = []
+                    for action_id in action_ids:
+                        action = get_function(action_id)
+                        model["actions"].append(
+                            {
+                                "id": action_id,
+                                "name": action.name,
+                                "description": action.meta.description,
+                                "icon_url": action.meta.manifest.get("icon_url", None),
+                            }
+                        )
+        else:
+            owned_by = "openai"
+            pipe = None
+            actions = []
+
+            for model in models:
+                if (
+                    custom_model.base_model_id == model["id"]
+                    or custom_model.base_model_id == model["id"].split(":")[0]
+                ):
+                    owned_by = model["owned_by"]
+                    if "pipe" in model:
+                        pipe = model["pipe"]
+
+                    action_ids = [] + global_action_ids
+                    if "info" in model and "meta" in model["info"]:
+                        action_ids.extend(model["info"]["meta"].get("actionIds", []))
+                        action_ids = list(dict.fromkeys(action_ids))
+                    action_ids = [
+                        action_id
+                        for action_id in action_ids
+                        if action_id in enabled_action_ids
+                    ]
+
+                    actions = [
+                        {
+                            "id": action_id,
+                            "name": get_function(action_id).name,
+                            "description": get_function(action_id).meta.description,
+                        }
+                        for action_id in action_ids
+                    ]
+                    break
+
+            models.append(
+                {
+                    "id": custom_model.id,
+                    "name": custom_model.name,
+                    "object": "model",
+                    "created": custom_model.created_at,
+                    "owned_by": owned_by,
+                    "info": custom_model.model_dump(),
+                    "preset": True,
+                    **({"pipe": pipe} if pipe is not None else {}),
+                    "actions": actions,
+                }
+            )
+    return models
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+async def bench_catalog(upstream_latency: float, requests: int):
+    async def loader():
+        await asyncio.sleep(upstream_latency)
+        return []
+
+    uncached = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await loader()
+        uncached.append(time.perf_counter() - start)
+
+    catalog = ModelCatalog(ttl=60)
+    catalog.loader = loader
+    await catalog.get()
+    cached = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await catalog.get()
+        cached.append(time.perf_counter() - start)
+
+    print(
+        f"/api/models lookup: uncached p50 {statistics.median(uncached) * 1000:.2f}ms, "
+        f"cached p50 {statistics.median(cached) * 1e6:.1f}us"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--upstream", type=int, default=500)
+    parser.add_argument("--custom", type=int, default=200)
+    parser.add_argument("--actions", type=int, default=10)
+    parser.add_argument("--db-latency-ms", type=float, default=0.2)
+    parser.add_argument("--upstream-latency-ms", type=float, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    models, custom_models, functions = make_data(
+        args.upstream, args.custom, args.actions
+    )
+    global_action_ids = ["action0"]
+
+    def get_function(id):
+        # Stands in for Functions.get_function_by_id, one query per call
+        time.sleep(args.db_latency_ms / 1000)
+        return functions[id]
+
+    old = merge_nested(
+        copy.deepcopy(models), custom_models, global_action_ids, functions, get_function
+    )
+    new = merge_custom_models(
+        copy.deepcopy(models), custom_models, global_action_ids, functions
+    )
+    assert old == new, "merge results differ"
+
+    nested = timed(
+        lambda: merge_nested(
+            copy.deepcopy(models),
+            custom_models,
+            global_action_ids,
+            functions,
+            get_function,
+        ),
+        args.repeat,
+    )
+    indexed = timed(
+        lambda: merge_custom_models(
+            copy.deepcopy(models), custom_models, global_action_ids, functions
+        ),
+        args.repeat,
+    )
+    copying = timed(lambda: copy.deepcopy(models), args.repeat)
+
+    print(
+        f"merge {args.upstream} upstream x {args.custom} custom models: "
+        f"nested {(nested - copying) * 1000:.1f}ms, "
+        f"indexed {(indexed - copying) * 1000:.2f}ms"
+    )
+
+    asyncio.run(bench_catalog(args.upstream_latency_ms / 1000, 100))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Gaps between the chunks of a streamed response while concurrent sign-ins
+verify their password with bcrypt on the event loop (the old behaviour) and
+on the password threads from utils.passwords.
+
+    cd backend && python -m test.benchmarks.bench_password_hashing [--logins 100] [--queue-size 128]
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from utils.passwords import PasswordExecutor
+
+# Same context as utils.utils
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+PASSWORD = "correct horse battery staple"
+HASHED = pwd_context.hash(PASSWORD)
+# One warning per rejected sign-in
+logging.getLogger("utils.passwords").setLevel(logging.ERROR)
+
+
+def authenticate_user(password: str) -> bool:
+    return pwd_context.verify(password, HASHED)
+
+
+async def inline(logins: int, executor: PasswordExecutor):
+    async def signin():
+        # Let the stream start before the storm
+        await asyncio.sleep(0.05)
+        authenticate_user(PASSWORD)
+
+    await asyncio.gather(*[signin() for _ in range(logins)])
+    return logins, 0
+
+
+async def bounded(logins: int, executor: PasswordExecutor):
+    async def signin() -> bool:
+        await asyncio.sleep(0.05)
+        try:
+            return await executor.run(authenticate_user, PASSWORD)
+        except HTTPException:
+            return False
+
+    results = await asyncio.gather(*[signin() for _ in range(logins)])
+    return sum(results), results.count(False)
+
+
+async def measure(mode, logins: int, executor: PasswordExecutor, interval: float):
+    """Run the sign-ins next to 4 streams, returns how late their chunks were in ms."""
+    gaps = []
+
+    async def stream():
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            gaps.append((now - last - interval) * 1000)
+            last = now
+
+    streams = [asyncio.create_task(stream()) for _ in range(4)]
+    start = time.perf_counter()
+    signed_in, rejected = await mode(logins, executor)
+    elapsed = time.perf_counter() - start
+    for task in streams:
+        task.cancel()
+    await asyncio.gather(*streams, return_exceptions=True)
+    return gaps, signed_in, rejected, elapsed
+
+
+def report(label: str, gaps: list, signed_in: int, rejected: int, elapsed: float):
+    gaps = sorted(gaps)
+    p99 = gaps[int(len(gaps) * 0.99) - 1] if gaps else 0.0
+    print(
+        f"{label:<10} signed in {signed_in:>4}  rejected {rejected:>4}  "
+        f"in {elapsed:6.2f}s  chunk delay p50 {statistics.median(gaps):8.1f}ms  "
+        f"p99 {p99:8.1f}ms  max {gaps[-1]:8.1f}ms"
+    )
+
+
+async def main(args):
+    interval = args.interval / 1000
+    executor = PasswordExecutor(threads=args.threads, queue_size=args.queue_size)
+
+    async def idle(logins, executor):
+        await asyncio.sleep(1)
+        return 0, 0
+
+    report("idle", *await measure(idle, args.logins, executor, interval))
+    report("inline", *await measure(inline, args.logins, executor, interval))
+    report("executor", *await measure(bounded, args.logins, executor, interval))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=128)
+    parser.add_argument(
+        "--interval", type=float, default=10, help="ms between stream chunks"
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""
+Time to first token of a streamed chat completion against a local mock backend,
+with a new aiohttp session per request (the old behaviour) and with the pooled
+sessions from utils.upstream.
+
+    cd backend && python -m test.benchmarks.bench_upstream_ttft [--requests 500] [--concurrency 8]
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+
+from utils.upstream import UpstreamClients
+
+
+async def chat_completions(request: web.Request):
+    await request.read()
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for i in range(8):
+        chunk = {"choices": [{"delta": {"content": f"token{i} "}}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def start_backend(port: int) -> web.AppRunner:
+    backend = web.Application()
+    backend.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(backend, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+PAYLOAD = json.dumps(
+    {"model": "mock", "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+)
+
+
+async def stream(session: aiohttp.ClientSession, url: str) -> float:
+    start = time.perf_counter()
+    async with session.post(url, data=PAYLOAD) as response:
+        ttft = None
+        async for _ in response.content:
+            if ttft is None:
+                ttft = time.perf_counter() - start
+    return ttft
+
+
+async def per_request(url: str) -> float:
+    async with aiohttp.ClientSession(trust_env=True) as session:
+        return await stream(session, url)
+
+
+async def pooled(clients: UpstreamClients, url: str) -> float:
+    return await stream(await clients.get_session(url), url)
+
+
+async def measure(name, make_request, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            return await make_request()
+
+    start = time.perf_counter()
+    ttfts = sorted(await asyncio.gather(*[one() for _ in range(requests)]))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<12} p50 {statistics.median(ttfts) * 1000:7.2f}ms "
+        f"p99 {ttfts[int(len(ttfts) * 0.99) - 1] * 1000:7.2f}ms "
+        f"{requests / elapsed:8.1f} req/s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=18080)
+    args = parser.parse_args()
+
+    runner = await start_backend(args.port)
+    url = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+    clients = UpstreamClients()
+    try:
+        # Warm up both paths once
+        await per_request(url)
+        await pooled(clients, url)
+
+        await measure(
+            "per-request",
+            lambda: per_request(url),
+            args.requests,
+            args.concurrency,
+        )
+        await measure(
+            "pooled",
+            lambda: pooled(clients, url),
+            args.requests,
+            args.concurrency,
+        )
+    finally:
+        await clients.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
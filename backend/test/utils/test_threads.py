@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.threads import iterate_in_thread
+
+
+def slow_tokens(count: int, delay: float):
+    # A pipe streaming from a remote API with a sync client
+    for i in range(count):
+        time.sleep(delay)
+        yield f"token {i}"
+
+
+async def consume(iterator) -> list:
+    return [item async for item in iterator]
+
+
+class TestIterateInThread:
+    def test_concurrent_streams_are_not_serialized(self):
+        streams, tokens, delay = 4, 5, 0.1
+
+        async def inline():
+            async def stream():
+                for item in slow_tokens(tokens, delay):
+                    yield item
+
+            return await asyncio.gather(*[consume(stream()) for _ in range(streams)])
+
+        async def bridged():
+            return await asyncio.gather(
+                *[
+                    consume(iterate_in_thread(slow_tokens(tokens, delay)))
+                    for _ in range(streams)
+                ]
+            )
+
+        start = time.perf_counter()
+        inline_results = asyncio.run(inline())
+        inline_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        bridged_results = asyncio.run(bridged())
+        bridged_elapsed = time.perf_counter() - start
+
+        assert bridged_results == inline_results
+        # Iterated on the event loop the streams take turns, one token at a time
+        assert inline_elapsed >= streams * tokens * delay
+        assert bridged_elapsed < 2 * tokens * delay
+
+    def test_event_loop_keeps_running(self):
+        async def main():
+            ticks = 0
+            done = asyncio.Event()
+
+            async def ticker():
+                nonlocal ticks
+                while not done.is_set():
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            task = asyncio.create_task(ticker())
+            await consume(iterate_in_thread(slow_tokens(3, 0.1)))
+            done.set()
+            await task
+            return ticks
+
+        assert asyncio.run(main()) >= 10
+
+    def test_backpressure(self):
+        produced = 0
+
+        def tokens():
+            nonlocal produced
+            while True:
+                produced += 1
+                yield produced
+
+        async def main():
+            stream = iterate_in_thread(tokens(), max_buffer=4)
+            assert await stream.__anext__() == 1
+            await asyncio.sleep(0.3)
+            await stream.aclose()
+
+        asyncio.run(main())
+        # The item handed over, a full buffer and the one waiting to be queued
+        assert produced <= 6
+
+    def test_stopping_early_closes_the_iterator(self):
+        closed = threading.Event()
+
+        def tokens():
+            try:
+                for i in range(1000):
+                    time.sleep(0.01)
+                    yield i
+            finally:
+                closed.set()
+
+        async def main():
+            stream = iterate_in_thread(tokens())
+            async for item in stream:
+                if item == 2:
+                    break
+            await stream.aclose()
+
+        asyncio.run(main())
+        assert closed.wait(timeout=1)
+
+    def test_cancelled_consumer_stops_the_thread(self):
+        closed = threading.Event()
+
+        def tokens():
+            try:
+                while True:
+                    time.sleep(0.01)
+                    yield "token"
+            finally:
+                closed.set()
+
+        async def main():
+            task = asyncio.create_task(consume(iterate_in_thread(tokens())))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+        assert closed.wait(timeout=1)
+
+    def test_errors_are_raised_to_the_consumer(self):
+        def tokens():
+            yield "token"
+            raise ValueError("upstream failed")
+
+        with pytest.raises(ValueError, match="upstream failed"):
+            asyncio.run(consume(iterate_in_thread(tokens())))
@@ -0,0 +1,48 @@
+import asyncio
+import gc
+from types import SimpleNamespace
+
+import pytest
+
+import utils.workers
+from utils.workers import WorkerPool, WorkerStream
+
+PIPE = """
+class Pipe:
+    def pipe(self, body):
+        for i in range(3):
+            yield i
+"""
+
+
+@pytest.fixture
+def entry(tmp_path, monkeypatch):
+    (tmp_path / "counter.py").write_text(PIPE)
+    monkeypatch.setattr(utils.workers, "FUNCTIONS_DIR", str(tmp_path))
+    return SimpleNamespace(kind="function", id="counter", version=1, valves={})
+
+
+class TestWorkerPool:
+    def test_abandoned_stream_frees_its_worker(self, entry):
+        async def run():
+            pool = WorkerPool(size=1, timeout=5, memory_limit=0)
+            try:
+                # Dropped before the first item
+                items = await pool.call(entry, "pipe", {"body": {}}, stream=True)
+                assert isinstance(items, WorkerStream)
+                del items
+                gc.collect()
+                assert await pool.call(entry, "pipe", {"body": {}}) == [0, 1, 2]
+
+                # Closed after the first item
+                items = await pool.call(entry, "pipe", {"body": {}}, stream=True)
+                assert await items.__anext__() == 0
+                await items.aclose()
+                assert await pool.call(entry, "pipe", {"body": {}}) == [0, 1, 2]
+                return pool.get_stats()
+            finally:
+                pool.shutdown()
+
+        stats = asyncio.run(run())
+        assert stats["idle"] == 1
+        assert stats["restarts"] == 2
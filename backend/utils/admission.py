@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Awaitable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from starlette.background import BackgroundTasks
+from starlette.responses import StreamingResponse
+
+from constants import ERROR_MESSAGES, TASKS
+from utils.misc import percentile
+from config import (
+    SRC_LOG_LEVELS,
+    UPSTREAM_MAX_CONCURRENCY_PER_BACKEND,
+    UPSTREAM_MAX_CONCURRENCY_PER_MODEL,
+    UPSTREAM_CONCURRENCY_LIMITS,
+    UPSTREAM_QUEUE_SIZE,
+    UPSTREAM_QUEUE_TIMEOUT,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    TOOLS = 1
+    BACKGROUND = 2
+
+
+def get_priority(metadata: Optional[dict]) -> Priority:
+    """Chat turns go first, then tool selection, then title, emoji and query generation."""
+    task = (metadata or {}).get("task")
+    if task is None:
+        return Priority.INTERACTIVE
+    if task == str(TASKS.FUNCTION_CALLING):
+        return Priority.TOOLS
+    return Priority.BACKGROUND
+
+
+class Waiter:
+    def __init__(self, keys: List[Tuple[str, Optional[int]]], priority: Priority):
+        self.keys = keys
+        self.priority = priority
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.perf_counter()
+        self.admitted = False
+
+
+class AdmissionTicket:
+    """A slot on a backend and model, held until `release`."""
+
+    def __init__(self, controller: "AdmissionController", keys: List[str]):
+        self.controller = controller
+        self.keys = keys
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller.release(self.keys)
+
+    async def hold(self, request: Awaitable):
+        """
+        Await the upstream `request` and keep the slot until its response is done,
+        i.e. right away for JSON responses and once the stream ends for streams.
+        """
+        try:
+            response = await request
+        except BaseException:
+            self.release()
+            raise
+
+        if isinstance(response, StreamingResponse):
+            # Background tasks also run when the client disconnects mid-stream
+            tasks = BackgroundTasks()
+            if response.background is not None:
+                tasks.add_task(response.background)
+            tasks.add_task(self.release)
+            response.background = tasks
+        else:
+            self.release()
+        return response
+
+
+class LaneStats:
+    def __init__(self, window: int = 500):
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        # Seconds queued requests waited for their slot
+        self.waits = deque(maxlen=window)
+
+
+class AdmissionController:
+    """
+    Caps concurrent upstream requests per backend url and per model.
+
+    Requests over a limit wait in a bounded queue per priority lane and are
+    admitted by priority, then in arrival order, as slots free up. A request
+    never overtakes a higher priority one waiting for the same limit, but may
+    use a slot that request can't use yet. Requests are rejected with a 429
+    when their lane is full and fail with a 503 when they wait longer than
+    `queue_timeout`, so clients back off instead of piling onto a busy backend.
+    """
+
+    def __init__(
+        self,
+        max_per_backend: int = UPSTREAM_MAX_CONCURRENCY_PER_BACKEND,
+        max_per_model: int = UPSTREAM_MAX_CONCURRENCY_PER_MODEL,
+        limits: Optional[Dict[str, int]] = None,
+        queue_size: int = UPSTREAM_QUEUE_SIZE,
+        queue_timeout: float = UPSTREAM_QUEUE_TIMEOUT,
+    ):
+        self.max_per_backend = max_per_backend
+        self.max_per_model = max_per_model
+        self.limits = (
+            limits if limits is not None else dict(UPSTREAM_CONCURRENCY_LIMITS)
+        )
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active: Dict[str, int] = {}
+        self.lanes: Dict[Priority, deque] = {priority: deque() for priority in Priority}
+        self.stats: Dict[Priority, LaneStats] = {
+            priority: LaneStats() for priority in Priority
+        }
+
+    def get_limit(self, kind: str, name: str) -> Optional[int]:
+        limit = self.limits.get(name)
+        if limit is None:
+            limit = self.max_per_backend if kind == "backend" else self.max_per_model
+        return int(limit) if limit and int(limit) > 0 else None
+
+    def has_capacity(self, key: str, limit: Optional[int]) -> bool:
+        return limit is None or self.active.get(key, 0) < limit
+
+    async def acquire(
+        self,
+        backend: str,
+        model: str,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> AdmissionTicket:
+        """
+        Wait for a slot on `backend` for `model`.
+
+        Raises:
+            HTTPException: 429 if the lane is full, 503 if no slot freed up in time
+        """
+        keys = [
+            (f"{kind}:{name}", self.get_limit(kind, name))
+            for kind, name in (("backend", backend), ("model", model))
+        ]
+        waiter = Waiter(keys, priority)
+        lane = self.lanes[priority]
+        stats = self.stats[priority]
+
+        lane.append(waiter)
+        self.dispatch()
+        if waiter.admitted:
+            return AdmissionTicket(self, [key for key, _ in keys])
+
+        if len(lane) > self.queue_size:
+            lane.remove(waiter)
+            stats.rejected += 1
+            log.warning(f"admission: {priority.name} queue full for {model}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=ERROR_MESSAGES.UPSTREAM_QUEUE_FULL(model),
+                headers={"Retry-After": "1"},
+            )
+
+        stats.queued += 1
+        try:
+            await asyncio.wait([waiter.future], timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # The client went away while waiting
+            if waiter.admitted:
+                self.release([key for key, _ in keys])
+            else:
+                lane.remove(waiter)
+                stats.cancelled += 1
+            raise
+
+        if not waiter.admitted:
+            lane.remove(waiter)
+            stats.timed_out += 1
+            log.warning(
+                f"admission: {priority.name} request for {model} timed out in the queue"
+            )
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=ERROR_MESSAGES.UPSTREAM_QUEUE_TIMEOUT(model),
+                headers={"Retry-After": "1"},
+            )
+        return AdmissionTicket(self, [key for key, _ in keys])
+
+    def dispatch(self):
+        """Admit queued requests in priority order while their limits allow."""
+        blocked = set()
+        for priority in Priority:
+            lane = self.lanes[priority]
+            for waiter in list(lane):
+                full = [
+                    key
+                    for key, limit in waiter.keys
+                    if key in blocked or not self.has_capacity(key, limit)
+                ]
+                if full:
+                    blocked.update(full)
+                    continue
+
+                lane.remove(waiter)
+                self.admit(waiter)
+
+    def admit(self, waiter: Waiter):
+        for key, _ in waiter.keys:
+            self.active[key] = self.active.get(key, 0) + 1
+        waiter.admitted = True
+        stats = self.stats[waiter.priority]
+        stats.admitted += 1
+        if not waiter.future.done():
+            stats.waits.append(time.perf_counter() - waiter.enqueued)
+            waiter.future.set_result(None)
+
+    def release(self, keys: List[str]):
+        for key in keys:
+            self.active[key] -= 1
+            if self.active[key] <= 0:
+                del self.active[key]
+        self.dispatch()
+
+    def get_stats(self) -> dict:
+        lanes = {}
+        for priority in Priority:
+            stats = self.stats[priority]
+            waits = sorted(stats.waits)
+            lanes[priority.name.lower()] = {
+                "depth": len(self.lanes[priority]),
+                "admitted": stats.admitted,
+                "queued": stats.queued,
+                "rejected": stats.rejected,
+                "timed_out": stats.timed_out,
+                "cancelled": stats.cancelled,
+                "wait_p50": percentile(waits, 50),
+                "wait_p90": percentile(waits, 90),
+                "wait_p99": percentile(waits, 99),
+            }
+
+        active = {}
+        for key, count in self.active.items():
+            kind, name = key.split(":", 1)
+            active.setdefault(kind, {})[name] = {
+                "in_flight": count,
+                "limit": self.get_limit(kind, name),
+            }
+        return {"lanes": lanes, "active": active}
+
+
+upstream_admission = AdmissionController()
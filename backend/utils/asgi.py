@@ -0,0 +1,168 @@
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import orjson
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+def json_loads(data: bytes):
+    return orjson.loads(data) if data else {}
+
+
+def json_dumps(obj) -> bytes:
+    try:
+        return orjson.dumps(obj)
+    except TypeError:
+        # e.g. integers over 64 bits, which the json module still handles
+        return json.dumps(obj).encode("utf-8")
+
+
+def get_stream_prefix(content_type: str, items: List[dict]) -> Optional[bytes]:
+    """Encode `items` as SSE events or NDJSON lines to match a streamed response."""
+    if "text/event-stream" in content_type:
+        return b"".join(b"data: " + json_dumps(item) + b"\n\n" for item in items)
+    if "application/x-ndjson" in content_type:
+        return b"".join(json_dumps(item) + b"\n" for item in items)
+    return None
+
+
+ChatCompletionProcessor = Callable[
+    [Request, dict], Awaitable[Union[Response, Tuple[dict, List[dict]]]]
+]
+
+
+class ChatCompletionMiddleware:
+    """
+    Pure ASGI middleware that lets `process` rewrite chat completion requests.
+
+    The body is read and parsed once, handed to `process` and serialized once
+    for the endpoint, with a matching content-length. `process` returns the new
+    body and the items to send ahead of a streamed response (e.g. citations),
+    or a response to send instead, and may set `request.state.response_headers`
+    to add headers to the response. Response messages are passed straight
+    through, so streamed chunks don't pay for a `BaseHTTPMiddleware` task and
+    memory stream each.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        process: ChatCompletionProcessor,
+        paths: Iterable[str] = ("/ollama/api/chat", "/chat/completions"),
+    ):
+        self.app = app
+        self.process = process
+        self.paths = tuple(paths)
+
+    def matches(self, scope: Scope) -> bool:
+        return (
+            scope["type"] == "http"
+            and scope["method"] == "POST"
+            and any(path in scope["path"] for path in self.paths)
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self.matches(scope):
+            await self.app(scope, receive, send)
+            return
+
+        log.debug(f"request.url.path: {scope['path']}")
+        request = Request(scope, receive)
+        try:
+            body = json_loads(await request.body())
+        except orjson.JSONDecodeError as e:
+            response = JSONResponse(status_code=400, content={"detail": str(e)})
+            await response(scope, receive, send)
+            return
+
+        result = await self.process(request, body)
+        if isinstance(result, Response):
+            await result(scope, receive, send)
+            return
+
+        body, items = result
+        data = json_dumps(body)
+        scope = {
+            **scope,
+            "headers": [
+                (b"content-length", str(len(data)).encode("latin-1")),
+                *[
+                    (key, value)
+                    for key, value in scope["headers"]
+                    if key != b"content-length"
+                ],
+            ],
+        }
+
+        body_sent = False
+
+        async def receive_body() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": data, "more_body": False}
+            # Only http.disconnect is left once the body has been read
+            return await receive()
+
+        if items:
+            send = prepend_to_stream(send, items)
+        headers = getattr(request.state, "response_headers", None)
+        if headers:
+            send = add_response_headers(send, headers)
+        await self.app(scope, receive_body, send)
+
+
+def add_response_headers(send: Send, headers: Dict[str, str]) -> Send:
+    """Wrap `send` to add `headers` to the response start message."""
+    raw_headers = [
+        (key.lower().encode("latin-1"), value.encode("latin-1"))
+        for key, value in headers.items()
+    ]
+
+    async def send_with_headers(message: Message):
+        if message["type"] == "http.response.start":
+            message = {
+                **message,
+                "headers": [*message.get("headers", []), *raw_headers],
+            }
+        await send(message)
+
+    return send_with_headers
+
+
+def prepend_to_stream(send: Send, items: List[dict]) -> Send:
+    """Wrap `send` to emit `items` ahead of the first chunk of an SSE or NDJSON response."""
+    prefix = None
+
+    async def send_with_items(message: Message):
+        nonlocal prefix
+        if message["type"] == "http.response.start":
+            headers = message.get("headers", [])
+            content_type = next(
+                (value for key, value in headers if key.lower() == b"content-type"),
+                b"",
+            ).decode("latin-1")
+            prefix = get_stream_prefix(content_type, items)
+            if prefix:
+                message = {
+                    **message,
+                    "headers": [
+                        (key, value)
+                        for key, value in headers
+                        if key.lower() != b"content-length"
+                    ],
+                }
+        elif message["type"] == "http.response.body" and prefix:
+            message = {**message, "body": prefix + message.get("body", b"")}
+            prefix = None
+        await send(message)
+
+    return send_with_items
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import SRC_LOG_LEVELS, MODELS_CACHE_TTL
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class ModelCatalog:
+    """
+    Cached model list with stale-while-revalidate semantics.
+
+    `get` returns the cached list right away and, once it is older than `ttl`,
+    rebuilds it in the background. After `invalidate` (models, functions or
+    upstream urls changed) the next `get` waits for a rebuild instead. Concurrent
+    callers share a single rebuild.
+    """
+
+    def __init__(self, ttl: float = MODELS_CACHE_TTL):
+        self.ttl = ttl
+        self.loader: Optional[Callable[[], Awaitable[List[dict]]]] = None
+        self.models: Optional[List[dict]] = None
+        # Incremented on every rebuild, exposed so clients can tell lists apart
+        self.version = 0
+        self.built_at = 0.0
+        # Incremented on every invalidate, a build is current if it started after
+        self.generation = 0
+        self.built_generation = -1
+        self.task: Optional[asyncio.Task] = None
+
+    def is_current(self) -> bool:
+        return self.models is not None and self.built_generation == self.generation
+
+    def is_fresh(self) -> bool:
+        return self.is_current() and time.monotonic() - self.built_at < self.ttl
+
+    def invalidate(self):
+        self.generation += 1
+
+    async def build(self) -> List[dict]:
+        generation = self.generation
+        start = time.perf_counter()
+        models = await self.loader()
+        self.models = models
+        self.version += 1
+        self.built_at = time.monotonic()
+        self.built_generation = generation
+        log.debug(
+            f"model catalog v{self.version} built in {time.perf_counter() - start:.3f}s"
+        )
+        return models
+
+    def refresh(self) -> asyncio.Task:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.build())
+            self.task.add_done_callback(log_build_error)
+        return self.task
+
+    async def get(self, refresh: bool = False) -> List[dict]:
+        if refresh:
+            self.invalidate()
+
+        while not self.is_current():
+            # Shielded so a cancelled request doesn't cancel the shared build
+            await asyncio.shield(self.refresh())
+
+        if not self.is_fresh():
+            self.refresh()
+        return self.models
+
+    async def run(self):
+        """Rebuild every `ttl` seconds for the app lifetime, so `get` rarely sees a stale list."""
+        while True:
+            await asyncio.sleep(max(self.ttl, 1))
+            try:
+                await asyncio.shield(self.refresh())
+            except Exception:
+                pass
+
+
+def log_build_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        log.error(f"Failed to build the model catalog: {task.exception()}")
+
+
+model_catalog = ModelCatalog()
+
+
+def get_model_actions(
+    model: dict, global_action_ids: List[str], action_functions: Dict[str, object]
+) -> List[str]:
+    action_ids = list(global_action_ids)
+    if "info" in model and "meta" in model["info"]:
+        action_ids.extend(model["info"]["meta"].get("actionIds", []))
+    return [
+        action_id
+        for action_id in dict.fromkeys(action_ids)
+        if action_id in action_functions
+    ]
+
+
+def merge_custom_models(
+    models: List[dict],
+    custom_models: list,
+    global_action_ids: List[str],
+    action_functions: Dict[str, object],
+) -> List[dict]:
+    """
+    Apply the workspace models to the upstream `models`, in place.
+
+    Custom models without a base model rename and annotate the upstream models
+    they match, the others are appended as presets of their base model. Models
+    match an id either exactly or by its name without the ":tag". Lookups go
+    through an index instead of scanning `models` for every custom model.
+
+    Args:
+        models (List[dict]): Pipe, OpenAI and Ollama models
+        custom_models (List[ModelModel]): Workspace models
+        global_action_ids (List[str]): Ids of the global action functions
+        action_functions (Dict[str, FunctionModel]): Active action functions by id
+    """
+    index: Dict[str, List[dict]] = {}
+
+    def add_to_index(model: dict):
+        base_id = model["id"].split(":")[0]
+        index.setdefault(model["id"], []).append(model)
+        if base_id != model["id"]:
+            index.setdefault(base_id, []).append(model)
+
+    for model in models:
+        add_to_index(model)
+
+    for custom_model in custom_models:
+        if custom_model.base_model_id == None:
+            for model in index.get(custom_model.id, []):
+                model["name"] = custom_model.name
+                model["info"] = custom_model.model_dump()
+
+                model["actions"] = []
+                for action_id in get_model_actions(
+                    model, global_action_ids, action_functions
+                ):
+                    action = action_functions[action_id]
+                    model["actions"].append(
+                        {
+                            "id": action_id,
+                            "name": action.name,
+                            "description": action.meta.description,
+                            "icon_url": action.meta.manifest.get("icon_url", None),
+                        }
+                    )
+
+        else:
+            owned_by = "openai"
+            pipe = None
+            actions = []
+
+            matches = index.get(custom_model.base_model_id, [])
+            if matches:
+                model = matches[0]
+                owned_by = model["owned_by"]
+                if "pipe" in model:
+                    pipe = model["pipe"]
+
+                actions = [
+                    {
+                        "id": action_id,
+                        "name": action_functions[action_id].name,
+                        "description": action_functions[action_id].meta.description,
+                    }
+                    for action_id in get_model_actions(
+                        model, global_action_ids, action_functions
+                    )
+                ]
+
+            preset = {
+                "id": custom_model.id,
+                "name": custom_model.name,
+                "object": "model",
+                "created": custom_model.created_at,
+                "owned_by": owned_by,
+                "info": custom_model.model_dump(),
+                "preset": True,
+                **({"pipe": pipe} if pipe is not None else {}),
+                "actions": actions,
+            }
+            models.append(preset)
+            add_to_index(preset)
+
+    return models
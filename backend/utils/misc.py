@@ -89,6 +89,14 @@ def stream_message_template(model: str, message: str):
     }
 
 
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """The `p`th percentile of the sorted `values`, rounded for the metrics endpoints."""
+    if not values:
+        return None
+    idx = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return round(values[idx], 4)
+
+
 def get_gravatar_url(email):
     # Trim leading and trailing whitespace from
     # an email address and force all characters
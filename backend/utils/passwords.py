@@ -0,0 +1,73 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from fastapi import HTTPException, status
+
+from constants import ERROR_MESSAGES
+from config import (
+    SRC_LOG_LEVELS,
+    PASSWORD_HASHING_THREADS,
+    PASSWORD_HASHING_QUEUE_SIZE,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class PasswordExecutor:
+    """
+    Runs bcrypt hashing and verification on a few dedicated threads.
+
+    A bcrypt round takes 100-300ms of CPU, which on the event loop stalls every
+    stream on the worker during a burst of sign-ins. bcrypt releases the GIL,
+    so the threads hash in parallel with the loop and with each other. At most
+    `queue_size` calls wait for a thread, more are rejected with a 429 so a
+    login storm can't queue unbounded work.
+    """
+
+    def __init__(
+        self,
+        threads: int = PASSWORD_HASHING_THREADS,
+        queue_size: int = PASSWORD_HASHING_QUEUE_SIZE,
+    ):
+        self.threads = max(threads, 1)
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.threads, thread_name_prefix="password"
+        )
+        # Calls submitted and not finished, including ones whose caller went away
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def done(self, _):
+        with self.lock:
+            self.pending -= 1
+
+    async def run(self, fn: Callable, *args):
+        """
+        Run `fn(*args)` on a password thread, e.g. `Auths.authenticate_user`.
+
+        Raises:
+            HTTPException: 429 if `queue_size` calls are already waiting
+        """
+        with self.lock:
+            if self.pending >= self.threads + self.queue_size:
+                log.warning("Password hashing queue is full, rejecting a request")
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=ERROR_MESSAGES.PASSWORD_HASHING_BUSY,
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+
+        future = self.executor.submit(functools.partial(fn, *args))
+        # Counted until the thread is done, a cancelled await doesn't stop it
+        future.add_done_callback(self.done)
+        return await asyncio.wrap_future(future)
+
+
+password_executor = PasswordExecutor()
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from config import SRC_LOG_LEVELS, PIPELINES_FILTER_TIMEOUT
+from utils.misc import percentile
+from utils.upstream import upstream_clients
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class PipelineFilterError(Exception):
+    """A filter rejected the request, `args` are the status code and the detail."""
+
+    def __init__(self, status_code: int, detail):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class FilterStats:
+    def __init__(self, window: int = 500):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latencies = deque(maxlen=window)
+
+
+class PipelineFilters:
+    """
+    Calls the inlet and outlet endpoints of Pipelines filters over the pooled
+    upstream sessions, and caches which filters apply to each model.
+
+    Each call is bounded by `timeout`. A filter that fails or times out is
+    skipped, so a broken filter doesn't take the chat down with it, unless it
+    answers with an error detail, which is raised as a PipelineFilterError.
+    """
+
+    def __init__(self, timeout: float = PIPELINES_FILTER_TIMEOUT):
+        self.timeout = timeout
+        self.stats: Dict[str, FilterStats] = {}
+        # model id -> filters sorted by priority, for the model list `version`
+        self.sorted_filters: Dict[str, List[dict]] = {}
+        self.version: Optional[int] = None
+
+    def get_sorted(self, models: Dict[str, dict], model_id: str, version: int):
+        """
+        Return the filter models that apply to `model_id`, by priority.
+
+        The result depends only on the model list, so it is kept until `version`
+        changes. Callers must not modify the returned list.
+        """
+        if version != self.version:
+            self.sorted_filters = {}
+            self.version = version
+
+        if model_id not in self.sorted_filters:
+            filters = [
+                model
+                for model in models.values()
+                if "pipeline" in model
+                and "type" in model["pipeline"]
+                and model["pipeline"]["type"] == "filter"
+                and (
+                    model["pipeline"]["pipelines"] == ["*"]
+                    or any(
+                        model_id == target_model_id
+                        for target_model_id in model["pipeline"]["pipelines"]
+                    )
+                )
+            ]
+            self.sorted_filters[model_id] = sorted(
+                filters, key=lambda x: x["pipeline"]["priority"]
+            )
+        return self.sorted_filters[model_id]
+
+    async def call(
+        self, filter_id: str, stage: str, url: str, key: str, user: dict, body: dict
+    ) -> dict:
+        """POST `body` to the `stage` ("inlet" or "outlet") of a filter and return the filtered body."""
+        stats = self.stats.setdefault(f"{filter_id}/{stage}", FilterStats())
+        stats.calls += 1
+        start = time.perf_counter()
+        try:
+            session = await upstream_clients.get_session(url)
+            async with session.post(
+                f"{url}/{filter_id}/filter/{stage}",
+                headers={"Authorization": f"Bearer {key}"},
+                json={"user": user, "body": body},
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            ) as r:
+                if r.status >= 400:
+                    try:
+                        res = await r.json(content_type=None)
+                    except Exception:
+                        res = None
+                    if isinstance(res, dict) and "detail" in res:
+                        raise PipelineFilterError(r.status, res["detail"])
+                    raise Exception(f"status {r.status}")
+                return await r.json(content_type=None)
+        except PipelineFilterError:
+            stats.errors += 1
+            raise
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            log.warning(f"Filter {filter_id} {stage} timed out after {self.timeout}s")
+            return body
+        except Exception as e:
+            stats.errors += 1
+            log.error(f"Filter {filter_id} {stage} failed: {e}")
+            return body
+        finally:
+            stats.latencies.append(time.perf_counter() - start)
+
+    def get_stats(self) -> dict:
+        stats = {}
+        for name, filter_stats in self.stats.items():
+            latencies = sorted(filter_stats.latencies)
+            stats[name] = {
+                "calls": filter_stats.calls,
+                "errors": filter_stats.errors,
+                "timeouts": filter_stats.timeouts,
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p99": percentile(latencies, 99),
+            }
+        return stats
+
+
+pipeline_filters = PipelineFilters()
@@ -0,0 +1,257 @@
+import asyncio
+import inspect
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from apps.webui.models.functions import Functions
+from apps.webui.models.tools import Tools
+from apps.webui.utils import load_function_module_by_id, load_toolkit_module_by_id
+
+from config import SRC_LOG_LEVELS, PIPE_MODELS_CACHE_TTL, PIPE_MODELS_TIMEOUT
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class RegistryEntry:
+    """A loaded function or toolkit module, with its valves applied."""
+
+    versions = itertools.count()
+
+    def __init__(self, kind: str, id: str, module, model, valves: Optional[dict]):
+        # "function" or "tool"
+        self.kind = kind
+        self.id = id
+        # Unique per entry, an invalidated module gets a new version
+        self.version = next(self.versions)
+        self.module = module
+        # FunctionModel or ToolModel
+        self.model = model
+        self.valves = valves if valves else {}
+        self.signatures: Dict[str, inspect.Signature] = {}
+
+        if hasattr(module, "valves") and hasattr(module, "Valves"):
+            module.valves = module.Valves(**self.valves)
+
+    @property
+    def priority(self):
+        return self.valves.get("priority", 0)
+
+    def get_signature(self, name: str) -> inspect.Signature:
+        if name not in self.signatures:
+            self.signatures[name] = inspect.signature(getattr(self.module, name))
+        return self.signatures[name]
+
+
+class FilterSet:
+    """The active filters and the filter chain of each model, replaced as a whole."""
+
+    def __init__(self):
+        self.filters: Dict[str, RegistryEntry] = {}
+        self.global_filter_ids: List[str] = []
+        # Model filterIds -> filter ids sorted by priority
+        self.chains: Dict[Tuple[str, ...], List[str]] = {}
+
+    def get_chain(self, model_filter_ids: List[str]) -> List[str]:
+        key = tuple(model_filter_ids)
+        if key not in self.chains:
+            filter_ids = [
+                filter_id
+                for filter_id in dict.fromkeys(
+                    [*self.global_filter_ids, *model_filter_ids]
+                )
+                if filter_id in self.filters
+            ]
+            filter_ids.sort(key=lambda filter_id: self.filters[filter_id].priority)
+            self.chains[key] = filter_ids
+        return self.chains[key]
+
+
+class FunctionRegistry:
+    """
+    In-memory view of the functions and toolkits that chat requests use.
+
+    Keeps the loaded modules with their valves applied, the signatures of
+    their methods and the filter chain of each model, so a chat request
+    doesn't query the functions table or re-instantiate valves per filter.
+    The functions and tools routers call `invalidate_function` and
+    `invalidate_tool` whenever they change one.
+
+    `functions` and `tools` hold the bare modules by id and are shared with
+    the webui app as `app.state.FUNCTIONS` and `app.state.TOOLS`.
+    """
+
+    def __init__(self):
+        self.functions: Dict[str, object] = {}
+        self.tools: Dict[str, object] = {}
+        self.function_entries: Dict[str, RegistryEntry] = {}
+        self.tool_entries: Dict[str, RegistryEntry] = {}
+
+        # Active filters, None until loaded
+        self.filter_set: Optional[FilterSet] = None
+        # Bumped by invalidate_function, a load that raced it isn't kept
+        self.generation = 0
+
+    def get_function(self, id: str) -> Optional[RegistryEntry]:
+        if id not in self.function_entries:
+            function = Functions.get_function_by_id(id)
+            if function is None:
+                return None
+
+            if id not in self.functions:
+                self.functions[id], _, _ = load_function_module_by_id(id)
+            self.function_entries[id] = RegistryEntry(
+                "function",
+                id,
+                self.functions[id],
+                function,
+                Functions.get_function_valves_by_id(id),
+            )
+        return self.function_entries[id]
+
+    def get_tool(self, id: str) -> Optional[RegistryEntry]:
+        if id not in self.tool_entries:
+            tool = Tools.get_tool_by_id(id)
+            if tool is None:
+                return None
+
+            if id not in self.tools:
+                self.tools[id], _ = load_toolkit_module_by_id(id)
+            self.tool_entries[id] = RegistryEntry(
+                "tool", id, self.tools[id], tool, Tools.get_tool_valves_by_id(id)
+            )
+        return self.tool_entries[id]
+
+    def load_filters(self) -> FilterSet:
+        generation = self.generation
+        filter_set = FilterSet()
+        for function in Functions.get_functions_by_type("filter", active_only=True):
+            try:
+                entry = self.get_function(function.id)
+            except Exception as e:
+                log.error(f"Failed to load filter {function.id}: {e}")
+                continue
+            if entry is None:
+                continue
+
+            filter_set.filters[function.id] = entry
+            if function.is_global:
+                filter_set.global_filter_ids.append(function.id)
+
+        if generation == self.generation:
+            self.filter_set = filter_set
+        return filter_set
+
+    def get_filter_ids(self, model: dict) -> List[str]:
+        """Ids of the active global and model filters of `model`, by priority."""
+        return self.get_filter_chain(model)[1]
+
+    def get_filters(self, model: dict) -> List[RegistryEntry]:
+        filters, filter_ids = self.get_filter_chain(model)
+        return [filters[filter_id] for filter_id in filter_ids]
+
+    def get_filter_chain(
+        self, model: dict
+    ) -> Tuple[Dict[str, RegistryEntry], List[str]]:
+        # Read once, the routers run on threads and may invalidate it meanwhile
+        filter_set = self.filter_set
+        if filter_set is None:
+            filter_set = self.load_filters()
+
+        model_filter_ids = []
+        if "info" in model and "meta" in model["info"]:
+            model_filter_ids = model["info"]["meta"].get("filterIds", [])
+        return filter_set.filters, filter_set.get_chain(model_filter_ids)
+
+    def invalidate_function(self, id: str):
+        self.generation += 1
+        self.function_entries.pop(id, None)
+        self.filter_set = None
+
+    def invalidate_tool(self, id: str):
+        self.tool_entries.pop(id, None)
+
+
+function_registry = FunctionRegistry()
+
+
+class PipeModels:
+    """
+    The models each pipe expands to, cached per pipe.
+
+    Manifolds often list their models from a remote provider, so the model list
+    doesn't ask them on every rebuild. An expansion is kept for `ttl` seconds,
+    then served while it is refreshed in the background. It is dropped when the
+    pipe's registry entry is invalidated, i.e. the function or its valves were
+    updated. Pipes are expanded concurrently and a pipe without a cached
+    expansion is waited for at most `timeout` seconds, so one slow manifold
+    doesn't hold up the whole list.
+    """
+
+    def __init__(
+        self, ttl: float = PIPE_MODELS_CACHE_TTL, timeout: float = PIPE_MODELS_TIMEOUT
+    ):
+        self.ttl = ttl
+        self.timeout = timeout
+        # Pipe id -> (entry version, built at, models)
+        self.models: Dict[str, Tuple[int, float, List[dict]]] = {}
+        self.tasks: Dict[Tuple[str, int], asyncio.Task] = {}
+
+    def refresh(
+        self,
+        entry: RegistryEntry,
+        expand: Callable[[RegistryEntry], Awaitable[List[dict]]],
+    ) -> asyncio.Task:
+        key = (entry.id, entry.version)
+        if key not in self.tasks:
+
+            async def build() -> Optional[List[dict]]:
+                try:
+                    models = await expand(entry)
+                except Exception as e:
+                    # A stale expansion, if any, is kept until the next refresh
+                    log.error(f"Failed to list the models of pipe {entry.id}: {e}")
+                    return None
+                finally:
+                    del self.tasks[key]
+
+                self.models[entry.id] = (entry.version, time.monotonic(), models)
+                return models
+
+            self.tasks[key] = asyncio.create_task(build())
+        return self.tasks[key]
+
+    async def get(
+        self,
+        entry: RegistryEntry,
+        expand: Callable[[RegistryEntry], Awaitable[List[dict]]],
+    ) -> List[dict]:
+        """The models of the pipe `entry`, built by `expand` when needed."""
+        version, built_at, models = self.models.get(entry.id, (None, 0.0, []))
+        if version == entry.version:
+            if time.monotonic() - built_at >= self.ttl:
+                self.refresh(entry, expand)
+            return models
+
+        try:
+            # Shielded so a timeout doesn't cancel the shared expansion
+            models = await asyncio.wait_for(
+                asyncio.shield(self.refresh(entry, expand)), self.timeout
+            )
+        except asyncio.TimeoutError:
+            log.warning(
+                f"Pipe {entry.id} took more than {self.timeout}s to list its models"
+            )
+            models = None
+        return models if models is not None else []
+
+    def retain(self, ids: List[str]):
+        """Forget the expansions of pipes that were deleted or deactivated."""
+        for id in list(self.models):
+            if id not in ids:
+                del self.models[id]
+
+
+pipe_models = PipeModels()
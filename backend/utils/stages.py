@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class StageRunner:
+    """
+    Runs the pre-processing stages of a request as tasks, each once the stages
+    it depends on are done, and records how long each one took.
+
+    Stages that don't depend on each other run concurrently. A stage whose
+    result turns out not to be needed can be cancelled, it is then reported as
+    cancelled instead of with a duration.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, asyncio.Task] = {}
+        # Stage name -> duration in seconds, None for cancelled stages
+        self.timings: Dict[str, Optional[float]] = {}
+
+    def start(
+        self,
+        name: str,
+        stage: Callable[[], Awaitable],
+        after: Iterable[str] = (),
+    ) -> asyncio.Task:
+        """Schedule `stage` to run once the stages in `after` have finished."""
+        dependencies = [self.tasks[dependency] for dependency in after]
+
+        async def run():
+            if dependencies:
+                await asyncio.wait(dependencies)
+            start = time.perf_counter()
+            try:
+                return await stage()
+            finally:
+                # Kept as None if the stage was cancelled
+                self.timings.setdefault(name, time.perf_counter() - start)
+
+        task = asyncio.create_task(run())
+        self.tasks[name] = task
+        return task
+
+    async def run(
+        self,
+        name: str,
+        stage: Callable[[], Awaitable],
+        after: Iterable[str] = (),
+    ):
+        """Start `stage` and wait for its result."""
+        return await self.start(name, stage, after)
+
+    async def result(self, name: str):
+        return await self.tasks[name]
+
+    def cancel(self, name: str):
+        task = self.tasks.get(name)
+        if task is not None and not task.done():
+            task.cancel()
+            self.timings[name] = None
+            log.debug(f"stage {name} cancelled")
+
+    def cancel_all(self):
+        for name in self.tasks:
+            self.cancel(name)
+
+    def get_header(self) -> str:
+        """Format the timings as a Server-Timing header value, in milliseconds."""
+        return ", ".join(
+            (
+                f'{name};desc="cancelled"'
+                if duration is None
+                else f"{name};dur={duration * 1000:.1f}"
+            )
+            for name, duration in self.timings.items()
+        )
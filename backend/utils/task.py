@@ -1,8 +1,9 @@
 import re
 import math
+import json
 
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 
 def prompt_template(
@@ -125,3 +126,38 @@ def search_query_generation_template(
 def tools_function_calling_generation_template(template: str, tools_specs: str) -> str:
     template = template.replace("{{TOOLS}}", tools_specs)
     return template
+
+
+def tools_function_calling_multi_generation_template(
+    template: str, tools_specs: str
+) -> str:
+    # The template asks for a single call, allow several for the combined specs
+    return (
+        tools_function_calling_generation_template(template, tools_specs)
+        + "\nTo call several functions, return a JSON list of such objects instead."
+    )
+
+
+def parse_tool_calls(content: Optional[str]) -> List[dict]:
+    """
+    Parse the function calls a task model returned as text: a single call object,
+    a list of them, or either wrapped in a markdown code block.
+    """
+    if not content:
+        return []
+
+    content = content.strip()
+    match = re.search(r"```(?:json)?\s*(.*?)```", content, re.DOTALL)
+    if match:
+        content = match.group(1).strip()
+
+    try:
+        result = json.loads(content)
+    except ValueError:
+        return []
+
+    if isinstance(result, dict):
+        result = result.get("tool_calls", result.get("calls", [result]))
+    if not isinstance(result, list):
+        return []
+    return [call for call in result if isinstance(call, dict) and "name" in call]
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Iterator, Optional
+
+from config import SRC_LOG_LEVELS, FUNCTIONS_STREAM_THREADS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+# Kept apart from the default executor, a stream holds its thread until it ends
+stream_executor = ThreadPoolExecutor(
+    max_workers=FUNCTIONS_STREAM_THREADS, thread_name_prefix="pipe-stream"
+)
+
+
+async def iterate_in_thread(
+    iterator: Iterator,
+    max_buffer: int = 32,
+    executor: Optional[ThreadPoolExecutor] = None,
+) -> AsyncGenerator:
+    """
+    Drive a sync `iterator` on a thread and yield its items on the event loop.
+
+    The thread runs at most `max_buffer` items ahead of the consumer and then
+    waits for it. When the consumer stops early (e.g. the client disconnected)
+    the thread stops after the item it is producing and closes the iterator,
+    so a generator's cleanup runs on the thread too. A blocking `next()` can't
+    be interrupted, the thread only notices once it returns.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    # Items handed over but not consumed yet, bounded by max_buffer
+    slots = threading.Semaphore(max(max_buffer, 1))
+    stopped = threading.Event()
+
+    def put(message) -> bool:
+        """Hand a message to the consumer, False if it has gone away."""
+        while not slots.acquire(timeout=0.1):
+            if stopped.is_set():
+                return False
+        if stopped.is_set():
+            return False
+
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+        except RuntimeError:
+            # The event loop is closed
+            return False
+        return True
+
+    def produce():
+        try:
+            for item in iterator:
+                if not put(("item", item)):
+                    return
+            put(("done", None))
+        except Exception as e:
+            put(("error", e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    log.warning(f"Error closing a pipe iterator: {e}")
+
+    loop.run_in_executor(executor or stream_executor, produce)
+    try:
+        while True:
+            kind, value = await queue.get()
+            slots.release()
+            if kind == "item":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                return
+    finally:
+        stopped.set()
@@ -0,0 +1,435 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+)
+
+import aiohttp
+from yarl import URL
+
+from config import (
+    SRC_LOG_LEVELS,
+    AIOHTTP_CLIENT_LIMIT_PER_HOST,
+    AIOHTTP_CLIENT_KEEPALIVE_TIMEOUT,
+    AIOHTTP_CLIENT_DNS_CACHE_TTL,
+    UPSTREAM_FAILURE_THRESHOLD,
+    UPSTREAM_RECOVERY_TIMEOUT,
+    UPSTREAM_HEALTH_CHECK_TIMEOUT,
+    UPSTREAM_COALESCE_TTL,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class UpstreamClients:
+    """
+    Application-lifetime registry of pooled aiohttp sessions, one per upstream origin.
+
+    Requests to the same Ollama or OpenAI-compatible backend reuse kept-alive
+    connections instead of paying a TCP/TLS handshake per chat turn. Sessions for
+    the configured base URLs are opened in the app lifespan, URLs added later get
+    one on first use.
+    """
+
+    def __init__(
+        self,
+        limit_per_host: int = AIOHTTP_CLIENT_LIMIT_PER_HOST,
+        keepalive_timeout: float = AIOHTTP_CLIENT_KEEPALIVE_TIMEOUT,
+        dns_cache_ttl: int = AIOHTTP_CLIENT_DNS_CACHE_TTL,
+    ):
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def get_origin(url: str) -> str:
+        return str(URL(url).origin())
+
+    def create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=0,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        # Timeouts are set per request, callers use different ones
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=None),
+            trust_env=True,
+        )
+
+    async def start(self, urls: Iterable[str]):
+        for url in urls:
+            try:
+                await self.get_session(url)
+            except Exception as e:
+                log.error(f"Invalid upstream url {url}: {e}")
+
+    async def get_session(self, url: str) -> aiohttp.ClientSession:
+        origin = self.get_origin(url)
+        session = self.sessions.get(origin)
+        if session is not None and not session.closed:
+            return session
+
+        async with self.lock:
+            session = self.sessions.get(origin)
+            if session is None or session.closed:
+                log.debug(f"opening upstream session for {origin}")
+                session = self.create_session()
+                self.sessions[origin] = session
+            return session
+
+    async def close(self):
+        async with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions = {}
+        await asyncio.gather(
+            *[session.close() for session in sessions], return_exceptions=True
+        )
+
+
+upstream_clients = UpstreamClients()
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and stays open for
+    `recovery_timeout` seconds. After that the node is half-open: requests go
+    through again and the first failure opens it right away, the first success
+    closes it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.recovery_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+
+    def record_failure(self, error: Optional[str] = None):
+        self.failures += 1
+        self.last_error = error
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class UpstreamHealth:
+    """Circuit breakers per upstream base URL, fed by requests and health probes."""
+
+    def __init__(
+        self,
+        failure_threshold: int = UPSTREAM_FAILURE_THRESHOLD,
+        recovery_timeout: float = UPSTREAM_RECOVERY_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        # Embedding requests record from worker threads
+        self.lock = threading.Lock()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get_breaker(self, url: str) -> CircuitBreaker:
+        if url not in self.breakers:
+            self.breakers[url] = CircuitBreaker(
+                self.failure_threshold, self.recovery_timeout
+            )
+        return self.breakers[url]
+
+    def is_available(self, url: str) -> bool:
+        with self.lock:
+            return self.get_breaker(url).state != CircuitBreaker.OPEN
+
+    def filter_available(self, urls: List[str]) -> List[str]:
+        """The available urls, or all of them if none is, so requests still get tried."""
+        available = [url for url in urls if self.is_available(url)]
+        return available if available else urls
+
+    def record_success(self, url: str):
+        with self.lock:
+            self.get_breaker(url).record_success()
+
+    def record_failure(self, url: str, error: Optional[str] = None):
+        with self.lock:
+            breaker = self.get_breaker(url)
+            was_open = breaker.state == CircuitBreaker.OPEN
+            breaker.record_failure(error)
+            if not was_open and breaker.state == CircuitBreaker.OPEN:
+                log.warning(f"upstream {url} is unhealthy: {error}")
+
+    async def probe(self, base_url: str, url: str, headers: Optional[dict] = None):
+        try:
+            session = await upstream_clients.get_session(url)
+            async with session.get(
+                url,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=UPSTREAM_HEALTH_CHECK_TIMEOUT),
+            ) as response:
+                if response.status >= 500:
+                    raise Exception(f"status {response.status}")
+            self.record_success(base_url)
+        except Exception as e:
+            self.record_failure(base_url, str(e) or type(e).__name__)
+
+    def get_stats(self, urls: List[str]) -> dict:
+        with self.lock:
+            return {
+                url: {
+                    "state": self.get_breaker(url).state,
+                    "failures": self.get_breaker(url).failures,
+                    "last_error": self.get_breaker(url).last_error,
+                }
+                for url in urls
+            }
+
+
+upstream_health = UpstreamHealth()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent upstream reads into one request.
+
+    Callers with the same key while a read is in flight await the same future,
+    and a successful result is reused for `ttl` seconds. Results are shared, so
+    callers must not mutate them.
+    """
+
+    def __init__(self, ttl: float = UPSTREAM_COALESCE_TTL):
+        self.ttl = ttl
+        self.inflight: Dict[Hashable, asyncio.Future] = {}
+        self.results: Dict[Hashable, tuple] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    async def do(
+        self, key: Hashable, fetch: Callable[[], Awaitable[Any]], label: str
+    ) -> Any:
+        """`label` groups the metrics, it must not contain secrets."""
+        stats = self.stats.setdefault(
+            label, {"calls": 0, "upstream": 0, "coalesced": 0, "cached": 0}
+        )
+        stats["calls"] += 1
+
+        if key in self.results:
+            fetched_at, result = self.results[key]
+            if time.monotonic() - fetched_at < self.ttl:
+                stats["cached"] += 1
+                return result
+            del self.results[key]
+
+        if key in self.inflight:
+            stats["coalesced"] += 1
+        else:
+            stats["upstream"] += 1
+            future = asyncio.ensure_future(fetch())
+            future.add_done_callback(lambda future: self.done(key, future))
+            self.inflight[key] = future
+
+        # Shielded so one cancelled caller doesn't cancel the read for the others
+        return await asyncio.shield(self.inflight[key])
+
+    def done(self, key: Hashable, future: asyncio.Future):
+        self.inflight.pop(key, None)
+        if (
+            self.ttl > 0
+            and not future.cancelled()
+            and future.exception() is None
+            and future.result() is not None
+        ):
+            self.results[key] = (time.monotonic(), future.result())
+
+    def get_stats(self) -> dict:
+        return {
+            label: {**stats, "saved": stats["coalesced"] + stats["cached"]}
+            for label, stats in self.stats.items()
+        }
+
+
+upstream_reads = SingleFlight()
+
+
+# Streamed upstream responses opened while handling the current client request
+request_streams: ContextVar[Optional[Set["UpstreamStream"]]] = ContextVar(
+    "request_streams", default=None
+)
+
+
+class UpstreamStream:
+    """
+    Iterates the lines of a streamed upstream response.
+
+    If the stream is not read to the end, because the client went away, `abort`
+    closes the connection right away so the backend stops generating, instead
+    of whenever the response cleanup gets to run.
+    """
+
+    def __init__(
+        self,
+        streams: "UpstreamStreams",
+        response: aiohttp.ClientResponse,
+        label: str,
+    ):
+        self.streams = streams
+        self.response = response
+        self.label = label
+        self.lines = response.content.__aiter__()
+        self.request_streams = request_streams.get()
+        self.chunks = 0
+        self.finished = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        if self.finished:
+            raise StopAsyncIteration
+        try:
+            chunk = await self.lines.__anext__()
+        except StopAsyncIteration:
+            self.finish("completed")
+            raise
+        except asyncio.CancelledError:
+            self.abort()
+            raise
+        except Exception:
+            if self.finished:
+                # Aborted while waiting for the next line
+                raise StopAsyncIteration
+            self.finish("failed")
+            raise
+
+        if chunk.strip():
+            self.chunks += 1
+        return chunk
+
+    def abort(self):
+        if not self.finished:
+            self.response.close()
+            self.finish("cancelled")
+
+    def finish(self, outcome: str):
+        self.finished = True
+        if self.request_streams is not None:
+            self.request_streams.discard(self)
+        self.streams.record(self, outcome)
+
+
+class UpstreamStreams:
+    """
+    Opens `UpstreamStream`s and keeps the cancellation metrics.
+
+    Streams are counted in chunks, i.e. NDJSON lines or SSE events, which is
+    about one token each. The generation saved by a cancellation is estimated
+    from the average length of the completed streams of the same upstream.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats: Dict[str, dict] = {}
+
+    def open(self, response: aiohttp.ClientResponse, label: str) -> UpstreamStream:
+        """`label` groups the metrics, it must not contain secrets."""
+        stream = UpstreamStream(self, response, label)
+        if stream.request_streams is not None:
+            stream.request_streams.add(stream)
+        return stream
+
+    @contextmanager
+    def track_request(self) -> Iterator[Set[UpstreamStream]]:
+        """
+        Collect the streams opened while handling a client request, the ones left
+        unread when it is done are aborted.
+        """
+        streams = set()
+        token = request_streams.set(streams)
+        try:
+            yield streams
+        finally:
+            request_streams.reset(token)
+            self.abort(streams)
+
+    def abort(self, streams: Set[UpstreamStream]):
+        for stream in list(streams):
+            stream.abort()
+
+    def record(self, stream: UpstreamStream, outcome: str):
+        with self.lock:
+            stats = self.stats.setdefault(
+                stream.label,
+                {
+                    "completed": 0,
+                    "cancelled": 0,
+                    "failed": 0,
+                    "average_chunks": None,
+                    "chunks_before_cancel": 0,
+                    "estimated_chunks_saved": 0,
+                },
+            )
+            stats[outcome] += 1
+            average = stats["average_chunks"]
+            if outcome == "completed":
+                stats["average_chunks"] = (
+                    stream.chunks
+                    if average is None
+                    else average + 0.1 * (stream.chunks - average)
+                )
+            elif outcome == "cancelled":
+                stats["chunks_before_cancel"] += stream.chunks
+                if average is not None:
+                    stats["estimated_chunks_saved"] += max(
+                        0, round(average - stream.chunks)
+                    )
+        if outcome == "cancelled":
+            log.info(
+                f"Aborted the stream from {stream.label} after {stream.chunks} chunks"
+            )
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                label: {
+                    **stats,
+                    "average_chunks": (
+                        round(stats["average_chunks"], 1)
+                        if stats["average_chunks"] is not None
+                        else None
+                    ),
+                }
+                for label, stats in self.stats.items()
+            }
+
+
+upstream_streams = UpstreamStreams()
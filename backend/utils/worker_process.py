@@ -0,0 +1,114 @@
+"""
+Entry point of the tool and function worker processes, see utils.workers.
+
+Kept free of app imports, so starting a worker doesn't import the config, the
+database or the vector store.
+"""
+
+import asyncio
+import inspect
+import os
+from importlib import util
+from typing import Iterator
+
+EVENTS = ["__event_emitter__", "__event_call__"]
+
+
+def load_module(kind: str, id: str, functions_dir: str, tools_dir: str):
+    """Same as load_function_module_by_id and load_toolkit_module_by_id, without the bookkeeping."""
+    path = os.path.join(tools_dir if kind == "tool" else functions_dir, f"{id}.py")
+    spec = util.spec_from_file_location(id, path)
+    module = util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    names = ["Tools"] if kind == "tool" else ["Pipe", "Filter", "Action"]
+    for name in names:
+        if hasattr(module, name):
+            return getattr(module, name)()
+    raise Exception(f"No {' or '.join(names)} class found in {id}")
+
+
+def encode(value):
+    # Pydantic models may come from the loaded module, which the server can't unpickle
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return value
+
+
+def run_worker(conn, functions_dir: str, tools_dir: str, memory_limit: int):
+    """
+    Serve calls from `conn` one at a time until it closes.
+
+    A call is ("call", kind, id, version, method, params, valves, user_valves,
+    events). The worker answers ("result", value) or ("error", detail), or
+    ("stream", None), then ("item", value) per item and ("done", None), for
+    generators. The event callables a method asks for are replaced by stubs
+    that send ("event", (name, data)) and, for __event_call__, wait for a
+    ("reply", value).
+    """
+    if memory_limit:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    modules = {}
+
+    def make_event(name):
+        async def event(data):
+            conn.send(("event", (name, data)))
+            if name == "__event_call__":
+                _, value = conn.recv()
+                return value
+
+        return event
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+
+        _, kind, id, version, method, params, valves, user_valves, events = message
+        try:
+            if modules.get((kind, id), (None, None))[0] != version:
+                modules[(kind, id)] = (
+                    version,
+                    load_module(kind, id, functions_dir, tools_dir),
+                )
+            module = modules[(kind, id)][1]
+
+            if hasattr(module, "valves") and hasattr(module, "Valves"):
+                module.valves = module.Valves(**(valves if valves else {}))
+            if user_valves is not None and hasattr(module, "UserValves"):
+                params["__user__"]["valves"] = module.UserValves(**user_valves)
+            for name in events:
+                params[name] = make_event(name)
+
+            result = getattr(module, method)(**params)
+            if inspect.isawaitable(result):
+                result = loop.run_until_complete(result)
+
+            if inspect.isasyncgen(result):
+                conn.send(("stream", None))
+                while True:
+                    try:
+                        item = loop.run_until_complete(result.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    conn.send(("item", encode(item)))
+                conn.send(("done", None))
+            elif isinstance(result, Iterator):
+                conn.send(("stream", None))
+                for item in result:
+                    conn.send(("item", encode(item)))
+                conn.send(("done", None))
+            else:
+                conn.send(("result", encode(result)))
+        except Exception as e:
+            detail = str(e) or type(e).__name__
+            try:
+                conn.send(("error", detail))
+            except Exception:
+                return
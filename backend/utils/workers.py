@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import multiprocessing
+from collections.abc import AsyncGenerator
+from typing import Callable, Dict, List, Optional
+
+from config import (
+    SRC_LOG_LEVELS,
+    FUNCTIONS_DIR,
+    TOOLS_DIR,
+    FUNCTIONS_EXECUTION_MODE,
+    FUNCTIONS_WORKERS,
+    FUNCTIONS_WORKER_TIMEOUT,
+    FUNCTIONS_WORKER_MEMORY_LIMIT,
+)
+from utils.worker_process import EVENTS, run_worker
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class WorkerError(Exception):
+    """A call failed in the worker, timed out or took the worker down."""
+
+
+class WorkerProcess:
+    def __init__(self, context, memory_limit: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=run_worker,
+            args=(child_conn, FUNCTIONS_DIR, TOOLS_DIR, memory_limit),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def send(self, message):
+        self.conn.send(message)
+
+    async def recv(self, timeout: float):
+        """Wait for the next message, EOFError if the worker is gone."""
+        if not self.conn.poll():
+            loop = asyncio.get_running_loop()
+            readable = loop.create_future()
+            fd = self.conn.fileno()
+            loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+            try:
+                await asyncio.wait_for(readable, timeout)
+            finally:
+                loop.remove_reader(fd)
+        return self.conn.recv()
+
+    def kill(self):
+        self.process.kill()
+        self.conn.close()
+        # Reaped in the background, the process is already dead or dying
+        self.process.join(0)
+
+
+class WorkerPool:
+    """
+    Warm pool of processes that run tool and function methods, so a blocking or
+    CPU-heavy toolkit doesn't stall the event loop and a crashing one doesn't
+    take the server down.
+
+    Each worker loads modules from the tools and functions directories and runs
+    one call at a time. A call waits for a free worker, is given `timeout`
+    seconds (per item for generators) and is killed with its worker when it
+    takes longer or the caller goes away. Workers that die are replaced.
+
+    Parameters cross the process boundary by pickling. Valves and user valves
+    are sent as dicts and rebuilt in the worker, __event_emitter__ and
+    __event_call__ are relayed back to the caller's callables.
+    """
+
+    def __init__(
+        self,
+        size: int = FUNCTIONS_WORKERS,
+        timeout: float = FUNCTIONS_WORKER_TIMEOUT,
+        memory_limit: int = FUNCTIONS_WORKER_MEMORY_LIMIT,
+    ):
+        self.size = max(size, 1)
+        self.timeout = timeout
+        # MB of address space per worker, 0 for no limit
+        self.memory_limit = memory_limit
+        # Workers don't inherit the server's event loop, threads or sockets
+        self.context = multiprocessing.get_context("spawn")
+        self.workers: List[WorkerProcess] = []
+        self.idle: Optional[asyncio.Queue] = None
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def start(self):
+        self.idle = asyncio.Queue()
+        for _ in range(self.size):
+            self.add_worker()
+
+    def add_worker(self):
+        worker = WorkerProcess(self.context, self.memory_limit * 1024 * 1024)
+        self.workers.append(worker)
+        self.idle.put_nowait(worker)
+
+    def release(self, worker: WorkerProcess):
+        self.idle.put_nowait(worker)
+
+    def discard(self, worker: WorkerProcess):
+        """Kill a worker that is stuck or in an unknown state, and start a new one."""
+        worker.kill()
+        self.workers.remove(worker)
+        self.restarts += 1
+        self.add_worker()
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.kill()
+        self.workers = []
+        self.idle = None
+
+    async def receive(self, worker: WorkerProcess, events: Dict[str, Callable]):
+        """Wait for the next reply of a call, relaying the events it emits."""
+        while True:
+            try:
+                kind, value = await worker.recv(self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self.discard(worker)
+                raise WorkerError(f"timed out after {self.timeout}s")
+            except (EOFError, OSError):
+                self.errors += 1
+                log.warning("Function worker died, restarting it")
+                self.discard(worker)
+                raise WorkerError("the worker process died")
+            except BaseException:
+                # The caller went away mid-call
+                self.discard(worker)
+                raise
+
+            if kind != "event":
+                return kind, value
+
+            name, data = value
+            result = None
+            if events.get(name) is not None:
+                try:
+                    result = await events[name](data)
+                except Exception as e:
+                    # e.g. the client closed the tab, the call carries on without it
+                    log.warning(f"Relaying {name} from a function worker failed: {e}")
+                except BaseException:
+                    # The caller went away mid-call
+                    self.discard(worker)
+                    raise
+            if name == "__event_call__":
+                try:
+                    worker.send(("reply", result))
+                except BaseException:
+                    self.discard(worker)
+                    raise
+
+    async def call(self, entry, method: str, params: dict, stream: bool = False):
+        """
+        Call `method` of a registry entry's module in a worker, with its valves.
+
+        Workers reload the module when the entry was invalidated. Generators
+        come back as a WorkerStream of their items with `stream`, and as a
+        list otherwise.
+
+        Raises:
+            WorkerError: the call raised, timed out or the worker died
+        """
+        if self.idle is None:
+            self.start()
+
+        params = dict(params)
+        events = {name: params.pop(name) for name in EVENTS if name in params}
+        user_valves = None
+        if "__user__" in params and "valves" in params["__user__"]:
+            params["__user__"] = dict(params["__user__"])
+            user_valves = params["__user__"].pop("valves").model_dump()
+
+        try:
+            worker = await asyncio.wait_for(self.idle.get(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise WorkerError(f"no function worker was free for {self.timeout}s")
+        self.calls += 1
+        try:
+            worker.send(
+                (
+                    "call",
+                    entry.kind,
+                    entry.id,
+                    entry.version,
+                    method,
+                    params,
+                    entry.valves,
+                    user_valves,
+                    list(events),
+                )
+            )
+        except BaseException:
+            self.release(worker)
+            raise
+
+        result, value = await self.receive(worker, events)
+        if result == "stream":
+            items = WorkerStream(self, worker, events)
+            return items if stream else [item async for item in items]
+
+        self.release(worker)
+        if result == "error":
+            self.errors += 1
+            raise WorkerError(value)
+        return value
+
+    def get_stats(self) -> dict:
+        return {
+            "workers": len(self.workers),
+            "idle": self.idle.qsize() if self.idle is not None else 0,
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+        }
+
+
+class WorkerStream(AsyncGenerator):
+    """
+    Items of a generator running in a worker. The worker is given back to the
+    pool once the items are exhausted, and killed when the stream is closed or
+    dropped before that, even if it was never iterated.
+    """
+
+    def __init__(
+        self, pool: WorkerPool, worker: WorkerProcess, events: Dict[str, Callable]
+    ):
+        self.pool = pool
+        self.worker: Optional[WorkerProcess] = worker
+        self.events = events
+
+    async def asend(self, value):
+        if self.worker is None:
+            raise StopAsyncIteration
+        try:
+            kind, value = await self.pool.receive(self.worker, self.events)
+        except BaseException:
+            # receive discarded the worker
+            self.worker = None
+            raise
+
+        if kind == "item":
+            return value
+        self.pool.release(self.worker)
+        self.worker = None
+        if kind == "error":
+            raise WorkerError(value)
+        raise StopAsyncIteration
+
+    async def athrow(self, typ, val=None, tb=None):
+        self.close()
+        return await super().athrow(typ, val, tb)
+
+    async def aclose(self):
+        self.close()
+
+    def close(self):
+        if self.worker is not None:
+            worker, self.worker = self.worker, None
+            # Closed early, the worker is still producing items
+            if worker in self.pool.workers:
+                self.pool.discard(worker)
+
+    def __del__(self):
+        self.close()
+
+
+function_workers = WorkerPool()
+
+
+def run_in_workers() -> bool:
+    return FUNCTIONS_EXECUTION_MODE == "process"